@@ -0,0 +1,80 @@
+# Recording of benchmark timings as machine-readable (JSON) results
+
+from dataclasses import dataclass, field
+import datetime
+import json
+from pathlib import Path
+import platform
+import statistics
+import time
+
+import util
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    params: dict
+    seconds: list[float] = field(default_factory=list)
+    counters: dict[str, int] = field(default_factory=dict) # e.g. connections opened, over all runs
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'params': self.params,
+            'counters': self.counters,
+            'seconds': self.seconds,
+            'min': min(self.seconds),
+            'median': statistics.median(self.seconds),
+            'mean': statistics.mean(self.seconds),
+            'max': max(self.seconds),
+        }
+
+
+class BenchmarkRecorder:
+    """
+    Times operations over repeated runs and writes all results of a suite into one JSON file,
+    tagged with the version of the tool under test, so results of different versions can be
+    compared.
+    """
+
+    def __init__(self, suite: str, tool_version: str):
+        self.suite = suite
+        self.tool_version = tool_version
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self.results: list[BenchmarkResult] = []
+
+    def measure(self, name: str, func, repeat: int = 3, setup=None, **params) -> BenchmarkResult:
+        """
+        call func repeat times and record the duration of each call. If setup is given it is
+        called before every run (not timed) and its return value is passed to func.
+        """
+        result = BenchmarkResult(name=name, params=params)
+        for _ in range(repeat):
+            args = (setup(),) if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            result.seconds.append(time.perf_counter() - start)
+        print(f'{name} {params}: ' + ', '.join(f'{s:.3f}s' for s in result.seconds))
+        self.results.append(result)
+        return result
+
+    def as_dict(self) -> dict:
+        return {
+            'suite': self.suite,
+            'tool_version': self.tool_version,
+            'timestamp': self.started.isoformat(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'results': [r.as_dict() for r in self.results],
+        }
+
+    def write(self, out_dir: str | Path = None) -> Path:
+        out_dir = Path(out_dir) if out_dir else util.get_root_dir() / 'docs' / 'benchmarks'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = self.started.strftime('%Y%m%dT%H%M%SZ')
+        out_file = out_dir / f'{self.suite}-{timestamp}.json'
+        with open(out_file, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        print(f'Benchmark results written to {out_file}')
+        return out_file
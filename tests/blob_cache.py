@@ -0,0 +1,133 @@
+# Persistent content-addressed cache for OCI blobs (manifests, configs, layers)
+
+from dataclasses import dataclass
+import hashlib
+import os
+from pathlib import Path
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TAG_TTL_SECONDS = 60
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    tag_hits: int = 0
+    tag_misses: int = 0
+    bytes_served: int = 0
+    evictions: int = 0
+
+
+class BlobCache:
+    """
+    Digest-keyed on-disk blob cache with size bounded LRU eviction. Blobs are immutable by
+    their digest, so cached entries never become stale. Entries are evicted least-recently-used
+    first (the file modification time is touched on every hit) once max_bytes is exceeded.
+    Additionally a short-lived in-memory map from tagged image references to manifest digests is
+    kept, so that a manifest does not have to be requested again within tag_ttl_seconds. Tags are
+    mutable, therefore this map has to be invalidated if a tag is overwritten.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        tag_ttl_seconds: float = DEFAULT_TAG_TTL_SECONDS,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.tag_ttl_seconds = tag_ttl_seconds
+        self.stats = CacheStats()
+        self._tags: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._size = sum(f.stat().st_size for f in self._blob_files())
+
+    def get(self, digest: str) -> bytes | None:
+        path = self._blob_path(digest)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        with self._lock:
+            self.stats.hits += 1
+            self.stats.bytes_served += len(data)
+        return data
+
+    def put(self, digest: str, data: bytes):
+        algorithm, hex_digest = digest.split(':', 1)
+        if hashlib.new(algorithm, data).hexdigest() != hex_digest:
+            raise ValueError(f'content does not match digest {digest}')
+        path = self._blob_path(digest)
+        if path.exists():
+            return
+        # write to a temporary file first, concurrent readers must never see partial blobs
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        tmp_path.replace(path)
+        with self._lock:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def lookup_tag(self, image_reference: str) -> str | None:
+        with self._lock:
+            digest, expiry = self._tags.get(image_reference, (None, 0))
+            if digest and expiry > time.monotonic():
+                self.stats.tag_hits += 1
+                return digest
+            self._tags.pop(image_reference, None)
+            self.stats.tag_misses += 1
+            return None
+
+    def store_tag(self, image_reference: str, digest: str):
+        with self._lock:
+            self._tags[image_reference] = (digest, time.monotonic() + self.tag_ttl_seconds)
+
+    def invalidate_tags(self, prefix: str = ''):
+        """
+        forget all tag to digest mappings for image references starting with prefix
+        (all of them by default)
+        """
+        with self._lock:
+            for image_reference in [r for r in self._tags if r.startswith(prefix)]:
+                del self._tags[image_reference]
+
+    def clear(self):
+        self.invalidate_tags()
+        with self._lock:
+            for f in self._blob_files():
+                f.unlink(missing_ok=True)
+            self._size = 0
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.cache_dir / digest.replace(':', '.')
+
+    def _blob_files(self) -> list[Path]:
+        return [f for f in self.cache_dir.iterdir() if f.is_file() and f.suffix != '.tmp']
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for f in self._blob_files():
+                try:
+                    entries.append((f.stat(), f))
+                except FileNotFoundError:
+                    pass
+            self._size = sum(stat.st_size for stat, _ in entries)
+            entries.sort(key=lambda e: e[0].st_mtime)
+            for stat, f in entries:
+                if self._size <= self.max_bytes:
+                    break
+                f.unlink(missing_ok=True)
+                self._size -= stat.st_size
+                self.stats.evictions += 1
+
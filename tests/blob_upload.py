@@ -0,0 +1,286 @@
+# Strategies to upload blobs to an OCI registry
+
+import io
+from pathlib import Path
+import threading
+import time
+import urllib.parse
+
+import oci.client as oc
+import oci.model as om
+
+import oci_requests
+
+MiB = 1024 * 1024
+# measured with test_bench_upload.py against LocalRegistry shaped to 50 ms latency and 100 MiB/s
+# (medians of 2 runs): a single request was fastest for every size, each further request costs
+# a round trip. Fixed 8 MiB chunks were 33-40% slower than one request (64 MiB: 1.78s vs 1.34s,
+# 256 MiB: 7.0s vs 4.96s), fixed 32 MiB chunks 11-16% (128 MiB: 2.83s vs 2.49s). So chunks start
+# at 32 MiB and grow up to 128 MiB, adaptive chunking then was within 13% of a single request
+# (256 MiB: 5.35s vs 4.72s). Blobs up to the largest chunk are sent with one request: its body is
+# not larger than a chunk's, and it was the fastest strategy up to 128 MiB (2.49s vs 2.96s).
+DEFAULT_MONOLITHIC_LIMIT = 128 * MiB
+DEFAULT_MIN_CHUNK = 32 * MiB
+DEFAULT_MAX_CHUNK = 128 * MiB
+# adaptive chunking aims for PATCH requests of this duration
+DEFAULT_TARGET_CHUNK_SECONDS = 2.0
+
+
+def _open(data: Path | bytes):
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return open(data, 'rb')
+
+
+def _absolute_url(location: str, response_url: str) -> str:
+    # returned locations _may_ be relative
+    if location.startswith('/'):
+        parsed_url = urllib.parse.urlparse(response_url)
+        return f'{parsed_url.scheme}://{parsed_url.netloc}{location}'
+    return location
+
+
+class MonolithicUpload:
+    """
+    Uploads the whole blob with one PUT request (after the POST opening the upload session).
+    Unlike oc.Client.put_blob presence is not checked first, that is up to BlobPresence.
+    """
+
+    def upload(
+        self,
+        client: oc.Client,
+        image_reference: str,
+        data: Path | bytes,
+        digest: str,
+        size: int,
+        mimetype: str,
+    ):
+        with _open(data) as f:
+            oci_requests.put_monolithic(client, image_reference, digest, size, f, mimetype)
+
+
+class ChunkedUpload:
+    """
+    Uploads the blob with a sequence of PATCH requests. The chunk size starts with min_chunk
+    and is adapted after each chunk, so that one request takes about target_seconds, but
+    never exceeds max_chunk.
+    """
+
+    def __init__(
+        self,
+        min_chunk: int = DEFAULT_MIN_CHUNK,
+        max_chunk: int = DEFAULT_MAX_CHUNK,
+        target_seconds: float = DEFAULT_TARGET_CHUNK_SECONDS,
+    ):
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.target_seconds = target_seconds
+
+    def upload(
+        self,
+        client: oc.Client,
+        image_reference: str,
+        data: Path | bytes,
+        digest: str,
+        size: int,
+        mimetype: str,
+    ):
+        image_reference = om.OciImageReference(image_reference)
+        res = oci_requests.push_request(
+            client,
+            image_reference,
+            url=client.routes.uploads_url(image_reference=image_reference),
+            method='POST',
+            headers={'content-length': '0'},
+        )
+        upload_url = _absolute_url(res.headers['Location'], res.url)
+
+        chunk_size = self.min_chunk
+        offset = 0
+        with _open(data) as f:
+            while (chunk := f.read(chunk_size)):
+                start = time.monotonic()
+                res = oci_requests.push_request(
+                    client,
+                    image_reference,
+                    url=upload_url,
+                    method='PATCH',
+                    headers={
+                        'content-type': 'application/octet-stream',
+                        'content-length': str(len(chunk)),
+                        'content-range': f'{offset}-{offset + len(chunk) - 1}',
+                    },
+                    data=chunk,
+                )
+                offset += len(chunk)
+                upload_url = _absolute_url(res.headers['Location'], res.url)
+                chunk_size = self._next_chunk_size(len(chunk), time.monotonic() - start)
+
+        if offset != size:
+            raise ValueError(f'expected {size} octets for {digest}, but uploaded {offset}')
+
+        separator = '&' if '?' in upload_url else '?'
+        oci_requests.push_request(
+            client,
+            image_reference,
+            url=upload_url + separator + urllib.parse.urlencode({'digest': digest}),
+            method='PUT',
+            headers={
+                'content-type': mimetype,
+                'content-length': '0',
+            },
+        )
+
+    def _next_chunk_size(self, chunk_size: int, seconds: float) -> int:
+        if seconds <= 0:
+            return self.max_chunk
+        next_size = int(chunk_size * self.target_seconds / seconds)
+        # do not grow or shrink too fast, a single slow request should not dominate
+        next_size = max(chunk_size // 2, min(chunk_size * 2, next_size))
+        return max(self.min_chunk, min(self.max_chunk, next_size))
+
+
+class MountUpload:
+    """
+    Tries to mount the blob from other repositories of the same registry (no data transfer),
+    falls back to another strategy if none of them contains the blob
+    """
+
+    def __init__(self, from_references: list[str], fallback):
+        self.from_references = from_references
+        self.fallback = fallback
+
+    def upload(
+        self,
+        client: oc.Client,
+        image_reference: str,
+        data: Path | bytes,
+        digest: str,
+        size: int,
+        mimetype: str,
+    ):
+        target = om.OciImageReference(image_reference)
+        for from_reference in self.from_references:
+            source = om.OciImageReference(from_reference)
+            if source.netloc != target.netloc or source.name == target.name:
+                continue
+            if client.mount_blob(
+                image_reference=image_reference,
+                digest=digest,
+                from_reference=from_reference,
+            ):
+                print(f'Mounted blob {digest} from {from_reference}')
+                return
+        self.fallback.upload(client, image_reference, data, digest, size, mimetype)
+
+
+class SizeBasedUpload:
+    """
+    Default strategy: blobs up to monolithic_limit octets are uploaded monolithically, larger
+    ones in chunks. To try mounts from other repositories first, wrap it in a MountUpload.
+    """
+
+    def __init__(self, monolithic_limit: int = DEFAULT_MONOLITHIC_LIMIT):
+        self.monolithic_limit = monolithic_limit
+        self.monolithic = MonolithicUpload()
+        self.chunked = ChunkedUpload()
+
+    def select(self, size: int):
+        return self.monolithic if size <= self.monolithic_limit else self.chunked
+
+    def upload(
+        self,
+        client: oc.Client,
+        image_reference: str,
+        data: Path | bytes,
+        digest: str,
+        size: int,
+        mimetype: str,
+    ):
+        self.select(size).upload(client, image_reference, data, digest, size, mimetype)
+
+
+class BlobPresence:
+    """
+    Memo of blobs known to exist in a repository. Before a blob is uploaded, its presence is
+    checked with a HEAD request (unless already known), and the upload is skipped if the registry
+    has it, so a missing blob costs one HEAD. Concurrent uploads of the same blob (e.g. a layer
+    shared by the platforms of a multi-arch image) are de-duplicated by digest: one thread
+    uploads, the others wait for it. Uploaded and skipped octets are counted.
+    The memo is not invalidated when blobs are deleted, use one per upload (OciImageCreator does).
+    """
+
+    def __init__(self):
+        self._present: set[tuple[str, str]] = set()
+        self._uploading: dict[tuple[str, str], threading.Event] = {}
+        self._lock = threading.Lock()
+        self.blobs_uploaded = 0
+        self.blobs_skipped = 0
+        self.bytes_uploaded = 0
+        self.bytes_skipped = 0
+
+    @staticmethod
+    def _key(image_reference: str, digest: str) -> tuple[str, str]:
+        image_reference = om.OciImageReference(image_reference)
+        return f'{image_reference.netloc}/{image_reference.name}', digest
+
+    def is_present(self, client: oc.Client, image_reference: str, digest: str) -> bool:
+        key = self._key(image_reference, digest)
+        with self._lock:
+            if key in self._present:
+                return True
+        res = client.head_blob(image_reference=image_reference, digest=digest, absent_ok=True)
+        if res.ok:
+            with self._lock:
+                self._present.add(key)
+        return res.ok
+
+    def _claim(self, key: tuple[str, str]) -> bool:
+        # True if the caller has to upload the blob, False if it is present (meanwhile)
+        while True:
+            with self._lock:
+                if key in self._present:
+                    return False
+                if not (uploading := self._uploading.get(key)):
+                    self._uploading[key] = threading.Event()
+                    return True
+            uploading.wait()
+
+    def upload(
+        self,
+        strategy,
+        client: oc.Client,
+        image_reference: str,
+        data: Path | bytes,
+        digest: str,
+        size: int,
+        mimetype: str,
+    ):
+        key = self._key(image_reference, digest)
+        if not self._claim(key):
+            self._skipped(digest, size)
+            return
+        try:
+            if self.is_present(client, image_reference, digest):
+                self._skipped(digest, size)
+                return
+            strategy.upload(client, image_reference, data, digest, size, mimetype)
+            with self._lock:
+                self._present.add(key)
+                self.blobs_uploaded += 1
+                self.bytes_uploaded += size
+        finally:
+            # waiting threads upload themselves if this upload failed
+            with self._lock:
+                self._uploading.pop(key).set()
+
+    def _skipped(self, digest: str, size: int):
+        print(f'Skipping upload of {digest}, already present in registry')
+        with self._lock:
+            self.blobs_skipped += 1
+            self.bytes_skipped += size
+
+    def report(self) -> str:
+        return (f'blobs uploaded: {self.blobs_uploaded} ({self.bytes_uploaded} bytes), '
+                f'skipped: {self.blobs_skipped} ({self.bytes_skipped} bytes)')
+
@@ -1,16 +1,35 @@
 # Module with helper classes for component-descriptors
 
+import collections
+import collections.abc
+import concurrent.futures
 from dataclasses import dataclass
+import hashlib
 import io
 import json
 import tarfile
+import threading
+import time
+from typing import NamedTuple
 
 import dacite
+import yaml
 
+from blob_cache import BlobCache
 import gci.componentmodel as cm
 import gci.oci
-import oci.auth as oa
 import oci.client as oc
+import oci.model as om
+import client_pool
+
+
+# number of concurrent registry round trips when resolving component reference graphs
+DEFAULT_MAX_WORKERS = 8
+# existence checks are only reused briefly, transfers running meanwhile may add artifacts
+DEFAULT_EXISTS_TTL_SECONDS = 30
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 
 
 @dataclass(frozen=True)
@@ -23,20 +42,231 @@ class ComponentVersion:
         return ComponentVersion(name=cd.component.name, version=cd.component.version)
 
 
+def extra_identities(elements: collections.abc.Iterable[tuple[str, dict | None, str]]) -> list[dict]:
+    """
+    effective extra identities of (name, extraIdentity, version) of the resources (or sources,
+    references) of one component, as normalised by the ocm CLI for signing: the version is added
+    to the extra identity of elements sharing name and extra identity with a later element,
+    unless it is already part of it. The last of them keeps its extra identity, the results are
+    unique as long as the versions are. Linear, also for thousands of elements.
+    """
+    elements = [(name, dict(extra_identity or {}), version) for name, extra_identity, version in elements]
+    later = set()
+    for name, extra_identity, version in reversed(elements):
+        key = name, tuple(sorted(extra_identity.items()))
+        if key in later and 'version' not in extra_identity:
+            extra_identity['version'] = version
+        later.add(key)
+    return [extra_identity for _, extra_identity, _ in elements]
+
+
+class DescriptorMemo:
+    """
+    In-process memo of parsed component-descriptors, keyed by the digest of the descriptor layer.
+    Identical descriptors are extracted and parsed only once, the returned objects are shared
+    between all callers and must be treated as read-only.
+    Additionally the layer digest is remembered per component-descriptor reference, so repeated
+    lookups of the same name and version need no registry round trip. As versions can be
+    overwritten (push with force) these entries have to be invalidated after writing to a repository.
+    """
+
+    def __init__(self):
+        self._descriptors: dict[str, cm.ComponentDescriptor] = {}
+        self._layer_digests: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def descriptor(self, layer_digest: str) -> cm.ComponentDescriptor | None:
+        with self._lock:
+            return self._descriptors.get(layer_digest)
+
+    def store_descriptor(self, layer_digest: str, cd: cm.ComponentDescriptor):
+        with self._lock:
+            self._descriptors.setdefault(layer_digest, cd)
+
+    def layer_digest(self, cd_url: str) -> str | None:
+        with self._lock:
+            return self._layer_digests.get(cd_url)
+
+    def store_layer_digest(self, cd_url: str, layer_digest: str):
+        with self._lock:
+            self._layer_digests[cd_url] = layer_digest
+
+    def invalidate(self, prefix: str = ''):
+        """
+        forget the layer digests of all component-descriptor references starting with prefix
+        (all by default), parsed descriptors stay valid as they are keyed by content
+        """
+        with self._lock:
+            for cd_url in [u for u in self._layer_digests if u.startswith(prefix)]:
+                del self._layer_digests[cd_url]
+
+
+class ManifestPresence(NamedTuple):
+    exists: bool
+    digest: str | None = None # as reported by the registry, may be absent
+    media_type: str | None = None
+
+
+class ExistsCache:
+    """
+    Short-lived cache of manifest existence checks per image reference. Entries expire after
+    ttl_seconds and have to be invalidated after writing to a repository, as an artifact that
+    did not exist before may have been pushed.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_EXISTS_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, ManifestPresence]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, image_reference: str) -> ManifestPresence | None:
+        with self._lock:
+            expires, presence = self._entries.get(image_reference, (0, None))
+            if expires < time.monotonic():
+                return None
+            return presence
+
+    def put(self, image_reference: str, presence: ManifestPresence):
+        with self._lock:
+            self._entries[image_reference] = (time.monotonic() + self.ttl_seconds, presence)
+
+    def invalidate(self, prefix: str = ''):
+        with self._lock:
+            for image_reference in [r for r in self._entries if r.startswith(prefix)]:
+                del self._entries[image_reference]
+
+
+def image_references(components: collections.abc.Iterable[cm.ComponentDescriptor]) -> list[str]:
+    # image references of all resources with oci access, e.g. to check them before a transfer
+    return list(dict.fromkeys(
+        resource.access.imageReference
+        for cd in components
+        for resource in cd.component.resources
+        if isinstance(resource.access, cm.OciAccess)
+    ))
+
+
+def component_descriptor_dict(
+    name: str,
+    version: str = '1.0.0',
+    resources: collections.abc.Iterable[dict] = (),
+    refs: collections.abc.Iterable[ComponentVersion] = (),
+    **component,
+) -> dict:
+    """
+    minimal v2 component-descriptor as dict, e.g. for tests writing descriptors into a registry or
+    CTF directly. References are named after the last segment of the component name, further
+    fields of the component (labels, sources, ...) are passed as keyword arguments.
+    """
+    return {
+        'meta': {'schemaVersion': 'v2'},
+        'component': {
+            'name': name,
+            'version': version,
+            'provider': 'ocm.integrationtest',
+            'repositoryContexts': [],
+            'sources': [],
+            'resources': list(resources),
+            'componentReferences': [
+                {'name': ref.name.split('/')[-1], 'componentName': ref.name, 'version': ref.version}
+                for ref in refs
+            ],
+            **component,
+        },
+    }
+
+
+class DescriptorArtifact(NamedTuple):
+    layer: bytes # tar containing component-descriptor.yaml
+    config: bytes
+    manifest: bytes
+
+
+def descriptor_artifact(cd: dict, layer_media_type: str = gci.oci.component_descriptor_mimetype) -> DescriptorArtifact:
+    """
+    oci artifact of a component-descriptor in the layout written by ocm: a manifest with a config
+    pointing to the tar layer with the descriptor
+    """
+    cd_bytes = yaml.dump(cd, Dumper=_Dumper).encode()
+    layer = io.BytesIO()
+    with tarfile.open(fileobj=layer, mode='w') as tf:
+        info = tarfile.TarInfo(gci.oci.component_descriptor_fname)
+        info.size = len(cd_bytes)
+        tf.addfile(info, io.BytesIO(cd_bytes))
+    layer = layer.getvalue()
+    layer_ref = {'mediaType': layer_media_type, 'digest': 'sha256:' + hashlib.sha256(layer).hexdigest(), 'size': len(layer)}
+    config = json.dumps({'componentDescriptorLayer': layer_ref}).encode()
+    manifest = json.dumps({
+        'schemaVersion': 2,
+        'mediaType': om.OCI_MANIFEST_SCHEMA_V2_MIME,
+        'config': {
+            'mediaType': gci.oci.component_descriptor_cfg_mimetype,
+            'digest': 'sha256:' + hashlib.sha256(config).hexdigest(),
+            'size': len(config),
+        },
+        'layers': [layer_ref],
+    }).encode()
+    return DescriptorArtifact(layer=layer, config=config, manifest=manifest)
+
+
+def component_descriptor_url(repo_url: str, component_name: str, component_version: str) -> str:
+    component_name = component_name.lower() # oci-spec allows only lowercase
+    return f'{repo_url}/component-descriptors/{component_name}:{component_version}'
+
+
+def descriptor_layer_digest(cfg_bytes: bytes) -> str:
+    cfg = dacite.from_dict(
+        data_class=gci.oci.ComponentDescriptorOciCfg,
+        data=json.loads(cfg_bytes),
+    )
+    layer_mimetype = cfg.componentDescriptorLayer.mediaType
+    if not layer_mimetype in gci.oci.component_descriptor_mimetypes:
+        print(f'Warning: Unexpected {layer_mimetype} MIME-type, expected one of '
+            f'{gci.oci.component_descriptor_mimetypes}')
+    return cfg.componentDescriptorLayer.digest
+
+
+def descriptor_from_layer(layer: bytes, as_yaml: bool = False) -> cm.ComponentDescriptor | str:
+    with tarfile.open(fileobj=io.BytesIO(layer), mode='r') as tf:
+        component_descriptor_info = tf.getmember(gci.oci.component_descriptor_fname)
+        cd_yaml = tf.extractfile(component_descriptor_info).read().decode()
+    if as_yaml:
+        return cd_yaml
+    # like gci.oci.component_descriptor_from_tarfileobj, but parsed with libyaml if available
+    raw_dict = yaml.load(cd_yaml, Loader=_Loader)
+    if raw_dict is None:
+        raise ValueError('Component Descriptor appears to be empty')
+    return cm.ComponentDescriptor.from_dict(raw_dict)
+
+
 class OciFetcher:
 
-    def __init__(self, repo_url: str, user_name: str = None, password: str = None):
+    def __init__(
+        self,
+        repo_url: str,
+        user_name: str = None,
+        password: str = None,
+        cache: BlobCache = None,
+        memo: DescriptorMemo = None,
+        client: oc.Client = None,
+        exists_cache: ExistsCache = None,
+    ):
         self.repo_url = repo_url
         self.user_name = user_name
         self.password = password
+        self.cache = cache
+        self.memo = memo
+        self.exists_cache = exists_cache
 
         self.ctx_repo = cm.OciRepositoryContext(baseUrl=repo_url)
 
-        routes = oc.OciRoutes(self._base_api_lookup)
-        self.client = oc.Client(
-            credentials_lookup=self._credentials_lookup,
-            routes=routes,
-        )
+        if client:
+            # e.g. for a local_registry.LocalRegistry
+            self.client = client
+        else:
+            # shared with all other fetchers using the same credentials: connections and tokens
+            # are reused
+            self.client = client_pool.clients.basic_auth_client(user_name, password)
 
 
     def get_component_descriptor_from_registry(
@@ -46,53 +276,28 @@ class OciFetcher:
         as_yaml: bool = False,
     ) -> cm.ComponentDescriptor | str:
 
-        component_name = self._normalise_component_name(component_name)
-        cd_url = '/'.join([
-            self.ctx_repo.baseUrl,
-            'component-descriptors',
-            f'{component_name}:{component_version}',
-        ])
+        cd_url = component_descriptor_url(self.ctx_repo.baseUrl, component_name, component_version)
+        use_memo = self.memo and not as_yaml
+        if use_memo and (layer_digest := self.memo.layer_digest(cd_url)):
+            if component_descriptor := self.memo.descriptor(layer_digest):
+                return component_descriptor
+
         print(f'Retrieving component-descriptor from {cd_url}')
 
-        manifest = self.client.manifest(
-            image_reference=cd_url,
-            absent_ok=False,
-        )
+        manifest = self._manifest(cd_url)
 
         # Note original code catches exception and has some fallback
-        cfg_dict = json.loads(
-            self.client.blob(
-                image_reference=cd_url,
-                digest=manifest.config.digest,
-            ).text
-        )
-        cfg = dacite.from_dict(
-            data_class=gci.oci.ComponentDescriptorOciCfg,
-            data=cfg_dict,
-        )
-        layer_digest = cfg.componentDescriptorLayer.digest
-        layer_mimetype = cfg.componentDescriptorLayer.mediaType
+        layer_digest = descriptor_layer_digest(self._blob(cd_url, manifest['config']['digest']))
 
-        if not layer_mimetype in gci.oci.component_descriptor_mimetypes:
-            print(f'Warning: Unexpected {layer_mimetype} MIME-type, expected one of '
-                f'{gci.oci.component_descriptor_mimetypes}')
+        if use_memo:
+            self.memo.store_layer_digest(cd_url, layer_digest)
+            if component_descriptor := self.memo.descriptor(layer_digest):
+                return component_descriptor
 
-        blob_res = self.client.blob(
-            image_reference=cd_url,
-            digest=layer_digest,
-            stream=False, # manifests are typically small - do not bother w/ streaming
-        )
-        # wrap in fobj
-        blob_fobj = io.BytesIO(blob_res.content)
-        if as_yaml:
-            with tarfile.open(fileobj=blob_fobj, mode='r') as tf:
-                component_descriptor_info = tf.getmember(gci.oci.component_descriptor_fname)
-                component_descriptor = tf.extractfile(component_descriptor_info).read()
-                component_descriptor = component_descriptor.decode()
-        else:
-            component_descriptor = gci.oci.component_descriptor_from_tarfileobj(
-                fileobj=blob_fobj,
-            )
+        component_descriptor = descriptor_from_layer(self._blob(cd_url, layer_digest), as_yaml)
+        if use_memo:
+            self.memo.store_descriptor(layer_digest, component_descriptor)
+            component_descriptor = self.memo.descriptor(layer_digest)
         return component_descriptor
 
 
@@ -100,22 +305,50 @@ class OciFetcher:
         self,
         component_name: str,
         component_version: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        absent_ok: bool = False,
     ) -> dict[ComponentVersion, cm.ComponentDescriptor]:
+        """
+        Retrieve the component-descriptor and all transitively referenced component-descriptors.
+        The reference graph is walked breadth-first: as soon as a descriptor arrives its
+        references are scheduled, so up to max_workers descriptors are fetched concurrently.
+        Each component version is requested only once, even if it is referenced several times.
+        max_workers=1 fetches one descriptor after the other. With absent_ok component versions
+        not found in the repository are left out instead of raising.
+        """
         components = {}
-        cd = self.get_component_descriptor_from_registry(
-            component_name,
-            component_version,
-        )
-        cv = ComponentVersion.from_component_descriptor(cd)
-        components[cv] = cd
-        for ref in cd.component.componentReferences:
-            ref_cv = ComponentVersion(name=ref.componentName, version=ref.version)
-            if not ref_cv in components:
-                recursive_references = self.get_component_descriptors_from_registry(
-                    component_name=ref_cv.name,
-                    component_version=ref_cv.version,
+        requested = {ComponentVersion(name=component_name, version=component_version)}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {
+                executor.submit(
+                    self.get_component_descriptor_from_registry,
+                    component_name,
+                    component_version,
+                )
+            }
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
                 )
-                components |= recursive_references # merge result dict
+                for future in done:
+                    try:
+                        cd = future.result()
+                    except om.OciImageNotFoundException:
+                        if not absent_ok:
+                            raise
+                        continue
+                    components[ComponentVersion.from_component_descriptor(cd)] = cd
+                    for ref in cd.component.componentReferences:
+                        ref_cv = ComponentVersion(name=ref.componentName, version=ref.version)
+                        if ref_cv in requested:
+                            continue
+                        requested.add(ref_cv)
+                        pending.add(executor.submit(
+                            self.get_component_descriptor_from_registry,
+                            ref_cv.name,
+                            ref_cv.version,
+                        ))
         return components
 
 
@@ -124,26 +357,74 @@ class OciFetcher:
         return blob_ref is not None
 
 
-    @staticmethod
-    def _base_api_lookup(image_reference):
-        return oc.base_api_url(image_reference)
+    def exists_many(
+        self,
+        image_references: collections.abc.Iterable[str],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> dict[str, ManifestPresence]:
+        """
+        Check the existence of many manifests with concurrent HEAD requests. References are
+        grouped by repository: one request per repository is sent first, it obtains the token for
+        the repository's scope, all other requests of the repository reuse it. Results are taken
+        from and stored in the exists cache, if the fetcher has one.
+        """
+        results = {}
+        by_repository = collections.defaultdict(list)
+        for image_reference in dict.fromkeys(image_references):
+            if self.exists_cache and (presence := self.exists_cache.get(image_reference)):
+                results[image_reference] = presence
+            else:
+                repository = om.OciImageReference(image_reference).ref_without_tag
+                by_repository[repository].append(image_reference)
 
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            firsts = [refs[0] for refs in by_repository.values()]
+            others = [ref for refs in by_repository.values() for ref in refs[1:]]
+            for refs in (firsts, others):
+                for image_reference, presence in zip(refs, executor.map(self._presence, refs)):
+                    results[image_reference] = presence
+                    if self.exists_cache:
+                        self.exists_cache.put(image_reference, presence)
+        return results
 
-    @staticmethod
-    def _normalise_component_name(component_name:str) -> str:
-        return component_name.lower()  # oci-spec allows only lowercase
 
+    def _presence(self, image_reference: str) -> ManifestPresence:
+        blob_ref = self.client.head_manifest(
+            image_reference,
+            absent_ok=True,
+            accept=om.MimeTypes.prefer_multiarch, # image indices exist as well
+        )
+        if blob_ref is None:
+            return ManifestPresence(exists=False)
+        return ManifestPresence(exists=True, digest=blob_ref.digest, media_type=blob_ref.mediaType)
+
+
+    def _manifest(self, image_reference: str) -> dict:
+        if self.cache and (digest := self.cache.lookup_tag(image_reference)):
+            if (manifest_bytes := self.cache.get(digest)) is not None:
+                return json.loads(manifest_bytes)
+
+        manifest_bytes = self.client.manifest_raw(
+            image_reference=image_reference,
+            absent_ok=False,
+        ).content
+        if self.cache:
+            digest = 'sha256:' + hashlib.sha256(manifest_bytes).hexdigest()
+            self.cache.put(digest, manifest_bytes)
+            self.cache.store_tag(image_reference, digest)
+        return json.loads(manifest_bytes)
+
+
+    def _blob(self, image_reference: str, digest: str) -> bytes:
+        if self.cache and (data := self.cache.get(digest)) is not None:
+            return data
+
+        data = self.client.blob(
+            image_reference=image_reference,
+            digest=digest,
+            stream=False, # descriptors and configs are typically small - do not bother w/ streaming
+        ).content
+        if self.cache:
+            self.cache.put(digest, data)
+        return data
 
-    def _credentials_lookup(
-        self,
-        image_reference: str,
-        privileges: oa.Privileges=oa.Privileges.READONLY,
-        absent_ok: bool=True,
-    ):
-        if self.password and self.user_name:
-            return oa.OciBasicAuthCredentials(
-                    username=self.user_name,
-                    password=self.password,
-                )
-        else:
-            return None
@@ -0,0 +1,177 @@
+# asyncio variant of cd_tools.OciFetcher for lookups with a high fan-out (registry scans)
+
+import asyncio
+import collections.abc
+import hashlib
+import json
+
+import aiohttp
+import gci.componentmodel as cm
+import oci.client as oc
+import oci.client_async as oca
+
+from blob_cache import BlobCache
+from cd_tools import (
+    ComponentVersion,
+    DescriptorMemo,
+    component_descriptor_url,
+    descriptor_from_layer,
+    descriptor_layer_digest,
+)
+import client_pool
+
+# registry round trips in flight at the same time, also the size of the connection pool
+DEFAULT_MAX_CONCURRENCY = 64
+
+
+class AsyncOciFetcher:
+    """
+    Same lookups as cd_tools.OciFetcher, but as coroutines: thousands of lookups can be awaited
+    concurrently in one thread. At most max_concurrency registry round trips are in flight, all
+    of them share the connections of one aiohttp session. Blob cache and descriptor memo are the
+    same as for the blocking fetcher.
+    Must be used as async context manager, the session is bound to the running event loop:
+
+        async with AsyncOciFetcher(repo_url) as fetcher:
+            cds = await asyncio.gather(*(fetcher.get_component_descriptor_from_registry(n, v) ...))
+
+    create_client can be used to create the client for the session, e.g.
+    local_registry.LocalRegistry.async_client.
+    """
+
+    def __init__(
+        self,
+        repo_url: str,
+        user_name: str = None,
+        password: str = None,
+        cache: BlobCache = None,
+        memo: DescriptorMemo = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        create_client: collections.abc.Callable[[aiohttp.ClientSession], oca.Client] = None,
+    ):
+        self.repo_url = repo_url
+        self.cache = cache
+        self.memo = memo
+        self.max_concurrency = max_concurrency
+        self._create_client = create_client or (
+            lambda session: oca.Client(
+                credentials_lookup=client_pool.basic_credentials_lookup(user_name, password),
+                routes=oc.OciRoutes(oc.base_api_url),
+                session=session,
+            )
+        )
+        self.session: aiohttp.ClientSession = None
+        self.client: oca.Client = None
+        self._semaphore: asyncio.Semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_concurrency,
+            limit_per_host=self.max_concurrency,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+        self.client = self._create_client(self.session)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+        self.client = None
+
+    async def get_component_descriptor_from_registry(
+        self,
+        component_name: str,
+        component_version: str,
+        as_yaml: bool = False,
+    ) -> cm.ComponentDescriptor | str:
+        cd_url = component_descriptor_url(self.repo_url, component_name, component_version)
+        use_memo = self.memo and not as_yaml
+        if use_memo and (layer_digest := self.memo.layer_digest(cd_url)):
+            if component_descriptor := self.memo.descriptor(layer_digest):
+                return component_descriptor
+
+        manifest = await self._manifest(cd_url)
+        layer_digest = descriptor_layer_digest(await self._blob(cd_url, manifest['config']['digest']))
+
+        if use_memo:
+            self.memo.store_layer_digest(cd_url, layer_digest)
+            if component_descriptor := self.memo.descriptor(layer_digest):
+                return component_descriptor
+
+        component_descriptor = descriptor_from_layer(await self._blob(cd_url, layer_digest), as_yaml)
+        if use_memo:
+            self.memo.store_descriptor(layer_digest, component_descriptor)
+            component_descriptor = self.memo.descriptor(layer_digest)
+        return component_descriptor
+
+    async def get_component_descriptors_from_registry(
+        self,
+        component_name: str,
+        component_version: str,
+    ) -> dict[ComponentVersion, cm.ComponentDescriptor]:
+        """
+        Retrieve the component-descriptor and all transitively referenced component-descriptors,
+        references are requested as soon as their parent arrived. Each component version is
+        requested only once.
+        """
+        components = {}
+        requested = {ComponentVersion(name=component_name, version=component_version)}
+        pending = {asyncio.ensure_future(
+            self.get_component_descriptor_from_registry(component_name, component_version)
+        )}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    cd = task.result()
+                    components[ComponentVersion.from_component_descriptor(cd)] = cd
+                    for ref in cd.component.componentReferences:
+                        ref_cv = ComponentVersion(name=ref.componentName, version=ref.version)
+                        if ref_cv in requested:
+                            continue
+                        requested.add(ref_cv)
+                        pending.add(asyncio.ensure_future(
+                            self.get_component_descriptor_from_registry(ref_cv.name, ref_cv.version)
+                        ))
+        finally:
+            for task in pending:
+                task.cancel()
+        return components
+
+    async def exists(self, image_reference: str) -> bool:
+        async with self._semaphore:
+            blob_ref = await self.client.head_manifest(image_reference, absent_ok=True)
+        return blob_ref is not None
+
+    async def versions(self, component_name: str) -> list[str]:
+        # tags of the component-descriptor repository
+        cd_url = component_descriptor_url(self.repo_url, component_name, 'any')
+        async with self._semaphore:
+            return await self.client.tags(cd_url)
+
+    async def _manifest(self, image_reference: str) -> dict:
+        if self.cache and (digest := self.cache.lookup_tag(image_reference)):
+            if (manifest_bytes := self.cache.get(digest)) is not None:
+                return json.loads(manifest_bytes)
+
+        async with self._semaphore:
+            response = await self.client.manifest_raw(image_reference=image_reference, absent_ok=False)
+            manifest_bytes = await response.read()
+        if self.cache:
+            digest = 'sha256:' + hashlib.sha256(manifest_bytes).hexdigest()
+            self.cache.put(digest, manifest_bytes)
+            self.cache.store_tag(image_reference, digest)
+        return json.loads(manifest_bytes)
+
+    async def _blob(self, image_reference: str, digest: str) -> bytes:
+        if self.cache and (data := self.cache.get(digest)) is not None:
+            return data
+
+        async with self._semaphore:
+            response = await self.client.blob(image_reference=image_reference, digest=digest)
+            data = await response.read()
+        if self.cache:
+            self.cache.put(digest, data)
+        return data
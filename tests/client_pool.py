@@ -0,0 +1,119 @@
+# Shared OCI clients: one pooled keep-alive session per process, one oc.Client per credentials
+
+import collections.abc
+import os
+import socket
+import threading
+
+import oci.auth as oa
+import oci.client as oc
+import requests
+import requests.adapters
+from urllib3.connection import HTTPConnection
+
+import tracing
+
+# connections kept open per registry host, should exceed the concurrency of uploads and
+# downloads (oc.Client allows 8 parallel requests per host), otherwise connections are
+# discarded after use and the next request needs a new TLS handshake
+POOL_SIZE = int(os.getenv('OCI_POOL_SIZE', 32))
+# OCI_KEEP_ALIVE=0 closes connections after every request, for comparison only
+KEEP_ALIVE = os.getenv('OCI_KEEP_ALIVE', '1') != '0'
+
+# tcp keep-alive probes on idle pooled connections, so that connections silently dropped by
+# load balancers or NAT are detected instead of failing the next request
+_TCP_KEEPALIVE_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)] + [
+    (socket.IPPROTO_TCP, getattr(socket, name), value)
+    for name, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3))
+    if hasattr(socket, name)
+]
+
+
+class _KeepAliveAdapter(requests.adapters.HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + _TCP_KEEPALIVE_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+def create_session(pool_size: int = POOL_SIZE, keep_alive: bool = KEEP_ALIVE) -> requests.Session:
+    session = tracing.TracedSession()
+    # retries are done by oc.Client, pool_block=False: never wait for a free connection
+    adapter = _KeepAliveAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def basic_credentials_lookup(user_name: str | None, password: str | None) -> collections.abc.Callable:
+    def _credentials_lookup(
+        image_reference: str,
+        privileges: oa.Privileges=oa.Privileges.READONLY,
+        absent_ok: bool=True,
+    ):
+        if user_name and password:
+            return oa.OciBasicAuthCredentials(username=user_name, password=password)
+        return None
+    return _credentials_lookup
+
+
+class ClientFactory:
+    """
+    Hands out one oc.Client per credentials key, all clients share one pooled session. Clients
+    are kept for the lifetime of the factory, so their token caches (bearer tokens per registry
+    and repository scope) survive, and the session keeps connections to the registries open:
+    helpers asking for a client again and again neither authenticate nor handshake again.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, keep_alive: bool = KEEP_ALIVE):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self._session: requests.Session = None
+        self._clients: dict[collections.abc.Hashable, oc.Client] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        with self._lock:
+            if not self._session:
+                self._session = create_session(self.pool_size, self.keep_alive)
+            return self._session
+
+    def client(
+        self,
+        key: collections.abc.Hashable,
+        create: collections.abc.Callable[[requests.Session], oc.Client],
+    ) -> oc.Client:
+        """
+        return the client for key, create(session) is called once to create it with the
+        shared session
+        """
+        session = self.session
+        with self._lock:
+            if not (client := self._clients.get(key)):
+                client = create(session)
+                self._clients[key] = client
+            return client
+
+    def basic_auth_client(self, user_name: str = None, password: str = None) -> oc.Client:
+        return self.client(
+            ('basic', user_name, password),
+            lambda session: oc.Client(
+                credentials_lookup=basic_credentials_lookup(user_name, password),
+                routes=oc.OciRoutes(oc.base_api_url),
+                session=session,
+            ),
+        )
+
+    def close(self):
+        with self._lock:
+            if self._session:
+                self._session.close()
+            self._session = None
+            self._clients = {}
+
+
+# shared by all helpers of this process (test worker), closed at the end of the test session
+clients = ClientFactory()
@@ -0,0 +1,63 @@
+# pytest plugin: assigns ocm and registry spans to tests, exports traces, prints the slowest ones,
+# closes the shared registry connections
+
+from dataclasses import asdict
+
+import pytest
+
+import client_pool
+import tracing
+import util
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--slowest-ops',
+        type=int,
+        default=10,
+        help='number of slowest ocm calls and registry requests to show at the end (0: none)',
+    )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    tracing.tracer.current_test = item.nodeid
+    yield
+    tracing.tracer.current_test = None
+
+
+def pytest_sessionfinish(session, exitstatus):
+    client_pool.clients.close()
+    util.get_digest_cache().save()
+    if not tracing.tracer.spans:
+        return
+    if hasattr(session.config, 'workeroutput'):
+        # pytest-xdist worker: the controller prints the summary of all workers
+        session.config.workeroutput['spans'] = [asdict(s) for s in tracing.tracer.spans]
+    # per worker gen dir, parallel workers write their own traces, the controller all of them
+    out_dir = util.get_gen_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tracing.tracer.write_json(out_dir / 'trace.json')
+    tracing.tracer.write_chrome_trace(out_dir / 'trace.chrome.json')
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    spans = getattr(node, 'workeroutput', {}).get('spans') or []
+    tracing.tracer.extend([tracing.Span(**s) for s in spans])
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    count = config.getoption('--slowest-ops')
+    if not count or not tracing.tracer.spans:
+        return
+    terminalreporter.section(f'slowest {count} operations')
+    for span in tracing.tracer.slowest(count):
+        moved = ''
+        if span.category == 'http':
+            moved = f' sent={span.bytes_sent} received={span.bytes_received}'
+        terminalreporter.write_line(
+            f'{span.seconds:8.3f}s {span.category:4} rc={span.exit_code}{moved} {span.name} '
+            f'({span.test or "session"})'
+        )
+    terminalreporter.write_line(f'traces written to {util.get_gen_dir()}/trace.json and trace.chrome.json')
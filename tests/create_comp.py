@@ -1,11 +1,10 @@
 from dataclasses import dataclass
 import io
-import json
 import logging
 from pathlib import Path
-import tarfile
 import textwrap
 
+from ctf import CtfReader, validate_ctf
 import gci.componentmodel as cm
 import ocmcli as ocm
 import util
@@ -107,29 +106,19 @@ class TestData:
     def create_ctf(self) -> ocm.OcmApplication:
         return create_ctf_from_component_spec(self.test_dir, self.component_yaml)
 
-    def find_component_descriptor(self, ctf_dir: Path) -> cm.ComponentDescriptor:
-        index_file = ctf_dir / 'artifact-index.json'
-        with open(index_file) as f:
-            ind = json.load(f)
-        digest:str = ind['artifacts'][0]['digest']
-        manifest_file = ctf_dir / 'blobs' / digest.replace('sha256:', 'sha256.')
-        with open(manifest_file) as f:
-            oci_manifest = json.load(f)
+    def find_component_descriptor(
+        self,
+        ctf_dir: Path,
+        name: str = None,
+        version: str = None,
+    ) -> cm.ComponentDescriptor:
+        name = name or self.comp_name
+        version = version or self.comp_vers
+        reader = CtfReader(ctf_dir)
+        oci_manifest = reader.manifest(reader.artifact(name, version).digest)
         assert oci_manifest['mediaType'] == 'application/vnd.oci.image.manifest.v1+json'
         assert oci_manifest['layers'][0]['mediaType'] == 'application/vnd.ocm.software.component-descriptor.v2+yaml+tar'
-        cd_digest = oci_manifest['layers'][0]['digest']
-        cd_tar_file =  ctf_dir / 'blobs' / cd_digest.replace('sha256:', 'sha256.')
-        extract_dir = ctf_dir.parent / 'extracted'
-        with tarfile.open(cd_tar_file, 'r') as tar:
-            name = tar.next()
-            print(f'extracting file {name}')
-            tar.extractall(extract_dir)
-        cd_file = extract_dir / name.name
-        cd_file.chmod(0o644)
-        with open(cd_file) as f:
-            cd_dict = yaml.safe_load(f)
-        cd = cm.ComponentDescriptor.from_dict(cd_dict, cm.ValidationMode.NONE)
-        return cd
+        return reader.component_descriptor(name, version)
 
     def verify_root_elems(self, cd: cm.ComponentDescriptor):
         assert cd.meta.schemaVersion == cm.SchemaVersion.V2
@@ -213,6 +202,10 @@ def validate_ctf_dir(ctf_dir: Path):
         count += 1
         assert child.name.startswith('sha256.')
 
+    result = validate_ctf(ctf_dir)
+    print(result.report())
+    assert result.ok, result.report()
+
 
 def create_ctf_from_resources_sources_references(
     test_dir: str,
@@ -222,6 +215,7 @@ def create_ctf_from_resources_sources_references(
     resources_yaml: str,
     sources_yaml: str = None,
     references_yaml: str = None,
+    batched: bool = False,
 ) -> ocm.OcmApplication:
     sources_file = None
     references_file = None
@@ -253,7 +247,7 @@ def create_ctf_from_resources_sources_references(
     cv_spec.resource_file = resource_file
     cv_spec.reference_file = references_file
 
-    cli.create_ctf_from_component_version(cv_spec)
+    cli.create_ctf_from_component_version(cv_spec, batched=batched)
     return cli
 
 
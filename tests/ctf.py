@@ -0,0 +1,251 @@
+# Reading and validation of common transport format (CTF) directories ('ocm transfer ctf')
+
+import collections.abc
+import concurrent.futures
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+from pathlib import Path
+import tarfile
+import threading
+
+import gci.componentmodel as cm
+import gci.oci
+import yaml
+
+from cd_tools import ComponentVersion, DescriptorMemo, descriptor_artifact
+
+ARTIFACT_INDEX_FILE = 'artifact-index.json'
+BLOBS_DIR = 'blobs'
+COMPONENT_DESCRIPTORS_PREFIX = 'component-descriptors/'
+DESCRIPTOR_LAYER_MIMETYPE = 'application/vnd.ocm.software.component-descriptor.v2+yaml+tar'
+
+# hashing is I/O bound and hashlib releases the GIL, more threads than cores keep the disk busy
+DEFAULT_HASH_WORKERS = max(4, os.cpu_count() or 1)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+@dataclass(frozen=True)
+class CtfArtifact:
+    repository: str
+    tag: str | None
+    digest: str
+
+
+class CtfReader:
+    """
+    Reads component-descriptors from a CTF directory in place. On init only the artifact index is
+    read and indexed by component name and version, so looking up a component version is a dict
+    access regardless of the size of the CTF. Manifests are read on demand, the descriptor is
+    parsed directly from its member in the descriptor layer (tarfile seeks to the member in the
+    blob file, nothing is extracted to disk). Parsed descriptors are memoised by layer digest.
+    """
+
+    def __init__(self, ctf_dir: str | Path, memo: DescriptorMemo = None):
+        self.ctf_dir = Path(ctf_dir)
+        self.memo = memo or DescriptorMemo()
+        self._manifests: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        with open(self.ctf_dir / ARTIFACT_INDEX_FILE) as f:
+            index = json.load(f)
+        self.artifacts = [
+            CtfArtifact(repository=a['repository'], tag=a.get('tag'), digest=a['digest'])
+            for a in index.get('artifacts') or []
+        ]
+        self._component_versions: dict[ComponentVersion, CtfArtifact] = {
+            ComponentVersion(
+                name=a.repository.removeprefix(COMPONENT_DESCRIPTORS_PREFIX),
+                version=a.tag,
+            ): a
+            for a in self.artifacts
+            if a.repository.startswith(COMPONENT_DESCRIPTORS_PREFIX) and a.tag
+        }
+
+    def blob_path(self, digest: str) -> Path:
+        return self.ctf_dir / BLOBS_DIR / digest.replace(':', '.')
+
+    def component_versions(self) -> list[ComponentVersion]:
+        return list(self._component_versions)
+
+    def artifact(self, name: str, version: str) -> CtfArtifact:
+        try:
+            return self._component_versions[ComponentVersion(name=name, version=version)]
+        except KeyError:
+            raise KeyError(f'component version {name}:{version} not found in {self.ctf_dir}')
+
+    def manifest(self, digest: str) -> dict:
+        with self._lock:
+            if manifest := self._manifests.get(digest):
+                return manifest
+        with open(self.blob_path(digest)) as f:
+            manifest = json.load(f)
+        with self._lock:
+            self._manifests[digest] = manifest
+        return manifest
+
+    def descriptor_layer(self, name: str, version: str) -> dict:
+        manifest = self.manifest(self.artifact(name, version).digest)
+        for layer in manifest['layers']:
+            if layer['mediaType'] in gci.oci.component_descriptor_mimetypes:
+                return layer
+        raise ValueError(f'no component-descriptor layer in manifest of {name}:{version}')
+
+    def component_descriptor(self, name: str, version: str) -> cm.ComponentDescriptor:
+        layer_digest = self.descriptor_layer(name, version)['digest']
+        if cd := self.memo.descriptor(layer_digest):
+            return cd
+        cd = cm.ComponentDescriptor.from_dict(self._read_descriptor(layer_digest), cm.ValidationMode.NONE)
+        self.memo.store_descriptor(layer_digest, cd)
+        return self.memo.descriptor(layer_digest)
+
+    def component_descriptor_dict(self, name: str, version: str) -> dict:
+        # as stored, parsed descriptors drop fields unknown to the component model (not memoised)
+        return self._read_descriptor(self.descriptor_layer(name, version)['digest'])
+
+    def _read_descriptor(self, layer_digest: str) -> dict:
+        with tarfile.open(self.blob_path(layer_digest), 'r') as tf:
+            try:
+                member = tf.getmember(gci.oci.component_descriptor_fname)
+            except KeyError:
+                member = tf.next()
+            return yaml.load(tf.extractfile(member), Loader=_Loader)
+
+    def component_descriptors(self) -> dict[ComponentVersion, cm.ComponentDescriptor]:
+        return {
+            cv: self.component_descriptor(cv.name, cv.version)
+            for cv in self._component_versions
+        }
+
+
+def store_blob(blob_dir: Path, data: bytes) -> dict:
+    # named by digest like 'ocm transfer ctf' does, returns the descriptor fields digest and size
+    digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+    (blob_dir / digest.replace(':', '.')).write_bytes(data)
+    return {'digest': digest, 'size': len(data)}
+
+
+def write_ctf(ctf_dir: str | Path, component_descriptors: collections.abc.Iterable[dict]):
+    """
+    write component-descriptors (as dicts) into a CTF directory with the layout of 'ocm transfer
+    ctf': per component version a manifest, a config and a tar layer with the descriptor
+    """
+    ctf_dir = Path(ctf_dir)
+    blob_dir = ctf_dir / BLOBS_DIR
+    blob_dir.mkdir(parents=True, exist_ok=True)
+    artifacts = []
+    for cd in component_descriptors:
+        artifact = descriptor_artifact(cd, layer_media_type=DESCRIPTOR_LAYER_MIMETYPE)
+        store_blob(blob_dir, artifact.layer)
+        store_blob(blob_dir, artifact.config)
+        artifacts.append({
+            'repository': COMPONENT_DESCRIPTORS_PREFIX + cd['component']['name'],
+            'tag': cd['component']['version'],
+            'digest': store_blob(blob_dir, artifact.manifest)['digest'],
+        })
+    with open(ctf_dir / ARTIFACT_INDEX_FILE, 'w') as f:
+        json.dump({'schemaVersion': 1, 'artifacts': artifacts}, f)
+
+
+@dataclass
+class CtfValidationResult:
+    blobs: int = 0
+    bytes: int = 0
+    corrupt: dict[str, str] = field(default_factory=dict) # expected -> actual digest, equal for unreadable manifests
+    missing: set[str] = field(default_factory=set) # referenced, but not in blobs/
+    orphaned: set[str] = field(default_factory=set) # in blobs/, but not referenced
+    invalid_names: list[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        # orphaned blobs waste space, but do not break the CTF
+        return not (self.corrupt or self.missing or self.invalid_names)
+
+    def report(self) -> str:
+        lines = [f'{self.blobs} blobs, {self.bytes} bytes verified']
+        lines += [f'corrupt blob {expected}: content has digest {actual}' if actual != expected
+                  else f'corrupt blob {expected}: unreadable manifest'
+                  for expected, actual in sorted(self.corrupt.items())]
+        lines += [f'missing blob {digest}' for digest in sorted(self.missing)]
+        lines += [f'orphaned blob {digest}' for digest in sorted(self.orphaned)]
+        lines += [f'invalid blob file name {name}' for name in self.invalid_names]
+        return '\n'.join(lines)
+
+
+def _file_digest(path: Path, algorithm: str) -> str:
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'): # python >= 3.11
+            hash = hashlib.file_digest(f, algorithm)
+        else:
+            hash = hashlib.new(algorithm)
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                hash.update(chunk)
+    return f'{algorithm}:{hash.hexdigest()}'
+
+
+def _referenced_digests(reader: CtfReader, present: set[str]) -> tuple[set[str], set[str], set[str]]:
+    # walks from the index through manifests (and image indices) to configs and layers, configs
+    # and layers are leaves: they are not opened, large layers would be read for nothing.
+    # Returns referenced, missing and unreadable (e.g. truncated) manifests.
+    referenced = set()
+    missing = set()
+    unreadable = set()
+    pending_manifests = [a.digest for a in reader.artifacts]
+    while pending_manifests:
+        digest = pending_manifests.pop()
+        if digest in referenced:
+            continue
+        referenced.add(digest)
+        if digest not in present:
+            missing.add(digest)
+            continue
+        try:
+            manifest = reader.manifest(digest)
+        except ValueError: # json and unicode decode errors
+            unreadable.add(digest)
+            continue
+        leaves = [layer['digest'] for layer in manifest.get('layers') or []]
+        if config := manifest.get('config'):
+            leaves.append(config['digest'])
+        referenced.update(leaves)
+        missing.update(d for d in leaves if d not in present)
+        pending_manifests += [m['digest'] for m in manifest.get('manifests') or []]
+    return referenced, missing, unreadable
+
+
+def validate_ctf(ctf_dir: str | Path, max_workers: int = DEFAULT_HASH_WORKERS) -> CtfValidationResult:
+    """
+    re-hash all blobs of a CTF concurrently and compare with their names, check that all
+    digests reachable from the artifact index are present and report blobs not reachable
+    """
+    reader = CtfReader(ctf_dir)
+    result = CtfValidationResult()
+    blob_files = {}
+    for path in (reader.ctf_dir / BLOBS_DIR).iterdir():
+        algorithm, _, hex_digest = path.name.partition('.')
+        if algorithm not in hashlib.algorithms_available or not hex_digest:
+            result.invalid_names.append(path.name)
+            continue
+        blob_files[f'{algorithm}:{hex_digest}'] = path
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_file_digest, path, digest.split(':')[0]): digest
+            for digest, path in blob_files.items()
+        }
+        referenced, result.missing, unreadable = _referenced_digests(reader, set(blob_files))
+        for future in concurrent.futures.as_completed(futures):
+            digest = futures[future]
+            if (actual := future.result()) != digest:
+                result.corrupt[digest] = actual
+            result.blobs += 1
+            result.bytes += blob_files[digest].stat().st_size
+
+    # a manifest matching its digest, but no json, was written corrupt
+    for digest in unreadable:
+        result.corrupt.setdefault(digest, digest)
+    result.orphaned = set(blob_files) - referenced
+    return result
@@ -1,58 +1,197 @@
-import datetime
-import gzip
+import concurrent.futures
 import hashlib
 import json
 import os
 from pathlib import Path
-import pprint
-import shutil
-import tarfile
+import time
 import oci.auth as oa
 import oci.model as om
 import oci.client as oc
 import gci.componentmodel as cm
+import requests
 
+import client_pool
+import oci_requests
 import util
 
-def download_image(client: oc.Client, image_ref: str):
-    # get MIME type:
-    blob_ref = client.head_manifest(image_ref, accept=om.MimeTypes.prefer_multiarch)
-    print(f'Found MIME-type: {blob_ref.mediaType} with annotations: {blob_ref.annotations}')
-
-    manifest = client.manifest(
-            image_reference=image_ref,
-            absent_ok=False,
-            accept=blob_ref.mediaType
-        )
-
-    print(f'{type(manifest)=}')
-    pprint.pprint(manifest.as_dict())
-    work_dir = util.get_gen_dir() / 'image-out'
-    util.prepare_or_clean_dir(work_dir)
-    # write manifest to file:
-    manifest_file = work_dir / 'manifest.json'
-    with open(manifest_file, 'w') as f:
-        f.write(json.dumps(manifest.as_dict()))
-
-    # Download config:
-    print(f'Downloading config: {manifest.config.digest}, {manifest.config.mediaType}')
-    fname = work_dir / manifest.config.digest.replace(':','.')
-    with open(fname, 'wb') as f:
-        response = client.blob(image_ref, manifest.config.digest)
-        response.raise_for_status()
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-
-    # Download all layers
-    for layer in manifest.layers:
-        print(f'  Downloading layer: {layer.digest}, {layer.mediaType}')
-        fname = Path('image') / layer.digest.replace(':','.')
-        with open(fname, 'wb') as f:
-            response = client.blob(image_ref, layer.digest)
-            response.raise_for_status()
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        print('Done')
+# large chunks: fewer syscalls and hash updates when streaming blobs
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_WORKERS = 4
+MAX_ATTEMPTS = 5
+# interrupted transfers, client errors (401, 403, 404, ...) are raised immediately
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+MULTI_ARCH_MIME_TYPES = (om.OCI_IMAGE_INDEX_MIME, om.DOCKER_MANIFEST_LIST_MIME)
+
+
+class DigestMismatchException(Exception):
+    pass
+
+
+def _platform_name(platform: dict) -> str:
+    return f'{platform.get("os")}/{platform.get("architecture")}'
+
+
+def _fetch_manifest(
+    client: oc.Client,
+    image_ref: str,
+    accept: str,
+    digest: str = None,
+) -> tuple[bytes, str, str]:
+    res = client.manifest_raw(image_reference=image_ref, absent_ok=False, accept=accept)
+    manifest_bytes = res.content
+    actual_digest = 'sha256:' + hashlib.sha256(manifest_bytes).hexdigest()
+    if digest and digest != actual_digest:
+        raise DigestMismatchException(f'manifest {image_ref}: expected {digest}, got {actual_digest}')
+    media_type = json.loads(manifest_bytes).get('mediaType') or res.headers.get('Content-Type')
+    return manifest_bytes, media_type, actual_digest
+
+
+def _blob_path(blobs_dir: Path, digest: str) -> Path:
+    algorithm, hex_digest = digest.split(':', 1)
+    return blobs_dir / algorithm / hex_digest
+
+
+def _write_blob(blobs_dir: Path, digest: str, data: bytes):
+    path = _blob_path(blobs_dir, digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def _retryable(e: requests.exceptions.RequestException) -> bool:
+    if isinstance(e, requests.exceptions.HTTPError):
+        return e.response is not None and e.response.status_code >= 500
+    return isinstance(e, RETRYABLE_EXCEPTIONS)
+
+
+def download_blob(client: oc.Client, image_ref: str, digest: str, path: Path):
+    """
+    Download a blob to path, verifying its digest while streaming. Data is written to a .partial
+    file first: if the connection drops the download continues where it stopped, with an HTTP range
+    request (also across calls, e.g. after an interrupted test run). Interrupted transfers and
+    server errors are retried with the client's exponential backoff.
+    """
+    if path.exists():
+        return
+    partial = path.with_name(path.name + '.partial')
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        sha256 = hashlib.sha256()
+        offset = 0
+        if partial.exists():
+            with open(partial, 'rb') as f:
+                while (chunk := f.read(CHUNK_SIZE)):
+                    sha256.update(chunk)
+                    offset += len(chunk)
+        try:
+            res = oci_requests.blob_from(client, image_ref, digest, offset)
+            if offset and res.status_code == 416:
+                break # partial file is already complete
+            res.raise_for_status()
+            if offset and res.status_code != 206:
+                # range not supported, start from scratch
+                print(f'  Registry ignored range request for {digest}, restarting download')
+                sha256 = hashlib.sha256()
+                offset = 0
+            with open(partial, 'ab' if offset else 'wb') as f:
+                for chunk in res.iter_content(chunk_size=CHUNK_SIZE):
+                    sha256.update(chunk)
+                    f.write(chunk)
+            break
+        except requests.exceptions.RequestException as e:
+            if attempt == MAX_ATTEMPTS or not _retryable(e):
+                raise
+            backoff = min(client.default_backoff_base_seconds * 2 ** (attempt - 1), client.max_backoff_seconds)
+            print(f'  Download of {digest} interrupted ({e}), resuming in {backoff:.2f}s (attempt {attempt + 1})')
+            time.sleep(backoff)
+
+    actual_digest = 'sha256:' + sha256.hexdigest()
+    if actual_digest != digest:
+        partial.unlink()
+        raise DigestMismatchException(f'blob {image_ref}: expected {digest}, got {actual_digest}')
+    partial.rename(path)
+
+
+def download_image(
+    client: oc.Client,
+    image_ref: str,
+    out_dir: str | Path = None,
+    platforms: list[str] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Path:
+    """
+    Download a single or multi-arch image into an OCI image layout directory. For multi-arch
+    images only the given platforms (e.g. 'linux/amd64') are downloaded, all if None, the layout
+    then refers to an image index of these platforms. Config and layer blobs are downloaded
+    concurrently.
+    """
+    out_dir = Path(out_dir) if out_dir else util.get_gen_dir() / 'image-out'
+    blobs_dir = out_dir / 'blobs'
+    blobs_dir.mkdir(parents=True, exist_ok=True)
+    repo_ref = om.OciImageReference(image_ref).ref_without_tag
+
+    manifest_bytes, media_type, digest = _fetch_manifest(
+        client,
+        image_ref,
+        accept=om.MimeTypes.prefer_multiarch,
+    )
+    print(f'Found MIME-type: {media_type} for {image_ref}: {digest}')
+
+    if media_type in MULTI_ARCH_MIME_TYPES:
+        index = json.loads(manifest_bytes)
+        entries = [
+            entry for entry in index['manifests']
+            if not platforms or _platform_name(entry.get('platform', {})) in platforms
+        ]
+        if len(entries) < len(index['manifests']):
+            # the layout must only refer to blobs it contains: an index of the selected platforms
+            manifest_bytes = json.dumps({**index, 'manifests': entries}).encode()
+            digest = 'sha256:' + hashlib.sha256(manifest_bytes).hexdigest()
+        image_manifests = []
+        for entry in entries:
+            child_bytes, _, _ = _fetch_manifest(
+                client,
+                f'{repo_ref}@{entry["digest"]}',
+                accept=entry['mediaType'],
+                digest=entry['digest'],
+            )
+            _write_blob(blobs_dir, entry['digest'], child_bytes)
+            image_manifests.append(json.loads(child_bytes))
+    else:
+        image_manifests = [json.loads(manifest_bytes)]
+
+    _write_blob(blobs_dir, digest, manifest_bytes)
+    index_entry = {
+        'mediaType': media_type,
+        'digest': digest,
+        'size': len(manifest_bytes),
+        'annotations': {'org.opencontainers.image.ref.name': om.OciImageReference(image_ref).tag},
+    }
+
+    blobs = {}
+    for manifest in image_manifests:
+        for blob in [manifest['config']] + manifest['layers']:
+            blobs[blob['digest']] = blob
+
+    def download(blob: dict):
+        print(f'  Downloading blob: {blob["digest"]}, {blob["mediaType"]}')
+        path = _blob_path(blobs_dir, blob['digest'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        download_blob(client, image_ref, blob['digest'], path)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() propagates exceptions
+        list(executor.map(download, blobs.values()))
+
+    with open(out_dir / 'oci-layout', 'w') as f:
+        json.dump({'imageLayoutVersion': '1.0.0'}, f)
+    with open(out_dir / 'index.json', 'w') as f:
+        json.dump({'schemaVersion': 2, 'manifests': [index_entry]}, f)
+    print(f'Downloaded {len(blobs)} blobs of {image_ref} to {out_dir}')
+    return out_dir
 
 def main():
     def _credentials_lookup(
@@ -83,9 +222,13 @@ def main():
     with open('local/gcr-key.json') as f:
         gcr_key = f.read()
 
-    client = oc.Client(
-        credentials_lookup=_credentials_lookup,
-        routes=oc.OciRoutes(oc.base_api_url),
+    client = client_pool.clients.client(
+        ('download_image', user_name, passwd, gcr_key),
+        lambda session: oc.Client(
+            credentials_lookup=_credentials_lookup,
+            routes=oc.OciRoutes(oc.base_api_url),
+            session=session,
+        ),
     )
 
     download_image(client, image_ref)
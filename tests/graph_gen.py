@@ -0,0 +1,139 @@
+# Deterministic generator of synthetic component graphs for scale tests and benchmarks
+
+from dataclasses import dataclass
+import hashlib
+import json
+from pathlib import Path
+import random
+
+
+@dataclass(frozen=True)
+class GraphSpec:
+    """
+    components are distributed over depth levels (level 0 only holds the root). Every component
+    references fan_out components of the next level: each component of the next level has one
+    parent owning it, shared_ratio of the references point to components owned by other parents
+    (diamonds). The number of components per level grows accordingly, parents owning more than
+    fan_out children (e.g. if depth is small for the number of components) reference all of them.
+    """
+    components: int
+    fan_out: int
+    depth: int
+    shared_ratio: float = 0.25
+    blobs_per_component: int = 1
+    blob_size: int = 1024
+    seed: int = 0
+    provider: str = 'ocm.integrationtest'
+    version: str = '1.0.0'
+    name_prefix: str = 'scale'
+
+    def component_name(self, level: int, index: int) -> str:
+        return f'{self.provider}/{self.name_prefix}/l{level}-c{index}'
+
+    @property
+    def root_name(self) -> str:
+        return self.component_name(0, 0)
+
+
+def level_sizes(spec: GraphSpec) -> list[int]:
+    if spec.depth < 1 or spec.components < spec.depth:
+        raise ValueError(f'{spec.components} components cannot fill {spec.depth} levels')
+    if spec.depth == 1:
+        if spec.components != 1:
+            raise ValueError('a graph of depth 1 consists of the root component only')
+        return [1]
+    growth = max(1.0, spec.fan_out * (1 - spec.shared_ratio))
+    weights = [growth ** level for level in range(1, spec.depth)]
+    # every level gets at least one component, rounding leftovers go to the deepest level
+    remaining = spec.components - spec.depth
+    sizes = [1 + int(remaining * w / sum(weights)) for w in weights]
+    sizes[-1] += spec.components - 1 - sum(sizes)
+    return [1] + sizes
+
+
+def _references(rnd: random.Random, spec: GraphSpec, size: int, next_size: int) -> list[list[int]]:
+    # owned children are distributed evenly, the rest of fan_out is filled with shared ones
+    references = [list(range(index, next_size, size)) for index in range(size)]
+    for targets in references:
+        shared = min(spec.fan_out, next_size) - len(targets)
+        if shared > 0:
+            owned = set(targets)
+            candidates = [t for t in rnd.sample(range(next_size), min(next_size, shared + len(owned)))
+                          if t not in owned]
+            targets.extend(candidates[:shared])
+    return references
+
+
+def _blob_file_name(level: int, index: int, blob_index: int) -> str:
+    return f'blob-l{level}-c{index}-{blob_index}.bin'
+
+
+def generate(spec: GraphSpec, blob_dir: str | Path = 'blobs') -> list[dict]:
+    """
+    component specs in the format of components.yaml ('ocm add componentversions'), local blob
+    resources refer to files in blob_dir (see write_blobs)
+    """
+    rnd = random.Random(spec.seed)
+    sizes = level_sizes(spec)
+    components = []
+    for level, size in enumerate(sizes):
+        next_size = sizes[level + 1] if level + 1 < len(sizes) else 0
+        for index, targets in enumerate(_references(rnd, spec, size, next_size)):
+            components.append({
+                'name': spec.component_name(level, index),
+                'version': spec.version,
+                'provider': {'name': spec.provider},
+                'resources': [
+                    {
+                        'name': f'blob{blob_index}',
+                        'type': 'blob',
+                        'input': {
+                            'type': 'file',
+                            'path': str(Path(blob_dir) / _blob_file_name(level, index, blob_index)),
+                            'mediaType': 'application/octet-stream',
+                        },
+                    }
+                    for blob_index in range(spec.blobs_per_component)
+                ],
+                'componentReferences': [
+                    {
+                        'name': f'ref{target}',
+                        'componentName': spec.component_name(level + 1, target),
+                        'version': spec.version,
+                    }
+                    for target in targets
+                ],
+            })
+    return components
+
+
+def _blob_content(spec: GraphSpec, file_name: str) -> bytes:
+    # expanded from a seeded hash, so blob content does not depend on the generation order
+    seed = hashlib.sha256(f'{spec.seed}/{file_name}'.encode()).digest()
+    return random.Random(seed).randbytes(spec.blob_size)
+
+
+def write_blobs(spec: GraphSpec, blob_dir: str | Path):
+    blob_dir = Path(blob_dir)
+    blob_dir.mkdir(parents=True, exist_ok=True)
+    for level, size in enumerate(level_sizes(spec)):
+        for index in range(size):
+            for blob_index in range(spec.blobs_per_component):
+                file_name = _blob_file_name(level, index, blob_index)
+                (blob_dir / file_name).write_bytes(_blob_content(spec, file_name))
+
+
+def write_components_file(spec: GraphSpec, out_dir: str | Path) -> Path:
+    """
+    write components.yaml and the local blobs for spec into out_dir, the file can be passed to
+    OcmApplication.create_ctf_from_spec
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    blob_dir = out_dir / 'blobs'
+    write_blobs(spec, blob_dir)
+    components_file = out_dir / 'components.yaml'
+    with open(components_file, 'w') as f:
+        # JSON is valid YAML and is written an order of magnitude faster than with a YAML dumper
+        json.dump({'components': generate(spec, blob_dir)}, f, indent=1)
+    return components_file
@@ -0,0 +1,201 @@
+# Digest based comparison of an oci image (or image index) with its copy, e.g. after a transfer
+
+import concurrent.futures
+from dataclasses import dataclass, field
+import hashlib
+import json
+import random
+
+import oci.client as oc
+import oci.model as om
+
+from cd_tools import DEFAULT_MAX_WORKERS
+
+MANIFEST_DIGEST_DIFFERS = 'manifest digest differs'
+MANIFEST_INVALID = 'manifest does not match its digest or size'
+MANIFEST_MISSING = 'manifest missing in target'
+SOURCE_MANIFEST_MISSING = 'manifest missing in source'
+BLOB_MISSING = 'blob missing in target'
+BLOB_SIZE_DIFFERS = 'blob size differs'
+BLOB_DIGEST_DIFFERS = 'blob digest differs'
+DESCRIPTOR_DIFFERS = 'descriptor differs'
+
+_INDEX_MEDIA_TYPES = (om.OCI_IMAGE_INDEX_MIME, om.DOCKER_MANIFEST_LIST_MIME)
+
+
+@dataclass(frozen=True)
+class ImageDiff:
+    path: str # e.g. manifests[1]/layers[0]
+    problem: str
+    digest: str | None = None
+    detail: str | None = None
+
+
+@dataclass
+class ImageValidation:
+    source: str
+    target: str
+    manifests: int = 0 # requested from the target
+    blobs: int = 0 # checked with HEAD
+    blobs_downloaded: int = 0 # sampled full-content checks
+    diffs: list[ImageDiff] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.diffs
+
+    def report(self) -> str:
+        lines = [
+            f'{self.source} -> {self.target}: {self.manifests} manifests, {self.blobs} blobs, '
+            f'{self.blobs_downloaded} downloaded, {len(self.diffs)} differences'
+        ]
+        for diff in self.diffs:
+            line = f'{diff.path or "/"}: {diff.problem}'
+            if diff.digest:
+                line += f' {diff.digest}'
+            if diff.detail:
+                line += f' ({diff.detail})'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def _digest(data: bytes) -> str:
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def _by_digest(image_reference: str, digest: str) -> str:
+    return f'{om.OciImageReference(image_reference).ref_without_tag}@{digest}'
+
+
+def _is_index(manifest: dict) -> bool:
+    return manifest.get('mediaType') in _INDEX_MEDIA_TYPES or 'manifests' in manifest
+
+
+def _descriptors(manifest: dict) -> list[tuple[str, dict]]:
+    # (path, descriptor) of everything a manifest refers to
+    if _is_index(manifest):
+        return [(f'manifests[{i}]', m) for i, m in enumerate(manifest.get('manifests') or [])]
+    return [('config', manifest['config'])] + [(f'layers[{i}]', l) for i, l in enumerate(manifest.get('layers') or [])]
+
+
+class ImageValidator:
+    """
+    Checks that an image was copied completely, without downloading its layers like 'crane
+    validate --remote' does: the manifests of source and target are compared by digest, the
+    child manifests of image indices are fetched from the target and checked against their
+    descriptors, configs and layers are checked with HEAD requests (presence, digest and size).
+    So the cost is one request per manifest and blob, independent of the image size.
+    sample_rate is the fraction of blobs additionally downloaded from the target to compare the
+    sha256 of their content, chosen reproducibly by seed.
+    """
+
+    def __init__(
+        self,
+        source_client: oc.Client,
+        target_client: oc.Client = None,
+        sample_rate: float = 0.0,
+        seed: int = 0,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.source_client = source_client
+        self.target_client = target_client or source_client
+        self.sample_rate = sample_rate
+        self.seed = seed
+        self.max_workers = max_workers
+
+    def validate(self, source_ref: str, target_ref: str) -> ImageValidation:
+        result = ImageValidation(source=source_ref, target=target_ref)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            source = executor.submit(self._manifest_bytes, self.source_client, source_ref)
+            target = executor.submit(self._manifest_bytes, self.target_client, target_ref)
+            source, target = source.result(), target.result()
+        result.manifests += 1
+        if source is None or target is None:
+            result.diffs.append(ImageDiff('', SOURCE_MANIFEST_MISSING if source is None else MANIFEST_MISSING))
+            return result
+
+        source_manifest, target_manifest = json.loads(source), json.loads(target)
+        if _digest(source) != _digest(target):
+            result.diffs.append(ImageDiff('', MANIFEST_DIGEST_DIFFERS, _digest(target), f'source {_digest(source)}'))
+            # an identical manifest refers to identical content, otherwise compare the descriptors
+            source_descriptors = dict(_descriptors(source_manifest))
+            for path, descriptor in _descriptors(target_manifest):
+                expected = source_descriptors.get(path)
+                if not expected or (expected['digest'], expected['size']) != (descriptor['digest'], descriptor['size']):
+                    result.diffs.append(ImageDiff(
+                        path, DESCRIPTOR_DIFFERS, descriptor['digest'],
+                        f'source {expected["digest"]}' if expected else 'not in source',
+                    ))
+
+        blobs = self._walk(target_ref, target_manifest, '', result)
+        self._check_blobs(target_ref, blobs, result)
+        return result
+
+    def _manifest_bytes(self, client: oc.Client, image_reference: str) -> bytes | None:
+        response = client.manifest_raw(image_reference, absent_ok=True, accept=om.MimeTypes.prefer_multiarch)
+        return response.content if response is not None else None
+
+    def _walk(self, target_ref: str, manifest: dict, path: str, result: ImageValidation) -> list[tuple[str, dict]]:
+        # child manifests of indices are fetched, returns the blobs of all image manifests
+        descriptors = [(f'{path}/{p}' if path else p, d) for p, d in _descriptors(manifest)]
+        if not _is_index(manifest):
+            return descriptors
+
+        def child(descriptor: dict) -> bytes | None:
+            return self._manifest_bytes(self.target_client, _by_digest(target_ref, descriptor['digest']))
+
+        blobs = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            children = list(executor.map(child, [d for _, d in descriptors]))
+        for (child_path, descriptor), content in zip(descriptors, children):
+            result.manifests += 1
+            if content is None:
+                result.diffs.append(ImageDiff(child_path, MANIFEST_MISSING, descriptor['digest']))
+            elif (_digest(content), len(content)) != (descriptor['digest'], descriptor['size']):
+                result.diffs.append(ImageDiff(child_path, MANIFEST_INVALID, descriptor['digest']))
+            else:
+                blobs += self._walk(target_ref, json.loads(content), child_path, result)
+        return blobs
+
+    def _check_blobs(self, target_ref: str, blobs: list[tuple[str, dict]], result: ImageValidation):
+        # blobs shared by several manifests (e.g. layers of platforms) are checked once
+        unique = {}
+        for path, descriptor in blobs:
+            unique.setdefault(descriptor['digest'], (path, descriptor))
+        unique = list(unique.values())
+        rng = random.Random(self.seed)
+        sampled = {descriptor['digest'] for _, descriptor in unique if rng.random() < self.sample_rate}
+
+        def check(item: tuple[str, dict]) -> ImageDiff | None:
+            path, descriptor = item
+            digest = descriptor['digest']
+            response = self.target_client.head_blob(target_ref, digest, absent_ok=True)
+            if not response.ok:
+                return ImageDiff(path, BLOB_MISSING, digest)
+            if (returned := response.headers.get('Docker-Content-Digest')) and returned != digest:
+                return ImageDiff(path, BLOB_DIGEST_DIFFERS, digest, f'target {returned}')
+            size = response.headers.get('Content-Length')
+            if size is not None and int(size) != descriptor['size']:
+                return ImageDiff(path, BLOB_SIZE_DIFFERS, digest, f'{size} != {descriptor["size"]}')
+            if digest in sampled:
+                return self._check_content(target_ref, path, descriptor)
+            return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            diffs = list(executor.map(check, unique))
+        result.blobs += len(unique)
+        result.blobs_downloaded += len(sampled)
+        result.diffs += [d for d in diffs if d]
+
+    def _check_content(self, target_ref: str, path: str, descriptor: dict) -> ImageDiff | None:
+        sha256 = hashlib.sha256()
+        size = 0
+        response = self.target_client.blob(target_ref, descriptor['digest'], stream=True)
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            sha256.update(chunk)
+            size += len(chunk)
+        if (digest := 'sha256:' + sha256.hexdigest()) != descriptor['digest']:
+            return ImageDiff(path, BLOB_DIGEST_DIFFERS, descriptor['digest'], f'content {digest}')
+        if size != descriptor['size']:
+            return ImageDiff(path, BLOB_SIZE_DIFFERS, descriptor['digest'], f'{size} != {descriptor["size"]}')
+        return None
@@ -0,0 +1,90 @@
+# Pool of pre-generated RSA key pairs, shared by all test workers
+
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import threading
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from filelock import FileLock
+
+from process_pool import process_pool
+
+# one signing key and enough "wrong" keys for the tests of one session
+DEFAULT_POOL_SIZE = int(os.getenv('KEY_POOL_SIZE', 4))
+DEFAULT_KEY_SIZE = 2048
+
+
+@dataclass(frozen=True)
+class KeyPair:
+    private_key_path: Path
+    public_key_path: Path
+
+
+def _generate_key_pair(key_pair: KeyPair, key_size: int):
+    # runs in the worker processes, same formats as 'ocm create rsakeypair' (PKCS#1)
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    for path, data in (
+        (key_pair.public_key_path, private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.PKCS1,
+        )),
+        (key_pair.private_key_path, private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption(),
+        )),
+    ):
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+
+class KeyPool:
+    """
+    size rsa key pairs, generated in parallel processes the first time one is requested. The key
+    files are kept in key_dir, which may be shared by test workers and test runs: the first
+    worker generates missing pairs holding a file lock, the others wait for it and use the
+    existing files. Afterwards handing out a key pair is constant time, e.g. for "wrong key" tests.
+    """
+
+    def __init__(self, key_dir: str | Path, size: int = DEFAULT_POOL_SIZE, key_size: int = DEFAULT_KEY_SIZE):
+        self.key_dir = Path(key_dir) / f'rsa-{key_size}'
+        self.size = size
+        self.key_size = key_size
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def key_pair(self, index: int = 0) -> KeyPair:
+        if not 0 <= index < self.size:
+            raise IndexError(f'key pool has {self.size} key pairs, {index} requested')
+        self._ensure_generated()
+        return self._key_pair(index)
+
+    def _key_pair(self, index: int) -> KeyPair:
+        return KeyPair(
+            private_key_path=self.key_dir / f'priv-{index}.key',
+            public_key_path=self.key_dir / f'public-{index}.key',
+        )
+
+    def _missing(self) -> list[KeyPair]:
+        return [
+            key_pair for key_pair in map(self._key_pair, range(self.size))
+            if not key_pair.private_key_path.exists() or not key_pair.public_key_path.exists()
+        ]
+
+    def _ensure_generated(self):
+        with self._lock:
+            if self._ready:
+                return
+            self.key_dir.mkdir(parents=True, exist_ok=True)
+            with FileLock(self.key_dir / '.lock'):
+                if missing := self._missing():
+                    print(f'generating {len(missing)} rsa-{self.key_size} key pairs')
+                    if len(missing) == 1:
+                        _generate_key_pair(missing[0], self.key_size)
+                    else:
+                        with process_pool(max_workers=min(len(missing), os.cpu_count() or 1)) as executor:
+                            list(executor.map(_generate_key_pair, missing, [self.key_size] * len(missing)))
+            self._ready = True
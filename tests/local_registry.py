@@ -0,0 +1,525 @@
+# In-process OCI registry (distribution-spec subset) for offline tests and benchmarks
+
+import base64
+from dataclasses import dataclass
+import hashlib
+import http.server
+import json
+from pathlib import Path
+import random
+import re
+import shutil
+import ssl
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+import oci.auth as oa
+import oci.client as oc
+import oci.model as om
+
+from cd_tools import descriptor_artifact
+import tracing
+
+# responses are sent in pieces of this size, so that bandwidth caps are applied smoothly
+SEND_CHUNK_SIZE = 64 * 1024
+
+_UPLOAD_PATH = re.compile(r'^/v2/(?P<name>.+)/blobs/uploads/(?P<upload_id>[^/]*)$')
+_BLOB_PATH = re.compile(r'^/v2/(?P<name>.+)/blobs/(?P<digest>[^/]+)$')
+_MANIFEST_PATH = re.compile(r'^/v2/(?P<name>.+)/manifests/(?P<reference>[^/]+)$')
+_TAGS_PATH = re.compile(r'^/v2/(?P<name>.+)/tags/list$')
+
+
+@dataclass
+class RegistryStats:
+    connections: int = 0
+    requests: int = 0
+    bytes_received: int = 0
+    bytes_sent: int = 0
+    errors_injected: int = 0
+
+
+@dataclass
+class Repository:
+    blobs: set
+    manifests: dict # digest -> (media type, content)
+    tags: dict # tag -> digest
+
+
+def _digest(data: bytes) -> str:
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def create_self_signed_cert(out_dir: str | Path, host: str = '127.0.0.1') -> tuple[Path, Path]:
+    """
+    create a self-signed certificate for host using the openssl CLI (as the integration test
+    workflow does for the docker registry), returns paths of certificate and key
+    """
+    if not shutil.which('openssl'):
+        raise RuntimeError('openssl is required to create a TLS certificate')
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cert_file = out_dir / 'registry.crt'
+    key_file = out_dir / 'registry.key'
+    san = f'IP:{host}' if re.fullmatch(r'[0-9.]+', host) else f'DNS:{host}'
+    subprocess.run([
+        'openssl', 'req', '-newkey', 'rsa:2048', '-nodes', '-sha256', '-x509', '-days', '1',
+        '-keyout', str(key_file), '-out', str(cert_file),
+        '-subj', f'/CN={host}', '-addext', f'subjectAltName = {san}',
+    ], check=True, capture_output=True)
+    return cert_file, key_file
+
+
+class LocalRegistry:
+    """
+    Pure-Python OCI registry serving from memory, starts in milliseconds. Supports blobs (with
+    range requests), monolithic, single-POST and chunked uploads, cross-repository mounts,
+    manifests, tags, HEAD and DELETE. Optionally requires basic auth and serves TLS.
+    Network conditions can be shaped: latency_seconds is added to every request, the transfer
+    of request and response bodies is capped to bandwidth_bytes_per_second (per connection),
+    and a fraction error_rate of the requests without body is answered with 503 (the client
+    retries these; requests streaming a body cannot be retried by oc.Client).
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        user_name: str = None,
+        password: str = None,
+        tls_cert_file: str | Path = None,
+        tls_key_file: str | Path = None,
+        latency_seconds: float = 0,
+        bandwidth_bytes_per_second: int = None,
+        error_rate: float = 0,
+        seed: int = None,
+    ):
+        self.host = host
+        self.user_name = user_name
+        self.password = password
+        self.tls_cert_file = tls_cert_file
+        self.latency_seconds = latency_seconds
+        self.bandwidth_bytes_per_second = bandwidth_bytes_per_second
+        self.error_rate = error_rate
+        self.stats = RegistryStats()
+        self._random = random.Random(seed)
+        self._blobs: dict[str, bytes] = {}
+        self._repositories: dict[str, Repository] = {}
+        self._uploads: dict[str, tuple[str, bytearray]] = {}
+        self._lock = threading.Lock()
+
+        self._server = _RegistryServer((host, port), _RegistryRequestHandler)
+        self._server.daemon_threads = True
+        self._server.registry = self
+        if tls_cert_file:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(tls_cert_file, tls_key_file)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    @property
+    def netloc(self) -> str:
+        return f'{self.host}:{self.port}'
+
+    @property
+    def url(self) -> str:
+        scheme = 'https' if self.tls_cert_file else 'http'
+        return f'{scheme}://{self.netloc}'
+
+    def start(self) -> 'LocalRegistry':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def client(self, **kwargs) -> oc.Client:
+        """
+        oc.Client for this registry. The library always authenticates against https, so the auth
+        method is pre-set to basic auth and the routes point to the registry's own scheme.
+        """
+        routes = oc.OciRoutes(self._base_api_lookup)
+        kwargs.setdefault('default_backoff_base_seconds', 0.01)
+        kwargs.setdefault('session', tracing.TracedSession())
+        client = oc.Client(credentials_lookup=self._credentials_lookup, routes=routes, **kwargs)
+        client.token_cache.set_auth_method(
+            image_reference=f'{self.netloc}/any',
+            auth_method=oc.AuthMethod.BASIC,
+        )
+        # the registry is local: no proxies, and no CA bundle from the environment replacing verify
+        client.session.trust_env = False
+        if self.tls_cert_file:
+            client.session.verify = str(self.tls_cert_file)
+        return client
+
+    def async_client(self, session):
+        """
+        oci.client_async.Client for this registry using the given aiohttp.ClientSession (TLS
+        verification is configured on the session's connector)
+        """
+        import oci.client_async # aiohttp is only needed by the async fetcher
+        client = oci.client_async.Client(
+            credentials_lookup=self._credentials_lookup,
+            routes=oc.OciRoutes(self._base_api_lookup),
+            session=session,
+        )
+        client.token_cache.set_auth_method(
+            image_reference=f'{self.netloc}/any',
+            auth_method=oc.AuthMethod.BASIC,
+        )
+        return client
+
+    def _base_api_lookup(self, image_reference: str) -> str:
+        return f'{self.url}/v2/'
+
+    def _credentials_lookup(
+        self,
+        image_reference: str,
+        privileges: oa.Privileges=oa.Privileges.READONLY,
+        absent_ok: bool=True,
+    ):
+        if self.user_name and self.password:
+            return oa.OciBasicAuthCredentials(username=self.user_name, password=self.password)
+        return None
+
+    def repository(self, name: str) -> Repository:
+        with self._lock:
+            return self._repositories.setdefault(name, Repository(blobs=set(), manifests={}, tags={}))
+
+    def blob(self, name: str, digest: str) -> bytes | None:
+        with self._lock:
+            if (repo := self._repositories.get(name)) and digest in repo.blobs:
+                return self._blobs[digest]
+        return None
+
+    def store_blob(self, name: str, data: bytes) -> str:
+        digest = _digest(data)
+        repo = self.repository(name)
+        with self._lock:
+            self._blobs.setdefault(digest, data)
+            repo.blobs.add(digest)
+        return digest
+
+    def store_manifest(self, name: str, data: bytes, media_type: str, tag: str = None) -> str:
+        digest = _digest(data)
+        repo = self.repository(name)
+        with self._lock:
+            repo.manifests[digest] = (media_type, data)
+            if tag:
+                repo.tags[tag] = digest
+        return digest
+
+    def store_component_descriptor(self, name: str, cd: dict) -> str:
+        """
+        store a component-descriptor (as dict) like ocm does below the repository name, bypassing
+        http: faster for tests preparing thousands of descriptors
+        """
+        artifact = descriptor_artifact(cd)
+        cd_repo = f'{name}/component-descriptors/{cd["component"]["name"]}'
+        self.store_blob(cd_repo, artifact.layer)
+        self.store_blob(cd_repo, artifact.config)
+        return self.store_manifest(cd_repo, artifact.manifest, om.OCI_MANIFEST_SCHEMA_V2_MIME, cd['component']['version'])
+
+    def _inject_error(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return False
+            self.stats.errors_injected += 1
+            return True
+
+
+class _RegistryServer(http.server.ThreadingHTTPServer):
+
+    def handle_error(self, request, client_address):
+        # clients closing their keep-alive connections are not an error
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class _RegistryRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, clients reuse their connections
+    # headers and body are written separately, without TCP_NODELAY small responses wait for
+    # the delayed ack of the client
+    disable_nagle_algorithm = True
+    timeout = 60 # do not wait forever for incomplete request bodies
+
+    @property
+    def registry(self) -> LocalRegistry:
+        return self.server.registry
+
+    def setup(self):
+        super().setup()
+        with self.registry._lock:
+            self.registry.stats.connections += 1
+
+    def log_message(self, format, *args):
+        pass # do not spam the test output
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_HEAD(self):
+        self._handle('HEAD')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method: str):
+        registry = self.registry
+        with registry._lock:
+            registry.stats.requests += 1
+        if registry.latency_seconds:
+            time.sleep(registry.latency_seconds)
+
+        # always consume the body, the connection is kept open for the next request
+        body = self._read_body()
+        parsed = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(parsed.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+
+        if not self._authorized():
+            return self._send_error(401, 'UNAUTHORIZED', 'authentication required', headers={
+                'WWW-Authenticate': 'Basic realm="local-registry"',
+            })
+        if not body and registry._inject_error():
+            return self._send_error(503, 'UNAVAILABLE', 'injected error')
+
+        if path in ('/v2', '/v2/'):
+            return self._send(200, b'{}', content_type='application/json')
+        if path == '/v2/_catalog' and method == 'GET':
+            with registry._lock:
+                names = sorted(registry._repositories)
+            return self._send_json({'repositories': names})
+        if match := _UPLOAD_PATH.match(path):
+            return self._handle_upload(method, match['name'], match['upload_id'], query, body)
+        if match := _BLOB_PATH.match(path):
+            return self._handle_blob(method, match['name'], match['digest'])
+        if match := _MANIFEST_PATH.match(path):
+            return self._handle_manifest(method, match['name'], match['reference'], body)
+        if (match := _TAGS_PATH.match(path)) and method == 'GET':
+            return self._handle_tags(match['name'], query)
+        self._send_error(404, 'NAME_UNKNOWN', f'no route for {method} {path}')
+
+    def _authorized(self) -> bool:
+        registry = self.registry
+        if not registry.user_name:
+            return True
+        authorization = self.headers.get('Authorization', '')
+        if not authorization.startswith('Basic '):
+            return False
+        try:
+            credentials = base64.b64decode(authorization[len('Basic '):]).decode()
+        except ValueError:
+            return False
+        return credentials == f'{registry.user_name}:{registry.password}'
+
+    def _handle_blob(self, method: str, name: str, digest: str):
+        registry = self.registry
+        if method == 'DELETE':
+            with registry._lock:
+                repo = registry._repositories.get(name)
+                if not repo or digest not in repo.blobs:
+                    return self._send_error(404, 'BLOB_UNKNOWN', digest)
+                repo.blobs.discard(digest)
+            return self._send(202)
+        if method not in ('GET', 'HEAD'):
+            return self._send_error(405, 'UNSUPPORTED', method)
+        if (data := registry.blob(name, digest)) is None:
+            return self._send_error(404, 'BLOB_UNKNOWN', digest)
+
+        headers = {'Docker-Content-Digest': digest, 'Accept-Ranges': 'bytes'}
+        if (range_header := self.headers.get('Range')) and method == 'GET':
+            match = re.fullmatch(r'bytes=(\d+)-(\d*)', range_header)
+            start = int(match[1]) if match else 0
+            if not match or start >= len(data):
+                return self._send(416, headers={'Content-Range': f'bytes */{len(data)}'})
+            end = min(int(match[2]), len(data) - 1) if match[2] else len(data) - 1
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+            return self._send(206, data[start:end + 1], headers=headers)
+        self._send(200, data, headers=headers)
+
+    def _handle_upload(self, method: str, name: str, upload_id: str, query: dict, body: bytes):
+        registry = self.registry
+        if method == 'POST' and not upload_id:
+            if (mount := query.get('mount')) and (from_repo := query.get('from')):
+                if registry.blob(from_repo, mount) is not None:
+                    repo = registry.repository(name)
+                    with registry._lock:
+                        repo.blobs.add(mount)
+                    return self._send(201, headers={
+                        'Location': f'/v2/{name}/blobs/{mount}',
+                        'Docker-Content-Digest': mount,
+                    })
+            if digest := query.get('digest'):
+                return self._finish_upload(name, digest, bytearray(body))
+            upload_id = uuid.uuid4().hex
+            with registry._lock:
+                registry._uploads[upload_id] = (name, bytearray(body))
+            return self._send(202, headers=self._upload_headers(name, upload_id, len(body)))
+
+        with registry._lock:
+            upload_name, data = registry._uploads.get(upload_id, (None, None))
+        if upload_name != name:
+            return self._send_error(404, 'BLOB_UPLOAD_UNKNOWN', upload_id)
+
+        if method == 'GET':
+            return self._send(204, headers=self._upload_headers(name, upload_id, len(data)))
+        if method == 'DELETE':
+            with registry._lock:
+                registry._uploads.pop(upload_id, None)
+            return self._send(204)
+        if method == 'PATCH':
+            if content_range := self.headers.get('Content-Range'):
+                start = int(content_range.removeprefix('bytes=').split('-')[0])
+                if start != len(data):
+                    return self._send(416, headers=self._upload_headers(name, upload_id, len(data)))
+            data += body
+            return self._send(202, headers=self._upload_headers(name, upload_id, len(data)))
+        if method == 'PUT':
+            with registry._lock:
+                registry._uploads.pop(upload_id, None)
+            return self._finish_upload(name, query.get('digest'), data + body)
+        self._send_error(405, 'UNSUPPORTED', method)
+
+    def _finish_upload(self, name: str, digest: str, data: bytearray):
+        if not digest or _digest(data) != digest:
+            return self._send_error(400, 'DIGEST_INVALID', f'content does not match {digest}')
+        self.registry.store_blob(name, bytes(data))
+        self._send(201, headers={
+            'Location': f'/v2/{name}/blobs/{digest}',
+            'Docker-Content-Digest': digest,
+        })
+
+    @staticmethod
+    def _upload_headers(name: str, upload_id: str, size: int) -> dict:
+        return {
+            'Location': f'/v2/{name}/blobs/uploads/{upload_id}',
+            'Range': f'0-{max(size - 1, 0)}',
+            'Docker-Upload-UUID': upload_id,
+        }
+
+    def _handle_manifest(self, method: str, name: str, reference: str, body: bytes):
+        registry = self.registry
+        if method == 'PUT':
+            media_type = self.headers.get('Content-Type') or json.loads(body).get('mediaType')
+            if reference.startswith('sha256:') and reference != _digest(body):
+                return self._send_error(400, 'DIGEST_INVALID', reference)
+            tag = None if reference.startswith('sha256:') else reference
+            digest = registry.store_manifest(name, body, media_type, tag)
+            return self._send(201, headers={
+                'Location': f'/v2/{name}/manifests/{digest}',
+                'Docker-Content-Digest': digest,
+            })
+
+        with registry._lock:
+            repo = registry._repositories.get(name) or Repository(blobs=set(), manifests={}, tags={})
+            digest = reference if reference.startswith('sha256:') else repo.tags.get(reference)
+            media_type, content = repo.manifests.get(digest, (None, None))
+        if content is None:
+            return self._send_error(404, 'MANIFEST_UNKNOWN', reference)
+
+        if method == 'DELETE':
+            with registry._lock:
+                if reference.startswith('sha256:'):
+                    if digest in repo.tags.values():
+                        return self._send_error(409, 'DENIED', f'{digest} is still tagged')
+                    del repo.manifests[digest]
+                else:
+                    del repo.tags[reference]
+            return self._send(202)
+        if method not in ('GET', 'HEAD'):
+            return self._send_error(405, 'UNSUPPORTED', method)
+        self._send(
+            200,
+            content,
+            content_type=media_type,
+            headers={'Docker-Content-Digest': digest},
+        )
+
+    def _handle_tags(self, name: str, query: dict):
+        with self.registry._lock:
+            repo = self.registry._repositories.get(name)
+            tags = sorted(repo.tags) if repo else []
+        if not repo:
+            return self._send_error(404, 'NAME_UNKNOWN', name)
+        if last := query.get('last'):
+            tags = [t for t in tags if t > last]
+        headers = {}
+        if (n := int(query.get('n', 0))) and len(tags) > n:
+            tags = tags[:n]
+            next_query = urllib.parse.urlencode({'n': n, 'last': tags[-1]})
+            headers['Link'] = f'</v2/{name}/tags/list?{next_query}>; rel="next"'
+        self._send_json({'name': name, 'tags': tags}, headers=headers)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        chunks = []
+        while length > 0:
+            chunk = self.rfile.read(min(length, SEND_CHUNK_SIZE))
+            if not chunk:
+                break
+            self._throttle(len(chunk))
+            chunks.append(chunk)
+            length -= len(chunk)
+        body = b''.join(chunks)
+        with self.registry._lock:
+            self.registry.stats.bytes_received += len(body)
+        return body
+
+    def _throttle(self, size: int):
+        if bandwidth := self.registry.bandwidth_bytes_per_second:
+            time.sleep(size / bandwidth)
+
+    def _send_json(self, content: dict, headers: dict = None):
+        self._send(200, json.dumps(content).encode(), content_type='application/json', headers=headers)
+
+    def _send_error(self, status: int, code: str, message: str, headers: dict = None):
+        content = json.dumps({'errors': [{'code': code, 'message': message}]}).encode()
+        self._send(status, content, content_type='application/json', headers=headers)
+
+    def _send(
+        self,
+        status: int,
+        content: bytes = b'',
+        content_type: str = None,
+        headers: dict = None,
+    ):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return # Content-Length announces the size of the body a GET would return
+        for offset in range(0, len(content), SEND_CHUNK_SIZE):
+            chunk = content[offset:offset + SEND_CHUNK_SIZE]
+            self._throttle(len(chunk))
+            self.wfile.write(chunk)
+        with self.registry._lock:
+            self.registry.stats.bytes_sent += len(content)
@@ -1,10 +1,10 @@
+import concurrent.futures
 import datetime
 from enum import Enum, auto
 import gzip
 import hashlib
 import json
 from pathlib import Path
-import shutil
 import tarfile
 import sys
 
@@ -14,8 +14,53 @@ import oci.client as oc
 import gci.componentmodel as cm
 import requests
 
+import blob_upload
+import parallel_gzip
 import util
 
+# number of layers built and uploaded concurrently
+DEFAULT_MAX_WORKERS = 4
+# smaller layers are compressed sequentially even with compression_workers, a handful of blocks
+# do not pay for the thread pool
+PARALLEL_GZIP_MIN_BYTES = 4 * parallel_gzip.DEFAULT_BLOCK_SIZE
+
+
+class DigestingWriter:
+    """
+    Write-only file-like object computing sha256 digest and size of all data passed through
+    to the wrapped file object
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def digest(self) -> str:
+        return 'sha256:' + self.sha256.hexdigest()
+
+
+def _reproducible_tarinfo(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+    # strip metadata differing between builds, so that equal content yields equal layer digests
+    tarinfo.mtime = 0
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ''
+    return tarinfo
+
+
+def _dir_size(dir: Path) -> int:
+    # uncompressed size of the files of a layer
+    return sum(path.stat().st_size for path in dir.rglob('*') if path.is_file())
+
+
 class OciImageCreator:
     """
     Test helper class to create and upload OCI images for testing.
@@ -48,11 +93,23 @@ class OciImageCreator:
         self, client: oc.Client,
         image_ref: str,
         out_dir: str | Path,
-        style: Style = Style.DOCKER_STYLE
+        style: Style = Style.DOCKER_STYLE,
+        compression_level: int = 9,
+        compression_workers: int = 1,
+        upload_strategy: blob_upload.SizeBasedUpload = None,
+        blob_presence: blob_upload.BlobPresence = None,
     ):
         self.client = client
         self.image_ref = image_ref
         self.out_dir = Path(out_dir)
+        self.compression_level = compression_level
+        # more than one worker selects the block-parallel gzip compressor for layers of at least
+        # PARALLEL_GZIP_MIN_BYTES, its output does not depend on the number of workers
+        self.compression_workers = compression_workers
+        # any object with an upload method like the ones in blob_upload
+        self.upload_strategy = upload_strategy or blob_upload.SizeBasedUpload()
+        # shared by the creators of one (multi-arch) image upload, a new memo otherwise
+        self.blob_presence = blob_presence or blob_upload.BlobPresence()
         self.config_ref = None
         self.layer_digests = []
         self.blob_refs = []
@@ -79,22 +136,39 @@ class OciImageCreator:
         else:
             raise ValueError(f'Unknown Oci Image style {style}')
 
-    def _create_tar_and_digest_from_dir(self, dir: Path, tar_file: str | Path) -> tuple[str, int]:
-        temp_file = Path(tar_file).with_suffix('.tar')
-        with tarfile.open(temp_file, 'w') as tar:
-            for child in dir.iterdir():
-                tar.add(child, arcname=dir.name + '/' + child.name)
-
-        # create hash (we need uncompressed hash)
-        uncompressed_digest = self.file_digest(temp_file)
-
-        with open(temp_file, 'rb') as f_in:
-            with gzip.open(tar_file, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-
-        temp_file.unlink()
-
-        return uncompressed_digest
+    def _create_layer_from_dir(self, dir: Path, tgz_file: str | Path) -> tuple[str, int, str]:
+        """
+        create a gzip compressed tar file from dir in one pass, return digest and size of the
+        compressed file and the digest of the uncompressed tar (diff_id)
+        """
+        with open(tgz_file, 'wb') as f_out:
+            compressed = DigestingWriter(f_out)
+            with self._gzip_writer(compressed, _dir_size(dir)) as gz:
+                uncompressed = DigestingWriter(gz)
+                with tarfile.open(fileobj=uncompressed, mode='w|') as tar:
+                    for child in sorted(dir.iterdir()):
+                        tar.add(
+                            child,
+                            arcname=dir.name + '/' + child.name,
+                            filter=_reproducible_tarinfo,
+                        )
+
+        return compressed.digest(), compressed.size, uncompressed.digest()
+
+    def _gzip_writer(self, fileobj, size: int):
+        if self.compression_workers > 1 and size >= PARALLEL_GZIP_MIN_BYTES:
+            return parallel_gzip.ParallelGzipWriter(
+                fileobj,
+                compresslevel=self.compression_level,
+                max_workers=self.compression_workers,
+            )
+        # fixed mtime: the same content always results in the same digest
+        return gzip.GzipFile(
+            fileobj=fileobj,
+            mode='wb',
+            compresslevel=self.compression_level,
+            mtime=0,
+        )
 
     def file_digest(self, temp_file) -> str:
         py_version = sys.version_info
@@ -150,21 +224,23 @@ class OciImageCreator:
         self,
         file_name: Path | str,
         mimeType: str,
+        hex_digest: str = None,
+        size: int = None,
     ) -> om.OciBlobRef:
-
-        man_size = file_name.stat().st_size
-        hex_digest = self.file_digest(file_name)
-
-        # upload to OCI registry
-        with open(file_name, 'rb') as data_input:
-            self.client.put_blob(
-                image_reference=self.image_ref,
-                digest=hex_digest,
-                mimetype=mimeType,
-                data=data_input,
-                octets_count=man_size,
-                max_chunk=4096,
-            )
+        # digest and size can be passed if already known to avoid reading the file once more
+        man_size = size if size is not None else file_name.stat().st_size
+        if not hex_digest:
+            hex_digest = self.file_digest(file_name)
+
+        self.blob_presence.upload(
+            strategy=self.upload_strategy,
+            client=self.client,
+            image_reference=self.image_ref,
+            data=Path(file_name),
+            digest=hex_digest,
+            size=man_size,
+            mimetype=mimeType,
+        )
         return om.OciBlobRef(
             mediaType = mimeType,
             digest = hex_digest,
@@ -186,13 +262,14 @@ class OciImageCreator:
         size = len(data)
         hex_digest = self.bytes_digest(data)
 
-        # upload to OCI registry
-        self.client.put_blob(
+        self.blob_presence.upload(
+            strategy=self.upload_strategy,
+            client=self.client,
             image_reference=self.image_ref,
+            data=data,
             digest=hex_digest,
+            size=size,
             mimetype=mimeType,
-            data=data,
-            octets_count=size,
         )
 
         return om.OciBlobRef(
@@ -234,22 +311,56 @@ class OciImageCreator:
         create an image layer from a local directory and upload it as tgz blob, return the
         uncompressed sha256- hash
         """
-        tar_file_name = self.out_dir / 'layer.tgz'
-        uncompressed_digest = self._create_tar_and_digest_from_dir(dir, tar_file_name)
+        blob_ref, uncompressed_digest = self._create_and_upload_layer(dir, self.out_dir / 'layer.tgz')
+        self.blob_refs.append(blob_ref)
+        self.layer_digests.append(uncompressed_digest)
+        return (blob_ref, uncompressed_digest)
+
+
+    def create_and_upload_layers_from_dirs(
+        self,
+        dirs: list[Path],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        executor: concurrent.futures.Executor = None,
+    ) -> list[tuple[om.OciBlobRef, str]]:
+        """
+        create and upload one image layer per directory concurrently, the layers are added to
+        the image in the order of dirs. An executor shared by several images (e.g. the platforms
+        of a multi-arch image) bounds the concurrency of all their layer uploads, otherwise one
+        with max_workers threads is used.
+        """
+        if not executor:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return self.create_and_upload_layers_from_dirs(dirs, executor=executor)
+
+        futures = [
+            executor.submit(self._create_and_upload_layer, dir, self.out_dir / f'layer-{i}.tgz')
+            for i, dir in enumerate(dirs)
+        ]
+        layers = [future.result() for future in futures]
+
+        for blob_ref, uncompressed_digest in layers:
+            self.blob_refs.append(blob_ref)
+            self.layer_digests.append(uncompressed_digest)
+        return layers
+
+
+    def _create_and_upload_layer(self, dir: Path, tar_file_name: Path) -> tuple[om.OciBlobRef, str]:
+        digest, size, uncompressed_digest = self._create_layer_from_dir(dir, tar_file_name)
         print(f'File {tar_file_name} written')
         blob_ref = self._upload_blob_from_file(
             file_name=tar_file_name,
-            mimeType=self.image_layer_mime_type
+            mimeType=self.image_layer_mime_type,
+            hex_digest=digest,
+            size=size,
         )
-
-        self.blob_refs.append(blob_ref)
-        self.layer_digests.append(uncompressed_digest)
         tar_file_name.unlink()
         return (blob_ref, uncompressed_digest)
 
 
     def create_and_upload_manifest(
         self,
+        image_ref: str = None,
     ) -> tuple[requests.Response, om.OciImageManifest]:
         manifest = om.OciImageManifest(
             config = self.config_ref,
@@ -264,21 +375,25 @@ class OciImageCreator:
             f.write(manifest_str)
 
         response = self.client.put_manifest(
-            image_reference=self.image_ref,
+            image_reference=image_ref or self.image_ref,
             manifest=manifest_str.encode('utf-8'),
         )
 
         return response, manifest
 
-    def upload_architecture(self, platform: om.OciPlatform):
-        # safe current child manifest as blob:
-        _, manifest = self.create_and_upload_manifest()
-
+    def upload_architecture(self, platform: om.OciPlatform) -> om.OciImageManifestListEntry:
+        manifest = om.OciImageManifest(
+            config = self.config_ref,
+            layers = self.blob_refs,
+            mediaType = self.manifest_mime_type,
+        )
         manifest_bytes = json.dumps(manifest.as_dict()).encode('utf-8')
         size = len(manifest_bytes)
         hex_digest = self.bytes_digest(manifest_bytes)
 
-        self.create_and_upload_manifest()
+        # upload child manifest by digest, the tag is reserved for the multi-arch manifest
+        child_ref = f'{om.OciImageReference(self.image_ref).ref_without_tag}@{hex_digest}'
+        self.create_and_upload_manifest(image_ref=child_ref)
 
         # save next list entry for multi_arch:
         entry = om.OciImageManifestListEntry(
@@ -294,6 +409,7 @@ class OciImageCreator:
         self.blob_refs = []
 
         util.prepare_or_clean_dir(self.out_dir)
+        return entry
 
     def create_and_upload_multiarch_manifest(self):
         manifest = om.OciImageManifestList(
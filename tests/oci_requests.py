@@ -0,0 +1,66 @@
+# Registry requests oc.Client has no public api for
+
+import oci.client as oc
+import oci.model as om
+import requests
+
+# oc.Client has no public api for chunked uploads, ranged blob downloads, and put_blob always
+# sends a HEAD first. The private parts of oc.Client used by the upload strategies (blob_upload)
+# and the downloader (download_image) are confined to this module, both are tested against
+# LocalRegistry (test_local_registry.py, test_download_image.py), so that changes of the library
+# show up there.
+
+
+def _request(
+    client: oc.Client,
+    image_reference: om.OciImageReference,
+    url: str,
+    method: str,
+    action: str,
+    **kwargs,
+) -> requests.Response:
+    return client._request(
+        url=url,
+        image_reference=image_reference,
+        scope=f'repository:{image_reference.name}:{action}',
+        method=method,
+        **kwargs,
+    )
+
+
+def push_request(
+    client: oc.Client,
+    image_reference: om.OciImageReference,
+    url: str,
+    method: str,
+    **kwargs,
+) -> requests.Response:
+    return _request(client, image_reference, url, method, action='push,pull', **kwargs)
+
+
+def put_monolithic(client: oc.Client, image_reference: str, digest: str, size: int, data, mimetype: str):
+    client._put_blob_single_post(
+        image_reference=om.OciImageReference(image_reference),
+        digest=digest,
+        octets_count=size,
+        data=data,
+        mimetype=mimetype,
+    )
+
+
+def blob_from(client: oc.Client, image_reference: str, digest: str, offset: int = 0) -> requests.Response:
+    """
+    streamed GET of a blob from offset on (a range request), like oc.Client.blob the status is
+    not checked: a registry may answer 206, 200 (range ignored) or 416 (nothing left)
+    """
+    image_reference = om.OciImageReference(image_reference)
+    return _request(
+        client,
+        image_reference,
+        url=client.routes.blob_url(image_reference=image_reference, digest=digest),
+        method='GET',
+        action='pull',
+        headers={'Range': f'bytes={offset}-'} if offset else {},
+        stream=True,
+        raise_for_status=False,
+    )
@@ -1,7 +1,9 @@
 import dataclasses
 import os
 import pytest
-from pathlib import Path
+
+from local_registry import LocalRegistry
+
 
 @dataclasses.dataclass(frozen=True)
 class OcmTestContext:
@@ -30,6 +32,23 @@ def ctx():
     )
 
 
+def _with_ocm_config(test_config: str):
+    # ocm runs with a private HOME containing the .ocmconfig, so the user's own config is
+    # left alone and parallel test workers do not overwrite each other's configuration
+    # (imported here, util and ocmcli import this module)
+    import ocmcli
+    import util
+    ocm_home = util.get_ocm_home()
+    ocm_home.mkdir(parents=True, exist_ok=True)
+    config_file = ocm_home / '.ocmconfig'
+    with config_file.open('w') as f:
+        f.write(test_config)
+    ocmcli.ocm_home = ocm_home
+    yield None
+    ocmcli.ocm_home = None
+    config_file.unlink()
+
+
 @pytest.fixture(scope="module")
 def ocm_config(ctx):
     test_config = f'''\
@@ -46,20 +65,7 @@ configurations:
               username: {ctx.user_name}
               password: "{ctx.passwd}"
 '''
-    backup_file = Path(os.getenv('HOME')) / '.ocmconfig.bak'
-    config_file = Path(os.getenv('HOME')) / '.ocmconfig'
-    # backup .ocmconfig if it exists
-    if backup_file.exists():
-        backup_file.unlink()
-    if config_file.exists():
-        config_file.rename(backup_file)
-    with config_file.open('w') as f:
-        f.write(test_config)
-    yield None
-    # restore original .ocmconfig if it existed after tests are run
-    config_file.unlink()
-    if backup_file.exists():
-        backup_file.rename(config_file)
+    yield from _with_ocm_config(test_config)
 
 
 @pytest.fixture(scope="module")
@@ -78,17 +84,11 @@ def ocm_no_config(ctx):
 type: generic.config.ocm.software/v1
 configurations: []
 '''
-    backup_file = Path(os.getenv('HOME')) / '.ocmconfig.bak'
-    config_file = Path(os.getenv('HOME')) / '.ocmconfig'
-    # backup .ocmconfig if it exists
-    if backup_file.exists():
-        backup_file.unlink()
-    if config_file.exists():
-        config_file.rename(backup_file)
-    with config_file.open('w') as f:
-        f.write(test_config)
-    yield None
-    # restore original .ocmconfig if it existed after tests are run
-    config_file.unlink()
-    if backup_file.exists():
-        backup_file.rename(config_file)
+    yield from _with_ocm_config(test_config)
+
+
+@pytest.fixture
+def local_registry():
+    # in-process registry with basic auth, use registry.client() to talk to it
+    with LocalRegistry(user_name='ocmuser', password='ocmpasswd') as registry:
+        yield registry
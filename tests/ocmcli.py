@@ -5,28 +5,79 @@ from pathlib import Path
 import shutil
 import subprocess
 import sys
+import time
 from typing import Final
 import yaml
 
+import tracing
 import util
 
 class OcmCliException(Exception):
     pass
 
 
+@dataclass
+class CommandTiming:
+    args: str
+    seconds: float
+    returncode: int
+
+
+# every ocm invocation of this process, see timing_report()
+command_timings: list[CommandTiming] = []
+
+# if set, ocm runs with this HOME directory (and reads its .ocmconfig from there)
+ocm_home: Path | None = None
+
+
 def execute_ocm(args: str, **kwargs) -> subprocess.CompletedProcess:
     cmd = ['ocm']
     # to preserve quoted strings: re.findall(r'(\w+|".*?")', args)
     cmd.extend(args.split(' '))
     print(f'Running: {cmd}')
-    res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+    if ocm_home:
+        kwargs['env'] = {**kwargs.get('env', os.environ), 'HOME': str(ocm_home)}
+    start = time.perf_counter()
+    with tracing.tracer.span('ocm', args) as span:
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs)
+        span.exit_code = res.returncode
+    seconds = time.perf_counter() - start
+    command_timings.append(CommandTiming(args, seconds, res.returncode))
     print(res.stdout.decode())
+    print(f'ocm command took {seconds:.3f}s')
     if res.returncode != 0:
         raise OcmCliException(f'ocm command failed with return-code {res.returncode}, '
                               f'output: "{res.stdout.decode()}"')
     return res
 
 
+def get_ocm_version() -> str:
+    res = execute_ocm('--version')
+    return res.stdout.decode().strip()
+
+
+def measure_startup_seconds(runs: int = 3) -> float:
+    """
+    fastest of several 'ocm version' calls, approximates the fixed cost of one ocm process
+    """
+    seconds = []
+    for _ in range(runs):
+        execute_ocm('version')
+        seconds.append(command_timings[-1].seconds)
+    return min(seconds)
+
+
+def timing_report(timings: list[CommandTiming] = None, startup_seconds: float = None) -> str:
+    timings = command_timings if timings is None else timings
+    lines = [f'{t.seconds:8.3f}s  rc={t.returncode}  ocm {t.args}' for t in timings]
+    total = sum(t.seconds for t in timings)
+    lines.append(f'{total:8.3f}s  total for {len(timings)} ocm processes')
+    if startup_seconds is not None:
+        lines.append(f'{startup_seconds * len(timings):8.3f}s  estimated process startup overhead '
+                     f'({startup_seconds:.3f}s per process)')
+    return '\n'.join(lines)
+
+
 def get_version():
     version_file = util.get_root_dir() / 'VERSION'
     with open(version_file) as f:
@@ -51,6 +102,16 @@ def _tag_compatible_arch(arch: str) -> str:
     return arch.replace('/', '-')
 
 
+def invalidate_caches(repo: str):
+    """
+    component versions in repo may have been overwritten or added, forget all cached tag ->
+    digest mappings and existence checks of this repository
+    """
+    util.get_blob_cache().invalidate_tags(repo)
+    util.get_descriptor_memo().invalidate(repo)
+    util.get_exists_cache().invalidate(repo)
+
+
 @dataclass
 class ComponentVersionSpec:
     name: str
@@ -61,6 +122,56 @@ class ComponentVersionSpec:
     reference_file: str | Path | None = None
 
 
+class ComponentVersionBatch:
+    """
+    Collects the operations building one component version (create component archive, add
+    sources, resources and references, transfer to CTF) and runs them with a single
+    'ocm add componentversions' call instead of one ocm process per operation.
+    """
+
+    def __init__(self, comp_vers: ComponentVersionSpec):
+        self.component = {
+            'name': comp_vers.name,
+            'version': comp_vers.version,
+            'provider': {'name': comp_vers.provider},
+            'sources': [],
+            'resources': [],
+            'componentReferences': [],
+        }
+
+    @staticmethod
+    def _load_elements(file_name: str | Path, list_keys: tuple[str, ...]) -> list[dict]:
+        # element files contain one element per yaml document or a list under a plural key
+        elements = []
+        with open(file_name) as f:
+            for doc in yaml.safe_load_all(f):
+                if not doc:
+                    continue
+                for key in list_keys:
+                    if key in doc:
+                        elements.extend(doc[key])
+                        break
+                else:
+                    elements.append(doc)
+        return elements
+
+    def add_sources(self, file_name: str | Path):
+        self.component['sources'].extend(self._load_elements(file_name, ('sources',)))
+
+    def add_resources(self, file_name: str | Path):
+        self.component['resources'].extend(self._load_elements(file_name, ('resources',)))
+
+    def add_references(self, file_name: str | Path):
+        self.component['componentReferences'].extend(
+            self._load_elements(file_name, ('references', 'componentReferences'))
+        )
+
+    def run(self, ctf_dir: str | Path, spec_file: str | Path) -> subprocess.CompletedProcess:
+        with open(spec_file, 'w') as f:
+            yaml.safe_dump({'components': [self.component]}, f)
+        return execute_ocm(f'add componentversions --create --file {str(ctf_dir)} {str(spec_file)}')
+
+
 class OcmApplication:
     def __init__(
         self,
@@ -96,8 +207,10 @@ class OcmApplication:
     def get_commit(self) -> str | None:
         return self.get_setting(self.COMMIT)
 
-    def _generate_gen_dir(self, gen_name: str= 'gen'):
-        return util.get_root_dir() / gen_name / self.name
+    def _generate_gen_dir(self, gen_name: str | None = None):
+        # below the gen dir of the current test worker, optionally in a sub directory gen_name
+        gen_dir = util.get_gen_dir() / gen_name if gen_name else util.get_gen_dir()
+        return gen_dir / self.name
 
     def makedirs(self):
         os.makedirs(self.gen_dir, exist_ok=True)
@@ -108,7 +221,11 @@ class OcmApplication:
     def create_ctf_from_component_version(
         self,
         comp_vers: ComponentVersionSpec,
+        batched: bool = False,
     ):
+        if batched:
+            self._create_ctf_from_component_version_batched(comp_vers)
+            return
         if self.gen_ca_dir.exists():
             shutil.rmtree(self.gen_ca_dir)
         self.makedirs()
@@ -130,6 +247,24 @@ class OcmApplication:
         cmd_line = f'transfer componentarchive {str(self.gen_ca_dir)} {str(self.gen_ctf_dir)}'
         execute_ocm(cmd_line)
 
+    def _create_ctf_from_component_version_batched(
+        self,
+        comp_vers: ComponentVersionSpec,
+    ):
+        # no component archive is created, the component version goes directly into the ctf
+        self.makedirs()
+        if self.gen_ctf_dir.exists():
+            shutil.rmtree(self.gen_ctf_dir)
+        print(f'Generating transport archive in {self.gen_ctf_dir} (batched)')
+        batch = ComponentVersionBatch(comp_vers)
+        if comp_vers.source_file:
+            batch.add_sources(comp_vers.source_file)
+        if comp_vers.resource_file:
+            batch.add_resources(comp_vers.resource_file)
+        if comp_vers.reference_file:
+            batch.add_references(comp_vers.reference_file)
+        batch.run(self.gen_ctf_dir, self.gen_dir / 'component-batch.yaml')
+
     def create_ctf_from_spec(
         self,
         components_file_name: str = 'components.yaml',
@@ -207,6 +342,7 @@ class OcmApplication:
         cmd_line += f'{str(self.gen_ctf_dir)} {self.ocm_repo}'
 
         execute_ocm(cmd_line)
+        invalidate_caches(self.ocm_repo)
 
 
     def transport(
@@ -233,6 +369,7 @@ class OcmApplication:
         cmd_line += f'{source_comp} {target_repo}'
 
         execute_ocm(cmd_line)
+        invalidate_caches(target_repo)
 
     def pack(self, force: bool):
         target_dir = self.gen_dir / 'ctf-full'
@@ -273,6 +410,9 @@ class OcmApplication:
             cmd_line += ' ' + str(self.gen_ctf_dir)
 
         execute_ocm(cmd_line)
+        if remote:
+            # signing updates the component-descriptors in place
+            invalidate_caches(self.ocm_repo)
 
 
     def verify(
@@ -0,0 +1,104 @@
+# Block-parallel gzip compression (pigz style) using zlib and a thread pool
+
+import collections
+import concurrent.futures
+import os
+import struct
+import zlib
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+# deflate back-references reach at most 32 KiB back
+DICT_SIZE = 32 * 1024
+
+
+def _compress_block(block: bytes, zdict: bytes, level: int, last: bool) -> bytes:
+    if zdict:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, zdict,
+        )
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(block)
+    # a sync flush ends the block on a byte boundary so the next block can be appended
+    return data + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ParallelGzipWriter:
+    """
+    Write-only file-like object producing a single gzip member, the input is split into blocks
+    which are raw-deflated concurrently (zlib releases the GIL while compressing). Every block is
+    primed with the last 32 KiB of its predecessor, so the compression ratio is close to the one
+    of a sequential compressor. The output can be read by any gzip implementation.
+    """
+
+    def __init__(
+        self,
+        fileobj,
+        compresslevel: int = 9,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        max_workers: int = None,
+    ):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        max_workers = max_workers or os.cpu_count()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # limits memory usage: at most this many compressed blocks are waiting to be written
+        self._max_pending = 2 * max_workers
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+        self._zdict = b''
+        self._crc = 0
+        self._size = 0
+        self._closed = False
+        self._write_header()
+
+    def write(self, data: bytes) -> int:
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit(block, last=False)
+        return len(data)
+
+    def flush(self):
+        pass # blocks are written as soon as they are compressed
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._submit(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+        self.fileobj.write(struct.pack('<II', self._crc & 0xffffffff, self._size & 0xffffffff))
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self._executor.shutdown(cancel_futures=True)
+        else:
+            self.close()
+
+    def _write_header(self):
+        if self.compresslevel >= 9:
+            extra_flags = 2 # maximum compression
+        elif self.compresslevel == 1:
+            extra_flags = 4 # fastest compression
+        else:
+            extra_flags = 0
+        # magic, deflate, no flags, mtime 0, extra flags, os unknown
+        self.fileobj.write(b'\x1f\x8b\x08\x00' + struct.pack('<I', 0) + bytes([extra_flags, 255]))
+
+    def _submit(self, block: bytes, last: bool):
+        future = self._executor.submit(_compress_block, block, self._zdict, self.compresslevel, last)
+        self._zdict = (self._zdict + block)[-DICT_SIZE:]
+        self._pending.append(future)
+        while len(self._pending) > self._max_pending:
+            self.fileobj.write(self._pending.popleft().result())
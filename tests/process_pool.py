@@ -0,0 +1,20 @@
+# Process pools for CPU bound work, safe to start from processes running threads
+
+import concurrent.futures
+import multiprocessing
+
+# a forked child inherits locks held by other threads of the parent (client pools, tracing,
+# pytest-xdist), workers are forked from a clean fork server instead, or spawned where there is none
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def process_pool(max_workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    ProcessPoolExecutor with max_workers processes that do not inherit the parent's state: every
+    worker imports the module of the submitted function again, which costs about 0.5s for the
+    modules of these tests. Only worth it for work that takes considerably longer.
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(_START_METHOD),
+    )
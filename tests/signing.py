@@ -0,0 +1,612 @@
+# Signing and verification of component-descriptor signatures in python, without spawning the ocm CLI
+
+import base64
+import collections.abc
+import concurrent.futures
+import copy
+from dataclasses import dataclass, field
+import datetime
+import functools
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+import threading
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, utils
+from cryptography import x509
+from filelock import FileLock
+import yaml
+
+from cd_tools import DEFAULT_MAX_WORKERS, ComponentVersion, OciFetcher, extra_identities
+from ctf import CtfReader
+from process_pool import process_pool
+
+NORMALISATION_V1 = 'jsonNormalisation/v1'
+NORMALISATION_V2 = 'jsonNormalisation/v2'
+HASH_ALGORITHM = 'SHA-256'
+RSA_PKCS1_V15 = 'RSASSA-PKCS1-V1_5'
+RSA_PSS = 'RSASSA-PSS'
+PEM_MEDIA_TYPE = 'application/x-pem-file'
+
+# normalising and rsa are CPU bound: one process per core
+DEFAULT_VERIFY_WORKERS = os.cpu_count() or 1
+# measured: a worker process needs ~0.5s to start (importing this module, in parallel with the
+# other workers), normalising a descriptor with a resource and a reference ~0.09ms, an rsa-2048
+# signature check adds ~0.6ms (only the root carries one)
+POOL_START_SECONDS = 0.5
+DIGEST_TASK_SECONDS = 0.0001
+
+
+def pool_break_even(workers: int) -> int:
+    # a pool pays when the work taken over by the other workers exceeds their start, i.e. from
+    # ~6700 descriptors with 4 workers: graphs of the integration tests are normalised inline
+    if workers < 2:
+        return 0 # no pool anyway
+    return math.ceil(POOL_START_SECONDS / (DIGEST_TASK_SECONDS * (1 - 1 / workers)))
+
+
+# a few hundred bytes each: the cache file stays below a few MiB
+DEFAULT_DIGEST_CACHE_ENTRIES = 10000
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# (descriptor digest, descriptor) of a component version
+DescriptorLookup = collections.abc.Callable[[str, str], tuple[str, dict]]
+
+
+def registry_lookup(fetcher: OciFetcher) -> DescriptorLookup:
+    def lookup(name: str, version: str) -> tuple[str, dict]:
+        # the plain yaml: the component model drops fields relevant for signing (e.g. label flags)
+        cd_yaml = fetcher.get_component_descriptor_from_registry(name, version, as_yaml=True)
+        return 'sha256:' + hashlib.sha256(cd_yaml.encode()).hexdigest(), yaml.load(cd_yaml, Loader=_Loader)
+    return lookup
+
+
+def ctf_lookup(reader: CtfReader) -> DescriptorLookup:
+    def lookup(name: str, version: str) -> tuple[str, dict]:
+        return reader.descriptor_layer(name, version)['digest'], reader.component_descriptor_dict(name, version)
+    return lookup
+
+
+def _signing_labels(element: dict):
+    # only labels flagged for signing are part of the digest
+    if labels := [l for l in element.get('labels') or [] if l.get('signing')]:
+        element['labels'] = [{k: v for k, v in l.items() if k != 'version' or v} for l in labels]
+    else:
+        element.pop('labels', None)
+
+
+def _normalised_element(element: dict, excluded: tuple[str, ...]) -> dict:
+    element = {k: v for k, v in element.items() if k not in excluded}
+    _signing_labels(element)
+    # the ocm CLI normalises an empty extra identity to null
+    element['extraIdentity'] = element.get('extraIdentity') or None
+    return element
+
+
+def _normalised_resources(resources: list[dict]) -> list[dict]:
+    normalised = []
+    identities = extra_identities((r['name'], r.get('extraIdentity'), r.get('version')) for r in resources)
+    for resource, extra_identity in zip(resources, identities):
+        # resources not unique by name and extra identity get their version added
+        if extra_identity != (resource.get('extraIdentity') or {}):
+            resource = {**resource, 'extraIdentity': extra_identity}
+
+        has_access = (resource.get('access') or {}).get('type') not in (None, 'None', 'none')
+        resource = _normalised_element(resource, excluded=('access', 'srcRefs'))
+        if not has_access:
+            resource.pop('digest', None)
+        elif not resource.get('digest'):
+            raise ValueError(f'resource {resource["name"]} has no digest, the component version is not signed')
+        normalised.append(resource)
+    return normalised
+
+
+def normalised_component_descriptor(
+    cd: dict,
+    reference_digests: dict[ComponentVersion, dict] = None,
+) -> dict:
+    """
+    The component-descriptor reduced to what is signed, as done by the ocm CLI: repository
+    contexts, sources, accesses and signatures are dropped, only labels flagged for signing are
+    kept. References without digest get theirs from reference_digests (digest specs by component
+    version), they have to be computed before.
+    """
+    component = cd['component']
+    normalised = {
+        k: v for k, v in component.items()
+        if k not in ('repositoryContexts', 'sources', 'componentReferences', 'resources')
+    }
+    _signing_labels(normalised)
+    if creation_time := normalised.pop('creationTime', None):
+        # the ocm CLI drops (rounds) fractions of seconds
+        creation_time = datetime.datetime.fromisoformat(str(creation_time).replace('Z', '+00:00'))
+        if creation_time.microsecond >= 500000:
+            creation_time += datetime.timedelta(seconds=1)
+        normalised['creationTime'] = creation_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    references = []
+    for ref in component.get('componentReferences') or []:
+        ref = _normalised_element(ref, excluded=())
+        if not ref.get('digest'):
+            cv = ComponentVersion(name=ref['componentName'], version=ref['version'])
+            ref['digest'] = reference_digests[cv]
+        references.append(ref)
+    normalised['componentReferences'] = references
+    normalised['resources'] = _normalised_resources(component.get('resources') or [])
+    return {'meta': copy.deepcopy(cd['meta']), 'component': normalised}
+
+
+def _entries_v1(obj):
+    # jsonNormalisation/v1: maps become lists of single entry maps, sorted by key
+    if isinstance(obj, dict):
+        return [{k: _entries_v1(v)} for k, v in sorted(obj.items())]
+    if isinstance(obj, list):
+        return [_entries_v1(v) for v in obj]
+    return obj
+
+
+def _without_nulls(obj):
+    if isinstance(obj, dict):
+        return {k: _without_nulls(v) for k, v in obj.items() if v is not None}
+    if isinstance(obj, list):
+        return [_without_nulls(v) for v in obj]
+    return obj
+
+
+def normalise(cd: dict, algorithm: str, reference_digests: dict[ComponentVersion, dict] = None) -> bytes:
+    normalised = normalised_component_descriptor(cd, reference_digests)
+    if algorithm == NORMALISATION_V1:
+        return json.dumps(_entries_v1(normalised), separators=(',', ':')).encode()
+    if algorithm == NORMALISATION_V2:
+        # canonical json (JCS, RFC 8785): sorted keys, no whitespace, no null values
+        return json.dumps(
+            _without_nulls(normalised), sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+        ).encode()
+    raise ValueError(f'unsupported normalisation algorithm {algorithm}')
+
+
+def descriptor_digest(cd: dict, algorithm: str, reference_digests: dict[ComponentVersion, dict] = None) -> str:
+    return hashlib.sha256(normalise(cd, algorithm, reference_digests)).hexdigest()
+
+
+def digest_spec(algorithm: str, value: str) -> dict:
+    return {'hashAlgorithm': HASH_ALGORITHM, 'normalisationAlgorithm': algorithm, 'value': value}
+
+
+def find_signature(cd: dict, signature_name: str) -> dict | None:
+    return next((s for s in cd.get('signatures') or [] if s['name'] == signature_name), None)
+
+
+@functools.lru_cache
+def _public_key(public_key_pem: bytes):
+    if b'CERTIFICATE' in public_key_pem:
+        return x509.load_pem_x509_certificate(public_key_pem).public_key()
+    return serialization.load_pem_public_key(public_key_pem)
+
+
+def _signature_bytes(signature_spec: dict) -> bytes:
+    value = signature_spec['value']
+    if signature_spec.get('mediaType') != PEM_MEDIA_TYPE:
+        return bytes.fromhex(value)
+    # -----BEGIN SIGNATURE-----, optional headers, blank line, base64, -----END SIGNATURE-----
+    body = value.split('-----BEGIN SIGNATURE-----')[1].split('-----END SIGNATURE-----')[0].strip()
+    if '\n\n' in body:
+        body = body.split('\n\n', 1)[1]
+    return base64.b64decode(''.join(body.split()))
+
+
+def check_signature(signature: dict, digest: str, public_key_pem: bytes) -> str | None:
+    """returns why the signature is invalid, None if it is valid"""
+    if signature['digest']['value'] != digest:
+        return f'digest mismatch: signed {signature["digest"]["value"]}, computed {digest}'
+    algorithm = signature['signature']['algorithm']
+    if algorithm == RSA_PKCS1_V15:
+        signature_padding = padding.PKCS1v15()
+    elif algorithm == RSA_PSS:
+        signature_padding = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.AUTO)
+    else:
+        return f'unsupported signature algorithm {algorithm}'
+    try:
+        _public_key(public_key_pem).verify(
+            _signature_bytes(signature['signature']),
+            bytes.fromhex(digest),
+            signature_padding,
+            utils.Prehashed(hashes.SHA256()),
+        )
+    except InvalidSignature:
+        return 'signature verification failed'
+    return None
+
+
+@dataclass
+class DigestReport:
+    reused: int = 0
+    recomputed: int = 0
+
+    def __str__(self):
+        return f'{self.reused} digests reused, {self.recomputed} recomputed'
+
+
+def descriptor_content_digest(cd: dict) -> str:
+    # for descriptors in memory, signatures do not change the normalised digest
+    content = json.dumps({k: v for k, v in cd.items() if k != 'signatures'}, sort_keys=True, default=str)
+    return 'sha256:' + hashlib.sha256(content.encode()).hexdigest()
+
+
+class DigestCache:
+    """
+    Normalised digests keyed by component version, descriptor digest and normalisation. Between
+    builds usually only the root component changes, the descriptors of its references are not
+    normalised again when signing or verifying. Digests taken for references without recorded
+    digest are part of the normalised descriptor, so they are part of the key as well.
+    If a path is given, the digests are loaded from and saved to this json file, which keeps the
+    max_entries most recently used digests.
+    """
+
+    def __init__(self, path: str | Path = None, max_entries: int = DEFAULT_DIGEST_CACHE_ENTRIES):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.report = DigestReport()
+        self._digests: dict[str, str] = {}
+        self._used: dict[str, str] = {} # got or put in this session, in order of use
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            self._digests = json.loads(self.path.read_text())
+
+    @staticmethod
+    def key(
+        cv: ComponentVersion,
+        descriptor_digest: str,
+        algorithm: str,
+        reference_digests: dict[ComponentVersion, dict] = None,
+    ) -> str:
+        key = f'{cv.name}:{cv.version}:{descriptor_digest}:{algorithm}'
+        if reference_digests:
+            references = sorted(f'{r.name}:{r.version}:{spec["value"]}' for r, spec in reference_digests.items())
+            key += ':' + hashlib.sha256(','.join(references).encode()).hexdigest()
+        return key
+
+    def get(
+        self,
+        cv: ComponentVersion,
+        descriptor_digest: str,
+        algorithms: dict[str, dict[ComponentVersion, dict] | None],
+    ) -> dict[str, str] | None:
+        """
+        digests of a descriptor for all algorithms (mapped to the reference digests for this
+        algorithm), None unless all of them are cached: the descriptor has to be normalised anyway
+        """
+        keys = {a: self.key(cv, descriptor_digest, a, references) for a, references in algorithms.items()}
+        with self._lock:
+            if not all(key in self._digests for key in keys.values()):
+                return None
+            for key in keys.values():
+                self._use(key, self._digests[key])
+            self.report.reused += len(keys)
+            return {a: self._digests[key] for a, key in keys.items()}
+
+    def put(
+        self,
+        cv: ComponentVersion,
+        descriptor_digest: str,
+        algorithm: str,
+        digest: str,
+        reference_digests: dict[ComponentVersion, dict] = None,
+    ):
+        key = self.key(cv, descriptor_digest, algorithm, reference_digests)
+        with self._lock:
+            self._digests[key] = digest
+            self._use(key, digest)
+            self.report.recomputed += 1
+
+    def _use(self, key: str, digest: str):
+        # moved to the end, the most recently used
+        self._used.pop(key, None)
+        self._used[key] = digest
+
+    def save(self):
+        if not self.path or not self._used:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, FileLock(self.path.with_name(self.path.name + '.lock')):
+            # merged with what other test workers saved in the meantime, the digests used in this
+            # session become the most recent ones, the least recently used are dropped
+            digests = json.loads(self.path.read_text()) if self.path.exists() else {}
+            for key, digest in self._used.items():
+                digests.pop(key, None)
+                digests[key] = digest
+            digests = dict(list(digests.items())[-self.max_entries:])
+            tmp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+            tmp_path.write_text(json.dumps(digests))
+            os.replace(tmp_path, self.path)
+
+
+def _private_key(private_key_file: str | Path):
+    with open(private_key_file, 'rb') as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+
+def create_signature(
+    private_key,
+    digest: str,
+    signature_name: str,
+    algorithm: str = NORMALISATION_V1,
+    scheme: str = RSA_PKCS1_V15,
+) -> dict:
+    if scheme == RSA_PSS:
+        signature_padding = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+    elif scheme == RSA_PKCS1_V15:
+        signature_padding = padding.PKCS1v15()
+    else:
+        raise ValueError(f'unsupported signature algorithm {scheme}')
+    value = private_key.sign(bytes.fromhex(digest), signature_padding, utils.Prehashed(hashes.SHA256()))
+    return {
+        'name': signature_name,
+        'digest': digest_spec(algorithm, digest),
+        'signature': {'algorithm': scheme, 'value': value.hex(), 'mediaType': 'application/vnd.ocm.signature.rsa'},
+    }
+
+
+def sign_component_descriptors(
+    cds: list[dict],
+    private_key_file: str | Path,
+    signature_name: str,
+    algorithm: str = NORMALISATION_V1,
+    scheme: str = RSA_PKCS1_V15,
+    cache: DigestCache = None,
+) -> DigestReport:
+    """
+    Like 'ocm sign componentversion --recursive' for descriptors in memory (modified in place),
+    e.g. to be written with ctf.write_ctf: cds are ordered leaves first, references get the
+    digests of the referenced descriptors and the last one (root) is signed. With a cache only
+    descriptors that changed are normalised.
+    """
+    report = DigestReport()
+    digests = {}
+    for cd in cds:
+        cv = ComponentVersion(name=cd['component']['name'], version=cd['component']['version'])
+        for ref in cd['component'].get('componentReferences') or []:
+            ref_cv = ComponentVersion(name=ref['componentName'], version=ref['version'])
+            ref['digest'] = digest_spec(algorithm, digests[ref_cv])
+        content_digest = descriptor_content_digest(cd) if cache else None
+        if cache and (cached := cache.get(cv, content_digest, {algorithm: None})):
+            digest = cached[algorithm]
+            report.reused += 1
+        else:
+            digest = descriptor_digest(cd, algorithm)
+            report.recomputed += 1
+            if cache:
+                cache.put(cv, content_digest, algorithm, digest)
+        digests[cv] = digest
+
+    root = cds[-1]
+    root_cv = ComponentVersion(name=root['component']['name'], version=root['component']['version'])
+    signature = create_signature(_private_key(private_key_file), digests[root_cv], signature_name, algorithm, scheme)
+    root['signatures'] = [s for s in root.get('signatures') or [] if s['name'] != signature_name] + [signature]
+    return report
+
+
+@dataclass(frozen=True)
+class _DigestTask:
+    cv: ComponentVersion
+    descriptor_digest: str
+    cd: dict
+    algorithms: tuple[str, ...]
+    reference_digests: dict # ComponentVersion -> {algorithm: digest spec}, only for references without digest
+    signature: dict | None
+
+    def references(self, algorithm: str) -> dict[ComponentVersion, dict]:
+        return {cv: specs[algorithm] for cv, specs in self.reference_digests.items()}
+
+
+def _run_digest_task(task: _DigestTask, public_key_pem: bytes) -> tuple[dict[str, str], str | None]:
+    # runs in the worker processes
+    digests = {
+        algorithm: descriptor_digest(task.cd, algorithm, task.references(algorithm))
+        for algorithm in task.algorithms
+    }
+    return digests, _check_task_signature(task, digests, public_key_pem)
+
+
+def _check_task_signature(task: _DigestTask, digests: dict[str, str], public_key_pem: bytes) -> str | None:
+    if not task.signature:
+        return None
+    return check_signature(task.signature, digests[task.signature['digest']['normalisationAlgorithm']], public_key_pem)
+
+
+@dataclass
+class VerificationResult:
+    root: ComponentVersion
+    signature_name: str
+    digests: dict[ComponentVersion, dict[str, str]] = field(default_factory=dict) # normalisation -> digest
+    verified: set[ComponentVersion] = field(default_factory=set) # carrying a valid signature
+    errors: dict[ComponentVersion, str] = field(default_factory=dict)
+    digest_report: DigestReport = field(default_factory=DigestReport)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and self.root in self.verified
+
+    def report(self) -> str:
+        lines = [
+            f'{len(self.digests)} component versions, {len(self.verified)} valid signatures '
+            f'{self.signature_name}, {self.digest_report}'
+        ]
+        lines += [f'{cv.name}:{cv.version}: {error}' for cv, error in sorted(
+            self.errors.items(), key=lambda item: (item[0].name, item[0].version),
+        )]
+        return '\n'.join(lines)
+
+
+def fetch_descriptor_graph(
+    lookup: DescriptorLookup,
+    name: str,
+    version: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> dict[ComponentVersion, tuple[str, dict]]:
+    graph = {}
+    requested = {ComponentVersion(name=name, version=version)}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(lookup, name, version): ComponentVersion(name, version)}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                cv = pending.pop(future)
+                graph[cv] = future.result()
+                for ref in graph[cv][1]['component'].get('componentReferences') or []:
+                    ref_cv = ComponentVersion(name=ref['componentName'], version=ref['version'])
+                    if ref_cv not in requested:
+                        requested.add(ref_cv)
+                        pending[executor.submit(lookup, ref_cv.name, ref_cv.version)] = ref_cv
+    return graph
+
+
+def _references(cd: dict) -> list[tuple[ComponentVersion, dict | None]]:
+    return [
+        (ComponentVersion(name=ref['componentName'], version=ref['version']), ref.get('digest'))
+        for ref in cd['component'].get('componentReferences') or []
+    ]
+
+
+class SignatureVerifier:
+    """
+    Verifies a signed component version and its reference closure like 'ocm verify
+    componentversion': the descriptor graph is fetched once, the normalised digests of all
+    descriptors are computed and the rsa signatures checked, in a process pool for graphs with
+    at least min_pool_tasks descriptors to normalise at once. Digests recorded in component
+    references are compared with the digests computed for the referenced descriptors. Digests
+    of resources are taken as recorded, artifacts are not downloaded.
+    Descriptors whose digests are in the digest cache are not normalised again, tests share
+    util.get_digest_cache().
+    """
+
+    def __init__(
+        self,
+        lookup: DescriptorLookup,
+        public_key_file: str,
+        cache: DigestCache,
+        max_workers: int = DEFAULT_VERIFY_WORKERS,
+        min_pool_tasks: int = None,
+    ):
+        self.lookup = lookup
+        with open(public_key_file, 'rb') as f:
+            self.public_key_pem = f.read()
+        self.max_workers = max_workers
+        self.cache = cache
+        # measured break-even unless given
+        self.min_pool_tasks = min_pool_tasks if min_pool_tasks is not None else pool_break_even(max_workers)
+
+    def verify(self, name: str, version: str, signature_name: str) -> VerificationResult:
+        root = ComponentVersion(name=name, version=version)
+        result = VerificationResult(root=root, signature_name=signature_name)
+        graph = fetch_descriptor_graph(self.lookup, name, version)
+        algorithms = self._algorithms(graph, root, signature_name)
+
+        executor = None
+        remaining = set(graph)
+        try:
+            while remaining:
+                # references without recorded digest need the digest of the referenced descriptor
+                ready = [
+                    cv for cv in remaining
+                    if all(ref_cv in result.digests for ref_cv, digest in _references(graph[cv][1]) if not digest)
+                ]
+                if not ready:
+                    raise ValueError(f'cyclic component references between {sorted(remaining, key=str)}')
+                tasks = [self._task(cv, graph, algorithms, signature_name, result) for cv in ready]
+                todo = []
+                for task in tasks:
+                    digests = self.cache.get(
+                        task.cv, task.descriptor_digest, {a: task.references(a) for a in task.algorithms},
+                    )
+                    if digests:
+                        # the signature check itself is cheap, done again
+                        self._record(task, (digests, _check_task_signature(task, digests, self.public_key_pem)), result)
+                        result.digest_report.reused += len(digests)
+                    else:
+                        todo.append(task)
+                if len(todo) >= max(self.min_pool_tasks, 2) and self.max_workers > 1 and not executor:
+                    executor = process_pool(max_workers=min(self.max_workers, len(todo)))
+                if executor:
+                    outcomes = executor.map(_run_digest_task, todo, [self.public_key_pem] * len(todo))
+                else:
+                    outcomes = (_run_digest_task(task, self.public_key_pem) for task in todo)
+                for task, outcome in zip(todo, outcomes):
+                    for algorithm, digest in outcome[0].items():
+                        self.cache.put(task.cv, task.descriptor_digest, algorithm, digest, task.references(algorithm))
+                    result.digest_report.recomputed += len(outcome[0])
+                    self._record(task, outcome, result)
+                remaining -= set(ready)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        for cv, (_, cd) in graph.items():
+            for ref_cv, digest in _references(cd):
+                if digest and result.digests[ref_cv].get(digest['normalisationAlgorithm']) != digest['value']:
+                    result.errors.setdefault(cv, f'digest of reference {ref_cv.name}:{ref_cv.version} does not match')
+        if root not in result.verified and root not in result.errors:
+            result.errors[root] = f'no signature {signature_name}'
+        return result
+
+    @staticmethod
+    def _algorithms(
+        graph: dict[ComponentVersion, tuple[str, dict]],
+        root: ComponentVersion,
+        signature_name: str,
+    ) -> dict[ComponentVersion, set[str]]:
+        # normalisations to compute per descriptor: the one of its signature, the ones recorded in
+        # references to it and, for references without digest, the ones of the referencing one
+        algorithms = collections.defaultdict(set)
+        for cv, (_, cd) in graph.items():
+            if signature := find_signature(cd, signature_name):
+                algorithms[cv].add(signature['digest']['normalisationAlgorithm'])
+            for ref_cv, digest in _references(cd):
+                if digest:
+                    algorithms[ref_cv].add(digest['normalisationAlgorithm'])
+        if not algorithms[root]:
+            algorithms[root].add(NORMALISATION_V1)
+        changed = True
+        while changed:
+            changed = False
+            for cv, (_, cd) in graph.items():
+                for ref_cv, digest in _references(cd):
+                    if not digest and not algorithms[cv] <= algorithms[ref_cv]:
+                        algorithms[ref_cv] |= algorithms[cv]
+                        changed = True
+        return algorithms
+
+    @staticmethod
+    def _task(
+        cv: ComponentVersion,
+        graph: dict[ComponentVersion, tuple[str, dict]],
+        algorithms: dict[ComponentVersion, set[str]],
+        signature_name: str,
+        result: VerificationResult,
+    ) -> _DigestTask:
+        descriptor_digest, cd = graph[cv]
+        return _DigestTask(
+            cv=cv,
+            descriptor_digest=descriptor_digest,
+            cd=cd,
+            algorithms=tuple(sorted(algorithms[cv] or {NORMALISATION_V1})),
+            reference_digests={
+                ref_cv: {a: digest_spec(a, d) for a, d in result.digests[ref_cv].items()}
+                for ref_cv, digest in _references(cd) if not digest
+            },
+            signature=find_signature(cd, signature_name),
+        )
+
+    @staticmethod
+    def _record(task: _DigestTask, outcome: tuple[dict[str, str], str | None], result: VerificationResult):
+        digests, error = outcome
+        result.digests[task.cv] = digests
+        if error:
+            result.errors[task.cv] = error
+        elif task.signature:
+            result.verified.add(task.cv)
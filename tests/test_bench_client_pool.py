@@ -0,0 +1,106 @@
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from bench_results import BenchmarkRecorder
+import blob_upload
+import client_pool
+from local_registry import LocalRegistry, create_self_signed_cert
+import util
+
+pytestmark = [
+    pytest.mark.benchmark,
+    pytest.mark.skipif(not shutil.which('openssl'), reason='openssl not available'),
+]
+
+# a test like test_transport.do_transport_and_get_cd: three helpers, each looking up content
+HELPER_CALLS = 3
+BLOBS = 8
+REPEAT = int(os.getenv('BENCH_REPEAT', 3))
+
+
+@pytest.fixture(scope='module')
+def tls_registry():
+    cert_dir = util.get_gen_dir() / 'client-pool-tls'
+    cert_file, key_file = create_self_signed_cert(cert_dir)
+    with LocalRegistry(
+        user_name='ocmuser',
+        password='ocmpasswd',
+        tls_cert_file=cert_file,
+        tls_key_file=key_file,
+    ) as registry:
+        yield registry
+    shutil.rmtree(cert_dir)
+
+
+@pytest.fixture(scope='module')
+def recorder():
+    recorder = BenchmarkRecorder('oci-client-pool', 'local-registry')
+    yield recorder
+    if recorder.results:
+        recorder.write()
+
+
+def _helper(client, image_ref: str, digests: list[str]):
+    for digest in digests:
+        assert client.head_blob(image_ref, digest).ok
+        client.blob(image_ref, digest, stream=False)
+
+
+def _store_blobs(registry: LocalRegistry, image_ref: str) -> list[str]:
+    client = registry.client()
+    digests = []
+    for _ in range(BLOBS):
+        data = os.urandom(64 * 1024)
+        digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+        blob_upload.MonolithicUpload().upload(client, image_ref, data, digest, len(data), 'application/octet-stream')
+        digests.append(digest)
+    client.session.close()
+    return digests
+
+
+def test_connections_per_test(tls_registry: LocalRegistry, recorder: BenchmarkRecorder):
+    image_ref = f'{tls_registry.netloc}/bench/pool:0.1.0'
+    digests = _store_blobs(tls_registry, image_ref)
+
+    def fresh_clients():
+        # before: every helper created its own client and session
+        for _ in range(HELPER_CALLS):
+            client = tls_registry.client()
+            _helper(client, image_ref, digests)
+            client.session.close()
+
+    factory = client_pool.ClientFactory()
+
+    def shared_factory():
+        for _ in range(HELPER_CALLS):
+            client = factory.client('local', lambda session: tls_registry.client(session=session))
+            _helper(client, image_ref, digests)
+
+    no_keep_alive = client_pool.ClientFactory(keep_alive=False)
+
+    def shared_without_keep_alive():
+        for _ in range(HELPER_CALLS):
+            client = no_keep_alive.client('local', lambda session: tls_registry.client(session=session))
+            _helper(client, image_ref, digests)
+
+    handshakes = {}
+    for name, func in (
+        ('fresh-clients', fresh_clients),
+        ('shared-factory', shared_factory),
+        ('shared-no-keep-alive', shared_without_keep_alive),
+    ):
+        connections_before = tls_registry.stats.connections
+        result = recorder.measure(name, func, repeat=REPEAT, helper_calls=HELPER_CALLS, blobs=BLOBS)
+        result.counters['tls_handshakes'] = tls_registry.stats.connections - connections_before
+        handshakes[name] = result.counters['tls_handshakes'] / REPEAT
+        print(f'{name}: {handshakes[name]:.1f} tls handshakes per test')
+    factory.close()
+    no_keep_alive.close()
+
+    assert handshakes['fresh-clients'] >= HELPER_CALLS
+    # one connection for the whole session, opened in the first run
+    assert handshakes['shared-factory'] * REPEAT == 1
+    assert handshakes['shared-no-keep-alive'] >= HELPER_CALLS * BLOBS * 2
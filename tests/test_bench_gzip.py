@@ -0,0 +1,95 @@
+import gzip
+import logging
+import os
+import random
+import time
+import zlib
+
+import pytest
+
+from parallel_gzip import ParallelGzipWriter
+
+logger = logging.getLogger(__name__)
+pytestmark = pytest.mark.benchmark
+
+MiB = 1024 * 1024
+WRITE_SIZE = 64 * 1024 # tarfile writes in small records, so do we
+
+
+class NullWriter:
+    # counts compressed bytes, avoids measuring disk speed
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class VerifyingWriter:
+    # decompresses on the fly, fails if the stream is not a valid gzip member
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(self.decompressor.decompress(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _layer_data(size: int, seed: int = 42) -> bytes:
+    # moderately compressible content, similar to binaries and text in image layers
+    rnd = random.Random(seed)
+    symbols = bytes(range(ord('a'), ord('a') + 24))
+    table = bytes(symbols[b % len(symbols)] for b in range(256))
+    chunk = rnd.randbytes(4 * MiB).translate(table)
+    chunks = [chunk[i:] + chunk[:i] for i in range(0, 4 * MiB, 4 * MiB // 16)]
+    data = b''.join(chunks[i % len(chunks)] for i in range(size // (4 * MiB)))
+    return data
+
+
+def _compress(writer, data: bytes) -> float:
+    start = time.perf_counter()
+    with writer:
+        for i in range(0, len(data), WRITE_SIZE):
+            writer.write(data[i:i + WRITE_SIZE])
+    return time.perf_counter() - start
+
+
+def test_parallel_gzip_is_valid():
+    data = _layer_data(16 * MiB) + os.urandom(12345)
+    out = VerifyingWriter()
+    _compress(ParallelGzipWriter(out, compresslevel=6, max_workers=4), data)
+    assert out.decompressor.eof
+    assert out.size == len(data)
+
+
+@pytest.mark.parametrize('size_mib', [128, 512])
+@pytest.mark.parametrize('level', [1, 6])
+def test_gzip_throughput(size_mib: int, level: int):
+    data = _layer_data(size_mib * MiB)
+    workers = os.cpu_count()
+
+    single_out = NullWriter()
+    single_time = _compress(gzip.GzipFile(fileobj=single_out, mode='wb', compresslevel=level, mtime=0), data)
+    parallel_out = NullWriter()
+    parallel_time = _compress(
+        ParallelGzipWriter(parallel_out, compresslevel=level, max_workers=workers),
+        data,
+    )
+
+    logger.info(
+        f'{size_mib} MiB level {level}: gzip {size_mib / single_time:.0f} MiB/s '
+        f'(ratio {single_out.size / len(data):.3f}), parallel with {workers} workers '
+        f'{size_mib / parallel_time:.0f} MiB/s (ratio {parallel_out.size / len(data):.3f})'
+    )
+    # block boundaries cost a little compression ratio, but not much
+    assert parallel_out.size < single_out.size * 1.02
+    if workers > 1:
+        assert parallel_time < single_time
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+import gci.componentmodel as cm
+import pytest
+
+from cd_tools import ComponentVersion, OciFetcher, component_descriptor_dict
+
+logger = logging.getLogger(__name__)
+pytestmark = pytest.mark.benchmark
+
+# simulated latency of one manifest -> config -> layer round trip
+ROUND_TRIP_SECONDS = 0.02
+
+
+def _component_name(level: int, index: int) -> str:
+    return f'ocm.integrationtest/bench/l{level}-c{index}'
+
+
+def _create_graph(depth: int, fan_out: int) -> dict[ComponentVersion, dict]:
+    # every component of a level references all components of the next level (diamonds)
+    graph = {}
+    for level in range(depth):
+        for index in range(fan_out if level else 1):
+            refs = [] if level == depth - 1 else [ComponentVersion(_component_name(level + 1, i), '1.0.0') for i in range(fan_out)]
+            name = _component_name(level, index)
+            graph[ComponentVersion(name, '1.0.0')] = component_descriptor_dict(name, refs=refs)
+    return graph
+
+
+class LatencyFetcher(OciFetcher):
+    """
+    Registry stand-in: serves component-descriptors from memory, every descriptor costs
+    ROUND_TRIP_SECONDS like three round trips to a registry would.
+    """
+
+    def __init__(self, graph: dict[ComponentVersion, dict]):
+        super().__init__(repo_url='localhost:5000/bench')
+        self.graph = graph
+        self.fetch_count = 0
+        self._lock = threading.Lock()
+
+    def get_component_descriptor_from_registry(
+        self,
+        component_name: str,
+        component_version: str,
+        as_yaml: bool = False,
+    ) -> cm.ComponentDescriptor:
+        with self._lock:
+            self.fetch_count += 1
+        time.sleep(ROUND_TRIP_SECONDS)
+        cd_dict = self.graph[ComponentVersion(component_name, component_version)]
+        return cm.ComponentDescriptor.from_dict(cd_dict, cm.ValidationMode.NONE)
+
+
+def _resolve_recursive(
+    fetcher: OciFetcher,
+    component_name: str,
+    component_version: str,
+) -> dict[ComponentVersion, cm.ComponentDescriptor]:
+    # the recursion OciFetcher.get_component_descriptors_from_registry used before, as baseline:
+    # depth-first, one descriptor at a time, shared references are fetched once per referrer
+    components = {}
+    cd = fetcher.get_component_descriptor_from_registry(
+        component_name,
+        component_version,
+    )
+    cv = ComponentVersion.from_component_descriptor(cd)
+    components[cv] = cd
+    for ref in cd.component.componentReferences:
+        ref_cv = ComponentVersion(name=ref.componentName, version=ref.version)
+        if not ref_cv in components:
+            recursive_references = _resolve_recursive(
+                fetcher,
+                component_name=ref_cv.name,
+                component_version=ref_cv.version,
+            )
+            components |= recursive_references # merge result dict
+    return components
+
+
+def _timed_resolve(graph: dict, max_workers: int = None) -> tuple[float, dict, int]:
+    # max_workers None: the recursive baseline
+    fetcher = LatencyFetcher(graph)
+    start = time.perf_counter()
+    if max_workers is None:
+        components = _resolve_recursive(fetcher, _component_name(0, 0), '1.0.0')
+    else:
+        components = fetcher.get_component_descriptors_from_registry(
+            _component_name(0, 0),
+            '1.0.0',
+            max_workers=max_workers,
+        )
+    return time.perf_counter() - start, components, fetcher.fetch_count
+
+
+@pytest.mark.parametrize('depth, fan_out', [(3, 8), (3, 16)])
+def test_resolver_speedup(depth: int, fan_out: int):
+    graph = _create_graph(depth, fan_out)
+    recursive_time, recursive, recursive_fetches = _timed_resolve(graph)
+    sequential_time, sequential, sequential_fetches = _timed_resolve(graph, max_workers=1)
+    concurrent_time, concurrent, concurrent_fetches = _timed_resolve(graph, max_workers=16)
+
+    assert set(recursive) == set(sequential) == set(concurrent) == set(graph)
+    # the recursion fetched the diamonds' shared components once per referrer
+    assert recursive_fetches > len(graph)
+    assert sequential_fetches == concurrent_fetches == len(graph)
+    speedup = recursive_time / concurrent_time
+    logger.info(f'{len(graph)} components: recursive {recursive_time:.2f}s ({recursive_fetches} fetches), '
+                f'sequential {sequential_time:.2f}s, concurrent {concurrent_time:.2f}s, speedup {speedup:.1f}x')
+    assert sequential_time < recursive_time
+    assert speedup > 2
@@ -0,0 +1,137 @@
+import logging
+import os
+
+import pytest
+
+import blob_upload
+from bench_results import BenchmarkRecorder
+import graph_gen
+import oci_image
+import ocmcli as ocm
+from ocm_fixture import ctx, ocm_config, OcmTestContext
+import upload_image
+import util
+
+logger = logging.getLogger(__name__)
+pytestmark = [pytest.mark.benchmark, pytest.mark.usefixtures('ocm_config')]
+
+MiB = blob_upload.MiB
+VERSION = '1.0.0'
+
+# graph and blob sizes can be overridden, e.g. BENCH_COMPONENTS=50 BENCH_DEPTH=3 BENCH_BLOB_MIB=16
+COMPONENTS = int(os.getenv('BENCH_COMPONENTS', 5))
+FAN_OUT = int(os.getenv('BENCH_FAN_OUT', 4))
+DEPTH = int(os.getenv('BENCH_DEPTH', 2))
+BLOB_MIB = int(os.getenv('BENCH_BLOB_MIB', 4))
+REPEAT = int(os.getenv('BENCH_REPEAT', 3))
+
+
+@pytest.fixture(scope='module')
+def recorder():
+    recorder = BenchmarkRecorder('ocm-transfer', ocm.get_ocm_version())
+    yield recorder
+    if recorder.results:
+        recorder.write()
+
+
+def _graph_spec() -> graph_gen.GraphSpec:
+    return graph_gen.GraphSpec(
+        components=COMPONENTS,
+        fan_out=FAN_OUT,
+        depth=DEPTH,
+        blob_size=BLOB_MIB * MiB,
+        name_prefix='bench',
+    )
+
+
+def _create_ctf(spec: graph_gen.GraphSpec) -> ocm.OcmApplication:
+    cli = ocm.OcmApplication(spec.root_name, spec.version)
+    work_dir = cli.gen_dir / 'bench-input'
+    util.prepare_or_clean_dir(work_dir)
+    components_file = graph_gen.write_components_file(spec, work_dir)
+    cli.create_ctf_from_spec(str(components_file), settings_files=None)
+    return cli
+
+
+def _fresh_repo(ctx: OcmTestContext, kind: str) -> str:
+    # runs must not find the artifacts of previous runs in the target
+    return util.get_repo_url(ctx, f'bench-{kind}-{util.randomword(6)}')
+
+
+def _upload_bench_image(image_ref: str, blob_size: int):
+    work_dir = util.get_gen_dir() / 'bench-image'
+    layer_dir = work_dir / 'layer'
+    util.prepare_or_clean_dir(layer_dir)
+    (layer_dir / 'data.bin').write_bytes(os.urandom(blob_size))
+    image_handler = oci_image.OciImageCreator(
+        upload_image.get_oci_client(),
+        image_ref,
+        work_dir / 'out',
+        oci_image.OciImageCreator.Style.OCI_STYLE,
+        # gzip level 1: random data does not compress, do not waste time trying
+        compression_level=1,
+    )
+    image_handler.create_and_upload_layer_from_dir(layer_dir)
+    image_handler.create_and_upload_image_config(architecture='amd64', os='linux', entrypoint='/data.bin')
+    image_handler.create_and_upload_manifest()
+
+
+def test_bench_create_ctf(recorder: BenchmarkRecorder):
+    recorder.measure(
+        'create ctf',
+        lambda: _create_ctf(_graph_spec()),
+        repeat=REPEAT,
+        components=COMPONENTS,
+        fan_out=FAN_OUT,
+        depth=DEPTH,
+        blob_mib=BLOB_MIB,
+    )
+
+
+def test_bench_transfer_ctf(ctx: OcmTestContext, recorder: BenchmarkRecorder):
+    cli = _create_ctf(_graph_spec())
+
+    def setup():
+        cli.ocm_repo = _fresh_repo(ctx, 'ctf')
+
+    recorder.measure(
+        'transfer ctf',
+        lambda _: cli.push(force=True),
+        repeat=REPEAT,
+        setup=setup,
+        components=COMPONENTS,
+        fan_out=FAN_OUT,
+        depth=DEPTH,
+        blob_mib=BLOB_MIB,
+    )
+
+
+def test_bench_transfer_componentversion(ctx: OcmTestContext, recorder: BenchmarkRecorder):
+    cli = _create_ctf(_graph_spec())
+    cli.ocm_repo = _fresh_repo(ctx, 'src')
+    cli.push(force=True)
+    source = f'{cli.ocm_repo}//{cli.name}:{cli.version}'
+
+    recorder.measure(
+        'transfer componentversion --copy-resources --recursive',
+        lambda target_repo: cli.transport(source, target_repo, force=True, by_value=True, recursive=True),
+        repeat=REPEAT,
+        setup=lambda: _fresh_repo(ctx, 'target'),
+        components=COMPONENTS,
+        fan_out=FAN_OUT,
+        depth=DEPTH,
+        blob_mib=BLOB_MIB,
+    )
+
+
+def test_bench_transfer_artifacts(ctx: OcmTestContext, recorder: BenchmarkRecorder):
+    source_ref = f'{_fresh_repo(ctx, "images")}/bench-image:{VERSION}'
+    _upload_bench_image(source_ref, BLOB_MIB * MiB)
+
+    recorder.measure(
+        'transfer artifacts',
+        lambda target_ref: ocm.execute_ocm(f'transfer artifacts {source_ref} {target_ref}'),
+        repeat=REPEAT,
+        setup=lambda: f'{_fresh_repo(ctx, "image-target")}/bench-image:{VERSION}',
+        blob_mib=BLOB_MIB,
+    )
@@ -0,0 +1,83 @@
+import hashlib
+import os
+
+import pytest
+
+from bench_results import BenchmarkRecorder
+import blob_upload
+from local_registry import LocalRegistry
+import util
+
+pytestmark = pytest.mark.benchmark
+
+MiB = blob_upload.MiB
+REPEAT = int(os.getenv('BENCH_REPEAT', 2))
+# a registry behind a WAN link, shaping of LocalRegistry
+LATENCY_SECONDS = float(os.getenv('BENCH_LATENCY_SECONDS', 0.05))
+BANDWIDTH = int(os.getenv('BENCH_BANDWIDTH_MIB', 100)) * MiB
+
+STRATEGIES = {
+    'monolithic': blob_upload.MonolithicUpload(),
+    'chunked-fixed': blob_upload.ChunkedUpload(max_chunk=blob_upload.DEFAULT_MIN_CHUNK),
+    'chunked-adaptive': blob_upload.ChunkedUpload(),
+    'default': blob_upload.SizeBasedUpload(),
+}
+
+
+@pytest.fixture(scope='module')
+def registry():
+    with LocalRegistry(latency_seconds=LATENCY_SECONDS, bandwidth_bytes_per_second=BANDWIDTH) as registry:
+        yield registry
+
+
+@pytest.fixture(scope='module')
+def recorder():
+    recorder = BenchmarkRecorder('blob-upload', 'local-registry')
+    yield recorder
+    if recorder.results:
+        recorder.write()
+
+
+# around DEFAULT_MIN_CHUNK and DEFAULT_MONOLITHIC_LIMIT (= DEFAULT_MAX_CHUNK)
+@pytest.mark.parametrize('size_mib', [8, 32, 128, 192, 256])
+def test_upload_strategies(registry: LocalRegistry, recorder: BenchmarkRecorder, size_mib: int):
+    client = registry.client()
+    size = size_mib * MiB
+    data = os.urandom(size)
+    digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+
+    def upload(strategy):
+        # every run uploads into a new repository, the registry keeps the content only once
+        image_ref = f'{registry.netloc}/bench/upload-{util.randomword(8)}:0.1.0'
+        strategy.upload(client, image_ref, data, digest, size, 'application/octet-stream')
+        assert client.head_blob(image_ref, digest).ok
+
+    medians = {}
+    for name, strategy in STRATEGIES.items():
+        result = recorder.measure(
+            f'upload-{name}', lambda: upload(strategy), repeat=REPEAT,
+            size_mib=size_mib, latency_seconds=LATENCY_SECONDS, bandwidth_mib=BANDWIDTH // MiB,
+        )
+        medians[name] = result.as_dict()['median']
+
+    # the default strategy is not noticeably slower than the best one
+    best = min(medians.values())
+    assert medians['default'] <= 1.2 * best + 2 * LATENCY_SECONDS, medians
+
+
+def test_mount_upload(registry: LocalRegistry, recorder: BenchmarkRecorder):
+    client = registry.client()
+    source_ref = f'{registry.netloc}/bench/upload-source:0.1.0'
+    data = os.urandom(64 * MiB)
+    digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+    blob_upload.MonolithicUpload().upload(client, source_ref, data, digest, len(data), 'application/octet-stream')
+
+    def mount():
+        target_ref = f'{registry.netloc}/bench/mount-{util.randomword(8)}:0.1.0'
+        strategy = blob_upload.MountUpload([source_ref], fallback=blob_upload.MonolithicUpload())
+        strategy.upload(client, target_ref, data, digest, len(data), 'application/octet-stream')
+        assert client.head_blob(target_ref, digest).ok
+
+    result = recorder.measure('upload-mount', mount, repeat=REPEAT, size_mib=64, latency_seconds=LATENCY_SECONDS)
+    # no data is transferred: a few round trips instead of the 64 MiB
+    assert result.as_dict()['median'] < 64 * MiB / BANDWIDTH
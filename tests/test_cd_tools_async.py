@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+import yaml
+
+from cd_tools import ComponentVersion, DescriptorMemo, OciFetcher, component_descriptor_dict
+from cd_tools_async import AsyncOciFetcher
+from local_registry import LocalRegistry
+
+COMPONENTS = 2000
+
+
+def test_fetch_graph():
+    leaf = ComponentVersion('ocm.integrationtest/leaf', '1.0.0')
+    children = [ComponentVersion(f'ocm.integrationtest/child{i}', '1.0.0') for i in range(3)]
+    with LocalRegistry() as registry:
+        registry.store_component_descriptor('test/ocm', component_descriptor_dict(leaf.name, leaf.version))
+        for child in children:
+            registry.store_component_descriptor('test/ocm', component_descriptor_dict(child.name, child.version, refs=[leaf]))
+        registry.store_component_descriptor('test/ocm', component_descriptor_dict('ocm.integrationtest/root', refs=children))
+        repo_url = f'{registry.netloc}/test/ocm'
+
+        async def fetch():
+            async with AsyncOciFetcher(repo_url, create_client=registry.async_client) as fetcher:
+                assert await fetcher.exists(f'{repo_url}/component-descriptors/{leaf.name}:{leaf.version}')
+                assert not await fetcher.exists(f'{repo_url}/component-descriptors/{leaf.name}:2.0.0')
+                cd_yaml = await fetcher.get_component_descriptor_from_registry(leaf.name, leaf.version, as_yaml=True)
+                assert yaml.safe_load(cd_yaml)['component']['name'] == leaf.name
+                return await fetcher.get_component_descriptors_from_registry('ocm.integrationtest/root', '1.0.0')
+
+        components = asyncio.run(fetch())
+        expected = OciFetcher(repo_url, client=registry.client()).get_component_descriptors_from_registry(
+            'ocm.integrationtest/root', '1.0.0',
+        )
+    assert set(components) == set(expected) == {*children, leaf, ComponentVersion('ocm.integrationtest/root', '1.0.0')}
+    assert components[leaf].component.name == leaf.name
+
+
+@pytest.mark.parametrize('max_concurrency', [16, 64])
+def test_many_concurrent_lookups(max_concurrency: int):
+    with LocalRegistry() as registry:
+        for i in range(COMPONENTS):
+            # written directly into the registry's storage, pushing thousands via http takes too long
+            registry.store_component_descriptor('test/scan', component_descriptor_dict('ocm.integrationtest/scan', f'1.0.{i}'))
+        repo_url = f'{registry.netloc}/test/scan'
+        memo = DescriptorMemo()
+
+        async def scan():
+            async with AsyncOciFetcher(
+                repo_url,
+                memo=memo,
+                max_concurrency=max_concurrency,
+                create_client=registry.async_client,
+            ) as fetcher:
+                versions = await fetcher.versions('ocm.integrationtest/scan')
+                return await asyncio.gather(*(
+                    fetcher.get_component_descriptor_from_registry('ocm.integrationtest/scan', v)
+                    for v in versions
+                ))
+
+        cds = asyncio.run(scan())
+        assert sorted(cd.component.version for cd in cds) == sorted(f'1.0.{i}' for i in range(COMPONENTS))
+        # all lookups share the pooled connections
+        assert registry.stats.connections <= max_concurrency
+        assert registry.stats.requests == 1 + 3 * COMPONENTS
@@ -39,7 +39,8 @@ def validate_ctf(cli: ocm.OcmApplication):
     td.verify_component_descriptor(cd)
 
 
-def test_ctf_from_ca(ctx: OcmTestContext):
+@pytest.mark.parametrize('batched', [False, True])
+def test_ctf_from_ca(ctx: OcmTestContext, batched: bool):
     # create an image with docker mime types and store it in oci registry
     testdata_dir = root_dir / 'test-data'
     sources_yaml = textwrap.dedent(f'''\
@@ -71,6 +72,7 @@ def test_ctf_from_ca(ctx: OcmTestContext):
         ''')
 
     TestData.prepare_test_env()
+    first_timing = len(ocm.command_timings)
     cli = create_comp.create_ctf_from_resources_sources_references(
         test_dir=TestData.test_dir,
         comp_name=comp_name,
@@ -78,17 +80,23 @@ def test_ctf_from_ca(ctx: OcmTestContext):
         provider=provider,
         resources_yaml=resources_yaml,
         sources_yaml=sources_yaml,
+        batched=batched,
     )
-
-    blob_dir = cli.gen_ca_dir / 'blobs'
-    cd = cli.gen_ca_dir / 'component-descriptor.yaml'
-    assert blob_dir.exists()
-    count = 0
-    for child in blob_dir.iterdir():
-        count += 1
-        assert child.name.startswith('sha256.')
-    assert count == 1
-    assert cd.exists()
+    timings = ocm.command_timings[first_timing:]
+    logger.info(ocm.timing_report(timings))
+
+    if batched:
+        assert len(timings) == 1
+    else:
+        blob_dir = cli.gen_ca_dir / 'blobs'
+        cd = cli.gen_ca_dir / 'component-descriptor.yaml'
+        assert blob_dir.exists()
+        count = 0
+        for child in blob_dir.iterdir():
+            count += 1
+            assert child.name.startswith('sha256.')
+        assert count == 1
+        assert cd.exists()
 
     validate_ctf(cli)
 
@@ -265,5 +273,6 @@ def test_push_by_value(ctx: OcmTestContext):
     td.verify_source(source)
 
     # check that contained artifacts are uploaded:
-    assert oci.exists(chart_reference)
-    assert oci.exists(image_reference)
+    presence = oci.exists_many([chart_reference, image_reference])
+    assert presence[chart_reference].exists
+    assert presence[image_reference].exists
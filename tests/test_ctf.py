@@ -0,0 +1,115 @@
+from pathlib import Path
+import shutil
+
+import pytest
+
+from cd_tools import ComponentVersion, component_descriptor_dict
+from ctf import CtfReader, store_blob, validate_ctf, write_ctf
+import util
+
+COMPONENTS = 2000
+
+
+def _write_ctf(ctf_dir: Path, component_versions: list[ComponentVersion]):
+    util.prepare_or_clean_dir(ctf_dir)
+    write_ctf(ctf_dir, (component_descriptor_dict(cv.name, cv.version) for cv in component_versions))
+
+
+@pytest.fixture(scope='module')
+def ctf_dir():
+    ctf_dir = util.get_gen_dir() / 'ctf-reader'
+    component_versions = [
+        ComponentVersion(f'ocm.integrationtest/scale/c{i}', f'1.0.{i % 3}')
+        for i in range(COMPONENTS)
+    ]
+    _write_ctf(ctf_dir, component_versions)
+    yield ctf_dir
+    shutil.rmtree(ctf_dir)
+
+
+def test_lookup(ctf_dir: Path):
+    reader = CtfReader(ctf_dir)
+    assert len(reader.component_versions()) == COMPONENTS
+
+    cd = reader.component_descriptor('ocm.integrationtest/scale/c1234', '1.0.1')
+    assert cd.component.name == 'ocm.integrationtest/scale/c1234'
+    assert cd.component.version == '1.0.1'
+    # parsed descriptors are memoised
+    assert reader.component_descriptor('ocm.integrationtest/scale/c1234', '1.0.1') is cd
+    with pytest.raises(KeyError):
+        reader.component_descriptor('ocm.integrationtest/scale/c1234', '2.0.0')
+    assert not (ctf_dir.parent / 'extracted').exists()
+
+
+def test_lookup_reads_independent_of_size(ctf_dir: Path, monkeypatch):
+    small_dir = util.get_gen_dir() / 'ctf-reader-small'
+    small = [ComponentVersion(f'ocm.integrationtest/scale/c{i}', f'1.0.{i % 3}') for i in range(COMPONENTS // 100)]
+    _write_ctf(small_dir, small)
+    large = [ComponentVersion(f'ocm.integrationtest/scale/c{i}', f'1.0.{i % 3}') for i in range(0, COMPONENTS, 100)]
+    blob_path = CtfReader.blob_path
+    read = []
+
+    def recording_blob_path(reader: CtfReader, digest: str) -> Path:
+        read.append(digest)
+        return blob_path(reader, digest)
+
+    monkeypatch.setattr(CtfReader, 'blob_path', recording_blob_path)
+    for directory, component_versions in ((small_dir, small), (ctf_dir, large)):
+        # indexing reads the artifact index only, a lookup its manifest and descriptor layer
+        reader = CtfReader(directory)
+        assert read == []
+        for cv in component_versions:
+            reader.component_descriptor(cv.name, cv.version)
+            assert len(read) == 2, read
+            read.clear()
+    shutil.rmtree(small_dir)
+
+
+def test_all_component_descriptors(ctf_dir: Path):
+    cds = CtfReader(ctf_dir).component_descriptors()
+    assert len(cds) == COMPONENTS
+    for cv, cd in cds.items():
+        assert ComponentVersion.from_component_descriptor(cd) == cv
+
+
+def test_validate_ctf():
+    ctf_dir = util.get_gen_dir() / 'ctf-validate'
+    _write_ctf(ctf_dir, [ComponentVersion(f'ocm.integrationtest/c{i}', '1.0.0') for i in range(20)])
+    result = validate_ctf(ctf_dir)
+    assert result.ok, result.report()
+    assert result.blobs == 60
+    assert not result.orphaned
+
+    reader = CtfReader(ctf_dir)
+    layer_digest = reader.descriptor_layer('ocm.integrationtest/c3', '1.0.0')['digest']
+    with open(reader.blob_path(layer_digest), 'ab') as f:
+        f.write(b'corrupted')
+    config_digest = reader.manifest(reader.artifact('ocm.integrationtest/c7', '1.0.0').digest)['config']['digest']
+    reader.blob_path(config_digest).unlink()
+    orphan = store_blob(ctf_dir / 'blobs', b'not referenced')['digest']
+
+    result = validate_ctf(ctf_dir)
+    print(result.report())
+    assert not result.ok
+    assert list(result.corrupt) == [layer_digest]
+    assert result.missing == {config_digest}
+    assert result.orphaned == {orphan}
+    shutil.rmtree(ctf_dir)
+
+
+def test_validate_ctf_truncated_manifest():
+    ctf_dir = util.get_gen_dir() / 'ctf-truncated'
+    _write_ctf(ctf_dir, [ComponentVersion(f'ocm.integrationtest/c{i}', '1.0.0') for i in range(3)])
+    reader = CtfReader(ctf_dir)
+    manifest_digest = reader.artifact('ocm.integrationtest/c1', '1.0.0').digest
+    manifest = reader.manifest(manifest_digest)
+    path = reader.blob_path(manifest_digest)
+    path.write_bytes(path.read_bytes()[:20])
+
+    result = validate_ctf(ctf_dir)
+    print(result.report())
+    assert list(result.corrupt) == [manifest_digest]
+    assert not result.missing
+    # config and layer can not be reached any more
+    assert result.orphaned == {manifest['config']['digest'], manifest['layers'][0]['digest']}
+    shutil.rmtree(ctf_dir)
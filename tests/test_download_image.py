@@ -0,0 +1,129 @@
+import json
+import os
+from pathlib import Path
+import shutil
+
+import oci.model as om
+import pytest
+import requests
+
+import download_image
+from download_image import DigestMismatchException, download_blob
+from local_registry import LocalRegistry
+from ocm_fixture import local_registry
+import util
+
+LAYER_SIZE = 256 * 1024
+
+
+@pytest.fixture
+def work_dir():
+    work_dir = util.get_gen_dir() / 'download-image'
+    util.prepare_or_clean_dir(work_dir)
+    yield work_dir
+    shutil.rmtree(work_dir)
+
+
+def _descriptor(media_type: str, digest: str, size: int) -> dict:
+    return {'mediaType': media_type, 'digest': digest, 'size': size}
+
+
+def _store_image(local_registry: LocalRegistry, repo: str, architecture: str) -> dict:
+    # returns the descriptor of the stored image manifest, one layer per architecture
+    config = json.dumps({'architecture': architecture, 'os': 'linux'}).encode()
+    layer = os.urandom(LAYER_SIZE)
+    manifest = json.dumps({
+        'schemaVersion': 2,
+        'mediaType': om.OCI_MANIFEST_SCHEMA_V2_MIME,
+        'config': _descriptor('application/vnd.oci.image.config.v1+json', local_registry.store_blob(repo, config), len(config)),
+        'layers': [_descriptor('application/vnd.oci.image.layer.v1.tar', local_registry.store_blob(repo, layer), len(layer))],
+    }).encode()
+    digest = local_registry.store_manifest(repo, manifest, om.OCI_MANIFEST_SCHEMA_V2_MIME)
+    return {
+        **_descriptor(om.OCI_MANIFEST_SCHEMA_V2_MIME, digest, len(manifest)),
+        'platform': {'architecture': architecture, 'os': 'linux'},
+    }
+
+
+def _blob(out_dir: Path, digest: str) -> dict:
+    return json.loads((out_dir / 'blobs' / 'sha256' / digest.removeprefix('sha256:')).read_text())
+
+
+def _referenced_digests(out_dir: Path) -> set[str]:
+    # digests reachable from index.json, each of them must be a blob of the layout
+    digests = set()
+    pending = json.loads((out_dir / 'index.json').read_text())['manifests']
+    while pending:
+        descriptor = pending.pop()
+        digests.add(descriptor['digest'])
+        assert (out_dir / 'blobs' / 'sha256' / descriptor['digest'].removeprefix('sha256:')).exists(), descriptor
+        if descriptor['mediaType'] in download_image.MULTI_ARCH_MIME_TYPES:
+            pending += _blob(out_dir, descriptor['digest'])['manifests']
+        elif descriptor['mediaType'] == om.OCI_MANIFEST_SCHEMA_V2_MIME:
+            manifest = _blob(out_dir, descriptor['digest'])
+            pending += [manifest['config']] + manifest['layers']
+    return digests
+
+
+def test_download_platforms(local_registry: LocalRegistry, work_dir):
+    manifests = [_store_image(local_registry, 'test/hello', architecture) for architecture in ('amd64', 'arm64')]
+    index = json.dumps({'schemaVersion': 2, 'mediaType': om.OCI_IMAGE_INDEX_MIME, 'manifests': manifests}).encode()
+    index_digest = local_registry.store_manifest('test/hello', index, om.OCI_IMAGE_INDEX_MIME, '0.1.0')
+    client = local_registry.client()
+
+    out_dir = download_image.download_image(
+        client, f'{local_registry.netloc}/test/hello:0.1.0', work_dir / 'image', platforms=['linux/arm64'],
+    )
+    blobs = {f'sha256:{path.name}' for path in (out_dir / 'blobs' / 'sha256').iterdir()}
+    # every descriptor reachable from index.json is in the layout, nothing of amd64
+    assert _referenced_digests(out_dir) == blobs
+    arm64 = json.loads(client.manifest_raw(f'{local_registry.netloc}/test/hello@{manifests[1]["digest"]}').content)
+    assert manifests[1]['digest'] in blobs
+    assert {arm64['config']['digest'], arm64['layers'][0]['digest']} < blobs
+    assert manifests[0]['digest'] not in blobs
+    # the layout refers to an index of the selected platform, not to the original index
+    index_digest_in_layout = json.loads((out_dir / 'index.json').read_text())['manifests'][0]['digest']
+    assert index_digest_in_layout != index_digest
+    assert [m['platform']['architecture'] for m in _blob(out_dir, index_digest_in_layout)['manifests']] == ['arm64']
+
+
+def test_resume_partial_download(local_registry: LocalRegistry, work_dir):
+    data = os.urandom(LAYER_SIZE)
+    digest = local_registry.store_blob('test/blob', data)
+    image_ref = f'{local_registry.netloc}/test/blob:0.1.0'
+    path = work_dir / 'blob'
+    partial = work_dir / 'blob.partial'
+
+    # an interrupted download continues with a range request
+    partial.write_bytes(data[:LAYER_SIZE // 4])
+    bytes_before = local_registry.stats.bytes_sent
+    download_blob(local_registry.client(), image_ref, digest, path)
+    assert path.read_bytes() == data
+    assert not partial.exists()
+    assert local_registry.stats.bytes_sent - bytes_before < LAYER_SIZE
+
+    # complete, but not renamed: the local_registry answers 416 and nothing is downloaded again
+    path.rename(partial)
+    download_blob(local_registry.client(), image_ref, digest, path)
+    assert path.read_bytes() == data
+
+
+def test_corrupted_blob(local_registry: LocalRegistry, work_dir):
+    digest = local_registry.store_blob('test/corrupt', os.urandom(LAYER_SIZE))
+    local_registry._blobs[digest] = os.urandom(LAYER_SIZE)
+    path = work_dir / 'blob'
+
+    with pytest.raises(DigestMismatchException):
+        download_blob(local_registry.client(), f'{local_registry.netloc}/test/corrupt:0.1.0', digest, path)
+    assert not path.exists()
+    assert not (work_dir / 'blob.partial').exists()
+
+
+def test_client_errors_not_retried(local_registry: LocalRegistry, work_dir):
+    client = local_registry.client()
+    client.head_blob(f'{local_registry.netloc}/test/missing:0.1.0', 'sha256:' + 64 * '0', absent_ok=True) # authenticate
+    requests_before = local_registry.stats.requests
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        download_blob(client, f'{local_registry.netloc}/test/missing:0.1.0', 'sha256:' + 64 * '0', work_dir / 'blob')
+    assert local_registry.stats.requests - requests_before == 1
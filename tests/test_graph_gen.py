@@ -0,0 +1,83 @@
+import shutil
+import time
+
+import pytest
+import yaml
+
+import graph_gen
+import util
+
+
+def _references(components: list[dict]) -> dict[str, list[str]]:
+    return {c['name']: [r['componentName'] for r in c['componentReferences']] for c in components}
+
+
+def test_graph_shape():
+    spec = graph_gen.GraphSpec(components=200, fan_out=4, depth=4, seed=1)
+    components = graph_gen.generate(spec)
+    references = _references(components)
+
+    assert len(components) == 200
+    assert len(references) == 200 # names are unique
+    referenced = {name for targets in references.values() for name in targets}
+    # every component except the root is reachable
+    assert referenced == set(references) - {spec.root_name}
+    # references point only to the next level
+    for name, targets in references.items():
+        level = int(name.split('/l')[-1].split('-')[0])
+        assert all(f'/l{level + 1}-' in target for target in targets)
+        assert len(targets) == len(set(targets))
+    # shared references create diamonds
+    in_degrees = [sum(name in targets for targets in references.values()) for name in referenced]
+    assert max(in_degrees) > 1
+
+
+def test_deterministic():
+    spec = graph_gen.GraphSpec(components=100, fan_out=3, depth=3, seed=42)
+    assert graph_gen.generate(spec) == graph_gen.generate(spec)
+    other_seed = graph_gen.GraphSpec(components=100, fan_out=3, depth=3, seed=43)
+    assert _references(graph_gen.generate(spec)) != _references(graph_gen.generate(other_seed))
+
+
+def test_level_sizes():
+    sizes = graph_gen.level_sizes(graph_gen.GraphSpec(components=1000, fan_out=4, depth=4))
+    assert sum(sizes) == 1000
+    assert sizes[0] == 1
+    assert sizes == sorted(sizes)
+    with pytest.raises(ValueError):
+        graph_gen.level_sizes(graph_gen.GraphSpec(components=2, fan_out=2, depth=3))
+
+
+def test_write_components_file():
+    spec = graph_gen.GraphSpec(components=10, fan_out=3, depth=3, blobs_per_component=2, blob_size=100)
+    out_dir = util.get_gen_dir() / 'graph-gen'
+    util.prepare_or_clean_dir(out_dir)
+    components_file = graph_gen.write_components_file(spec, out_dir)
+
+    with open(components_file) as f:
+        components = yaml.safe_load(f)['components']
+    assert len(components) == 10
+    for c in components:
+        assert len(c['resources']) == 2
+        for resource in c['resources']:
+            with open(resource['input']['path'], 'rb') as f:
+                assert len(f.read()) == 100
+    blob_file = components[0]['resources'][0]['input']['path']
+    with open(blob_file, 'rb') as f:
+        content = f.read()
+    graph_gen.write_components_file(spec, out_dir)
+    with open(blob_file, 'rb') as f:
+        assert f.read() == content
+    shutil.rmtree(out_dir)
+
+
+def test_10k_components():
+    spec = graph_gen.GraphSpec(components=10_000, fan_out=8, depth=5, blobs_per_component=1, blob_size=64)
+    out_dir = util.get_gen_dir() / 'graph-gen-10k'
+    util.prepare_or_clean_dir(out_dir)
+    start = time.perf_counter()
+    graph_gen.write_components_file(spec, out_dir)
+    seconds = time.perf_counter() - start
+    print(f'10k components generated in {seconds:.2f}s')
+    assert seconds < 10
+    shutil.rmtree(out_dir)
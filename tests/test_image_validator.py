@@ -0,0 +1,102 @@
+import json
+import os
+
+import oci.model as om
+import pytest
+
+import image_validator
+from image_validator import ImageDiff, ImageValidator
+from local_registry import LocalRegistry
+from ocm_fixture import local_registry
+
+LAYERS = 3
+LAYER_SIZE = 256 * 1024
+
+
+def _descriptor(media_type: str, digest: str, size: int) -> dict:
+    return {'mediaType': media_type, 'digest': digest, 'size': size}
+
+
+def _store_image(local_registry: LocalRegistry, repo: str, architecture: str) -> dict:
+    # returns the descriptor of the stored image manifest
+    config = json.dumps({'architecture': architecture, 'os': 'linux'}).encode()
+    layers = [os.urandom(LAYER_SIZE) for _ in range(LAYERS)]
+    manifest = json.dumps({
+        'schemaVersion': 2,
+        'mediaType': om.OCI_MANIFEST_SCHEMA_V2_MIME,
+        'config': _descriptor('application/vnd.oci.image.config.v1+json', local_registry.store_blob(repo, config), len(config)),
+        'layers': [
+            _descriptor('application/vnd.oci.image.layer.v1.tar', local_registry.store_blob(repo, layer), len(layer))
+            for layer in layers
+        ],
+    }).encode()
+    digest = local_registry.store_manifest(repo, manifest, om.OCI_MANIFEST_SCHEMA_V2_MIME)
+    return {
+        **_descriptor(om.OCI_MANIFEST_SCHEMA_V2_MIME, digest, len(manifest)),
+        'platform': {'architecture': architecture, 'os': 'linux'},
+    }
+
+
+def _store_index(local_registry: LocalRegistry, repo: str, tag: str) -> str:
+    index = json.dumps({
+        'schemaVersion': 2,
+        'mediaType': om.OCI_IMAGE_INDEX_MIME,
+        'manifests': [_store_image(local_registry, repo, architecture) for architecture in ('amd64', 'arm64')],
+    }).encode()
+    return local_registry.store_manifest(repo, index, om.OCI_IMAGE_INDEX_MIME, tag)
+
+
+def _copy(local_registry: LocalRegistry, source_repo: str, target_repo: str):
+    # like 'ocm transfer artifacts', everything is copied unchanged
+    source, target = local_registry.repository(source_repo), local_registry.repository(target_repo)
+    target.blobs |= source.blobs
+    target.manifests.update(source.manifests)
+    target.tags.update(source.tags)
+
+
+def test_copied_image(local_registry: LocalRegistry):
+    _store_index(local_registry, 'test/src/hello', '0.1.0')
+    _copy(local_registry, 'test/src/hello', 'test/target/hello')
+    source_ref = f'{local_registry.netloc}/test/src/hello:0.1.0'
+    target_ref = f'{local_registry.netloc}/test/target/hello:0.1.0'
+
+    bytes_before = local_registry.stats.bytes_sent
+    result = ImageValidator(local_registry.client()).validate(source_ref, target_ref)
+    print(result.report())
+    assert result.ok, result.report()
+    assert (result.manifests, result.blobs, result.blobs_downloaded) == (3, 2 * (LAYERS + 1), 0)
+    # manifests only, no layer was downloaded
+    assert local_registry.stats.bytes_sent - bytes_before < LAYER_SIZE
+
+    result = ImageValidator(local_registry.client(), sample_rate=1.0).validate(source_ref, target_ref)
+    assert result.ok, result.report()
+    assert result.blobs_downloaded == 2 * (LAYERS + 1)
+
+
+def test_incomplete_copy(local_registry: LocalRegistry):
+    _store_index(local_registry, 'test/src/broken', '0.1.0')
+    _copy(local_registry, 'test/src/broken', 'test/target/broken')
+    source_ref = f'{local_registry.netloc}/test/src/broken:0.1.0'
+    target_ref = f'{local_registry.netloc}/test/target/broken:0.1.0'
+    client = local_registry.client()
+    index = json.loads(client.manifest_raw(target_ref, accept=om.MimeTypes.prefer_multiarch).content)
+    arm64 = json.loads(client.manifest_raw(f'{target_ref.split(":0.1.0")[0]}@{index["manifests"][1]["digest"]}').content)
+    target = local_registry.repository('test/target/broken')
+    target.blobs.discard(arm64['layers'][1]['digest'])
+
+    result = ImageValidator(client).validate(source_ref, target_ref)
+    assert result.diffs == [ImageDiff('manifests[1]/layers[1]', image_validator.BLOB_MISSING, arm64['layers'][1]['digest'])]
+
+    del target.manifests[index['manifests'][0]['digest']]
+    result = ImageValidator(client).validate(source_ref, target_ref)
+    print(result.report())
+    assert [d.problem for d in result.diffs] == [image_validator.MANIFEST_MISSING, image_validator.BLOB_MISSING]
+
+    # a different image under the same tag
+    _store_index(local_registry, 'test/target/broken', '0.1.0')
+    result = ImageValidator(client).validate(source_ref, target_ref)
+    assert result.diffs[0].problem == image_validator.MANIFEST_DIGEST_DIFFERS
+    assert [d.path for d in result.diffs[1:]] == ['manifests[0]', 'manifests[1]']
+
+    result = ImageValidator(client).validate(source_ref, f'{local_registry.netloc}/test/target/broken:0.2.0')
+    assert result.diffs == [ImageDiff('', image_validator.MANIFEST_MISSING)]
@@ -0,0 +1,50 @@
+import concurrent.futures
+import shutil
+
+from cryptography.hazmat.primitives import serialization
+import pytest
+
+from key_pool import KeyPool
+import signing
+import util
+
+POOL_SIZE = 3
+
+
+@pytest.fixture
+def key_dir():
+    key_dir = util.get_gen_dir() / 'key-pool-test'
+    util.prepare_or_clean_dir(key_dir)
+    yield key_dir
+    shutil.rmtree(key_dir)
+
+
+def _private_key(key_pair):
+    return serialization.load_pem_private_key(key_pair.private_key_path.read_bytes(), password=None)
+
+
+def test_key_pairs(key_dir):
+    pool = KeyPool(key_dir, size=POOL_SIZE, key_size=1024)
+    key_pairs = [pool.key_pair(i) for i in range(POOL_SIZE)]
+    assert len({k.public_key_path.read_bytes() for k in key_pairs}) == POOL_SIZE
+    with pytest.raises(IndexError):
+        pool.key_pair(POOL_SIZE)
+
+    # signed with one key, valid only with its own public key
+    digest = 'ab' * 32
+    signature = signing.create_signature(_private_key(key_pairs[0]), digest, 'test')
+    assert signing.check_signature(signature, digest, key_pairs[0].public_key_path.read_bytes()) is None
+    assert signing.check_signature(signature, digest, key_pairs[1].public_key_path.read_bytes()) == \
+        'signature verification failed'
+
+
+def test_shared_by_pools(key_dir):
+    # pools of other workers (and test runs) use the key files generated first
+    pools = [KeyPool(key_dir, size=POOL_SIZE, key_size=1024) for _ in range(4)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(pools)) as executor:
+        key_pairs = list(executor.map(lambda pool: pool.key_pair(POOL_SIZE - 1), pools))
+    assert len({k.private_key_path for k in key_pairs}) == 1
+    modified = key_pairs[0].private_key_path.stat().st_mtime_ns
+
+    pool = KeyPool(key_dir, size=POOL_SIZE, key_size=1024)
+    assert pool.key_pair(POOL_SIZE - 1).private_key_path.stat().st_mtime_ns == modified
@@ -0,0 +1,268 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+import oci.model as om
+import pytest
+import requests
+
+import blob_upload
+from cd_tools import (
+    ComponentVersion,
+    ExistsCache,
+    OciFetcher,
+    component_descriptor_dict,
+    component_descriptor_url,
+    descriptor_artifact,
+)
+from local_registry import LocalRegistry, create_self_signed_cert
+from ocm_fixture import local_registry
+import oci_image
+import oci_requests
+import tracing
+import util
+
+logger = logging.getLogger(__name__)
+
+MiB = blob_upload.MiB
+
+
+def _digest(data: bytes) -> str:
+    return 'sha256:' + hashlib.sha256(data).hexdigest()
+
+
+def _push_component_descriptor(client, repo_url: str, cd: dict):
+    # pushed via http, the same layout as ocm
+    artifact = descriptor_artifact(cd)
+    image_ref = component_descriptor_url(repo_url, cd['component']['name'], cd['component']['version'])
+    for data in (artifact.layer, artifact.config):
+        blob_upload.MonolithicUpload().upload(
+            client, image_ref, data, _digest(data), len(data), 'application/octet-stream',
+        )
+    client.put_manifest(image_reference=image_ref, manifest=artifact.manifest)
+
+
+@pytest.mark.parametrize('strategy', [
+    blob_upload.MonolithicUpload(),
+    blob_upload.ChunkedUpload(min_chunk=256 * 1024, max_chunk=1 * MiB),
+])
+def test_blob_upload_and_download(local_registry: LocalRegistry, strategy):
+    client = local_registry.client()
+    image_ref = f'{local_registry.netloc}/test/blobs:0.1.0'
+    data = os.urandom(3 * MiB + 17)
+    digest = _digest(data)
+
+    assert not client.head_blob(image_ref, digest).ok
+    strategy.upload(client, image_ref, data, digest, len(data), 'application/octet-stream')
+    assert client.head_blob(image_ref, digest).ok
+    assert client.blob(image_ref, digest, stream=False).content == data
+
+    # range requests are used to resume downloads
+    res = oci_requests.blob_from(client, image_ref, digest, offset=100)
+    assert res.status_code == 206
+    assert res.content == data[100:]
+
+
+def test_mount_blob(local_registry: LocalRegistry):
+    client = local_registry.client()
+    source_ref = f'{local_registry.netloc}/test/source:0.1.0'
+    target_ref = f'{local_registry.netloc}/test/target:0.1.0'
+    data = os.urandom(1024)
+    digest = _digest(data)
+
+    assert not client.mount_blob(target_ref, digest, source_ref)
+    blob_upload.MonolithicUpload().upload(client, source_ref, data, digest, len(data), 'application/octet-stream')
+    assert client.mount_blob(target_ref, digest, source_ref)
+    assert client.head_blob(target_ref, digest).ok
+
+
+def test_manifests_and_tags(local_registry: LocalRegistry):
+    client = local_registry.client()
+    repo_ref = f'{local_registry.netloc}/test/manifests'
+    manifest = json.dumps({
+        'schemaVersion': 2,
+        'mediaType': om.OCI_MANIFEST_SCHEMA_V2_MIME,
+        'config': {'mediaType': 'application/json', 'digest': _digest(b'{}'), 'size': 2},
+        'layers': [],
+    }).encode()
+    digest = _digest(manifest)
+    for tag in ('1.0.0', '1.1.0', '2.0.0'):
+        client.put_manifest(image_reference=f'{repo_ref}:{tag}', manifest=manifest)
+
+    assert client.manifest_raw(f'{repo_ref}:1.1.0').content == manifest
+    assert client.manifest_raw(f'{repo_ref}@{digest}').content == manifest
+    assert client.head_manifest(f'{repo_ref}:2.0.0', absent_ok=True) is not None
+    assert client.tags(f'{repo_ref}:1.0.0') == ['1.0.0', '1.1.0', '2.0.0']
+
+    client.delete_manifest(f'{repo_ref}:2.0.0')
+    assert client.head_manifest(f'{repo_ref}:2.0.0', absent_ok=True) is None
+    assert client.tags(f'{repo_ref}:1.0.0') == ['1.0.0', '1.1.0']
+    with pytest.raises(om.OciImageNotFoundException):
+        client.manifest_raw(f'{repo_ref}:3.0.0')
+
+
+def test_basic_auth(local_registry: LocalRegistry):
+    res = requests.get(f'{local_registry.url}/v2/')
+    assert res.status_code == 401
+    assert 'Basic' in res.headers['WWW-Authenticate']
+    res = requests.get(f'{local_registry.url}/v2/', auth=('ocmuser', 'ocmpasswd'))
+    assert res.status_code == 200
+
+
+def test_blob_presence(local_registry: LocalRegistry):
+    client = local_registry.client()
+    image_ref = f'{local_registry.netloc}/test/presence:0.1.0'
+    data = os.urandom(1000)
+    presence = blob_upload.BlobPresence()
+    first_span = len(tracing.tracer.spans)
+
+    # a missing blob costs one HEAD, then it is uploaded without asking again
+    presence.upload(blob_upload.MonolithicUpload(), client, image_ref, data, _digest(data), len(data), 'application/octet-stream')
+    assert [s.name.split()[0] for s in tracing.tracer.spans[first_span:]] == ['HEAD', 'POST', 'PUT']
+    # known to the memo, no request at all
+    presence.upload(blob_upload.MonolithicUpload(), client, image_ref, data, _digest(data), len(data), 'application/octet-stream')
+    assert len(tracing.tracer.spans) == first_span + 3
+    assert (presence.blobs_uploaded, presence.blobs_skipped) == (1, 1)
+
+
+class _SlowUpload(blob_upload.MonolithicUpload):
+
+    def upload(self, *args):
+        time.sleep(0.2) # all threads ask for the blob while it is being uploaded
+        super().upload(*args)
+
+
+def test_blob_presence_concurrent(local_registry: LocalRegistry):
+    # e.g. a layer shared by the platforms of a multi-arch image, uploaded once
+    client = local_registry.client()
+    image_ref = f'{local_registry.netloc}/test/presence-concurrent:0.1.0'
+    data = os.urandom(1000)
+    presence = blob_upload.BlobPresence()
+    first_span = len(tracing.tracer.spans)
+
+    def upload(_):
+        presence.upload(_SlowUpload(), client, image_ref, data, _digest(data), len(data), 'application/octet-stream')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(upload, range(4)))
+    assert [s.name.split()[0] for s in tracing.tracer.spans[first_span:]] == ['HEAD', 'POST', 'PUT']
+    assert (presence.blobs_uploaded, presence.blobs_skipped) == (1, 3)
+
+
+def test_image_upload(local_registry: LocalRegistry):
+    client = local_registry.client()
+    image_ref = f'{local_registry.netloc}/test/image:0.1.0'
+    work_dir = util.get_gen_dir() / 'local-registry-image'
+    util.prepare_or_clean_dir(work_dir / 'layer')
+    (work_dir / 'layer' / 'hello.txt').write_text('hello')
+
+    image_handler = oci_image.OciImageCreator(
+        client,
+        image_ref,
+        work_dir / 'out',
+        oci_image.OciImageCreator.Style.OCI_STYLE,
+        blob_presence=blob_upload.BlobPresence(),
+    )
+    image_handler.create_and_upload_layer_from_dir(work_dir / 'layer')
+    image_handler.create_and_upload_image_config(architecture='amd64', os='linux', entrypoint='/hello')
+    response, manifest = image_handler.create_and_upload_manifest()
+    assert response.status_code == 201
+
+    manifest_dict = json.loads(client.manifest_raw(image_ref).content)
+    for layer in manifest_dict['layers']:
+        assert client.head_blob(image_ref, layer['digest']).ok
+    shutil.rmtree(work_dir)
+
+
+def test_fetch_component_descriptors(local_registry: LocalRegistry):
+    client = local_registry.client()
+    repo_url = f'{local_registry.netloc}/test/ocm'
+    leaf = ComponentVersion('ocm.integrationtest/leaf', '1.0.0')
+    _push_component_descriptor(client, repo_url, component_descriptor_dict(leaf.name, leaf.version))
+    _push_component_descriptor(client, repo_url, component_descriptor_dict('ocm.integrationtest/root', refs=[leaf]))
+
+    fetcher = OciFetcher(repo_url, client=client)
+    components = fetcher.get_component_descriptors_from_registry('ocm.integrationtest/root', '1.0.0')
+    assert sorted(cv.name for cv in components) == ['ocm.integrationtest/leaf', 'ocm.integrationtest/root']
+
+
+def test_exists_many(local_registry: LocalRegistry):
+    manifest = json.dumps({'schemaVersion': 2, 'mediaType': om.OCI_MANIFEST_SCHEMA_V2_MIME}).encode()
+    existing = []
+    for repo in ('test/exists/a', 'test/exists/b'):
+        for i in range(10):
+            local_registry.store_manifest(repo, manifest, om.OCI_MANIFEST_SCHEMA_V2_MIME, f'1.0.{i}')
+            existing.append(f'{local_registry.netloc}/{repo}:1.0.{i}')
+    missing = [f'{local_registry.netloc}/test/exists/a:2.0.0', f'{local_registry.netloc}/test/exists/c:1.0.0']
+
+    fetcher = OciFetcher('unused', client=local_registry.client(), exists_cache=ExistsCache())
+    requests_before = local_registry.stats.requests
+    presence = fetcher.exists_many(existing + missing + existing[:3])
+    assert local_registry.stats.requests - requests_before == len(existing) + len(missing)
+    assert set(presence) == set(existing + missing)
+    assert all(presence[ref].exists for ref in existing)
+    assert presence[existing[0]].digest == _digest(manifest)
+    assert presence[existing[0]].media_type == om.OCI_MANIFEST_SCHEMA_V2_MIME
+    assert not any(presence[ref].exists for ref in missing)
+
+    # answered from the cache until invalidated
+    assert fetcher.exists_many(existing) == {ref: presence[ref] for ref in existing}
+    assert local_registry.stats.requests - requests_before == len(existing) + len(missing)
+    fetcher.exists_cache.invalidate(f'{local_registry.netloc}/test/exists/a')
+    fetcher.exists_many(existing)
+    assert local_registry.stats.requests - requests_before == len(existing) + len(missing) + 10
+
+
+def test_error_injection():
+    with LocalRegistry(error_rate=0.2, seed=7) as registry:
+        client = registry.client()
+        image_ref = f'{registry.netloc}/test/errors:0.1.0'
+        for i in range(20):
+            data = f'blob {i}'.encode()
+            blob_upload.MonolithicUpload().upload(
+                client, image_ref, data, _digest(data), len(data), 'application/octet-stream',
+            )
+            assert client.blob(image_ref, _digest(data), stream=False).content == data
+        assert registry.stats.errors_injected > 0
+
+
+def test_latency_and_bandwidth():
+    data = os.urandom(512 * 1024)
+    with LocalRegistry(latency_seconds=0.05, bandwidth_bytes_per_second=4 * MiB) as registry:
+        client = registry.client()
+        image_ref = f'{registry.netloc}/test/shaped:0.1.0'
+        digest = registry.store_blob('test/shaped', data)
+
+        start = time.perf_counter()
+        client.head_blob(image_ref, digest)
+        assert time.perf_counter() - start >= 0.05
+
+        start = time.perf_counter()
+        client.blob(image_ref, digest, stream=False)
+        # 0.05s latency + 0.125s transfer
+        assert time.perf_counter() - start >= 0.17
+
+
+@pytest.mark.skipif(not shutil.which('openssl'), reason='openssl not available')
+def test_tls():
+    cert_dir = util.get_gen_dir() / 'local-registry-tls'
+    cert_file, key_file = create_self_signed_cert(cert_dir)
+    with LocalRegistry(
+        user_name='ocmuser',
+        password='ocmpasswd',
+        tls_cert_file=cert_file,
+        tls_key_file=key_file,
+    ) as registry:
+        assert registry.url.startswith('https://')
+        client = registry.client()
+        image_ref = f'{registry.netloc}/test/tls:0.1.0'
+        data = b'served via tls'
+        blob_upload.MonolithicUpload().upload(
+            client, image_ref, data, _digest(data), len(data), 'application/octet-stream',
+        )
+        assert client.blob(image_ref, _digest(data), stream=False).content == data
+    shutil.rmtree(cert_dir)
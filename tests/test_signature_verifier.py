@@ -0,0 +1,203 @@
+import copy
+import shutil
+
+from cryptography.hazmat.primitives import serialization
+import pytest
+
+from cd_tools import ComponentVersion, component_descriptor_dict
+from ctf import CtfReader, write_ctf
+import signing
+import util
+
+SIGNATURE_NAME = 'inttest-sig'
+CHILDREN = 40
+
+
+def _component(name: str, refs: list[ComponentVersion] = ()) -> dict:
+    cd = component_descriptor_dict(
+        name,
+        refs=refs,
+        labels=[{'name': 'mylabel', 'value': {'greeting': 'Hello Label'}, 'signing': True}],
+        resources=[{
+            'name': 'echo',
+            'version': '1.10',
+            'type': 'ociImage',
+            'relation': 'external',
+            'access': {'type': 'ociArtifact', 'imageReference': 'gcr.io/google_containers/echoserver:1.10'},
+            'digest': signing.digest_spec('ociArtifactDigest/v1', 'ab' * 32),
+        }],
+    )
+    cd['signatures'] = []
+    return cd
+
+
+@pytest.fixture(scope='module')
+def keys():
+    key_pool = util.get_key_pool()
+    key_pair = key_pool.key_pair(0)
+    yield key_pair.private_key_path, key_pair.public_key_path, key_pool.key_pair(1).public_key_path
+    shutil.rmtree(util.get_gen_dir() / 'signature-verifier', ignore_errors=True)
+
+
+def _graph() -> list[dict]:
+    # root -> children -> one shared leaf
+    leaf = _component('ocm.integrationtest/leaf')
+    children = [
+        _component(f'ocm.integrationtest/child{i}', refs=[ComponentVersion('ocm.integrationtest/leaf', '1.0.0')])
+        for i in range(CHILDREN)
+    ]
+    root = _component('ocm.integrationtest/root', refs=[
+        ComponentVersion(c['component']['name'], '1.0.0') for c in children
+    ])
+    return [leaf, *children, root]
+
+
+def _verifier(cds: list[dict], public_key_file, **kwargs) -> signing.SignatureVerifier:
+    ctf_dir = util.get_gen_dir() / 'signature-verifier' / 'ctf'
+    util.prepare_or_clean_dir(ctf_dir)
+    write_ctf(ctf_dir, cds)
+    # a cache of its own: the same descriptors are signed differently by the tests
+    return signing.SignatureVerifier(signing.ctf_lookup(CtfReader(ctf_dir)), public_key_file, signing.DigestCache(), **kwargs)
+
+
+def test_normalisation_v1():
+    # digest computed by an independent implementation (gardener-ocm) for the same descriptor
+    cd = _component('ocm.integrationtest/echo', refs=[ComponentVersion('ocm.integrationtest/helper', '1.0.0')])
+    cd['component']['repositoryContexts'] = [{'type': 'OCIRegistry', 'baseUrl': 'ghcr.io/inttest'}]
+    cd['component']['labels'] = [
+        {'name': 'mylabel', 'value': {'greeting': 'Hello Label', 'count': 2}, 'signing': True},
+        {'name': 'unsigned', 'value': 'x'},
+    ]
+    cd['component']['sources'] = [{
+        'name': 'src', 'type': 'git', 'version': '1.0.0',
+        'access': {'type': 'github', 'repoUrl': 'github.com/open-component-model/ocm'},
+    }]
+    cd['component']['componentReferences'][0]['digest'] = signing.digest_spec(signing.NORMALISATION_V1, '0123abcd')
+    echo = cd['component']['resources'][0]
+    echo.update(extraIdentity={}, digest=signing.digest_spec('ociArtifactDigest/v1', 'cafe'))
+    echo['labels'] = [{'name': 'l', 'value': 'v', 'signing': True}]
+    cd['component']['resources'].append({
+        **copy.deepcopy(echo),
+        'version': '1.11',
+        'access': {'type': 'ociArtifact', 'imageReference': 'gcr.io/google_containers/echoserver:1.11'},
+        'digest': signing.digest_spec('ociArtifactDigest/v1', 'beef'),
+    })
+    del cd['component']['resources'][1]['labels']
+    del cd['component']['resources'][1]['extraIdentity']
+    assert signing.descriptor_digest(cd, signing.NORMALISATION_V1) == \
+        'a194d6a58e274efd8e7a4cd05e83731576fd30a7b4987dc9953ea00540e9bb8a'
+
+
+@pytest.mark.parametrize('algorithm, scheme', [
+    (signing.NORMALISATION_V1, signing.RSA_PKCS1_V15),
+    (signing.NORMALISATION_V2, signing.RSA_PSS),
+])
+def test_verify_graph(keys, algorithm: str, scheme: str):
+    private_key_file, public_key_file, _ = keys
+    cds = _graph()
+    signing.sign_component_descriptors(cds, private_key_file, SIGNATURE_NAME, algorithm, scheme)
+    # the children are normalised in the process pool
+    verifier = _verifier(cds, public_key_file, max_workers=4, min_pool_tasks=CHILDREN)
+
+    result = verifier.verify('ocm.integrationtest/root', '1.0.0', SIGNATURE_NAME)
+    assert result.ok, result.report()
+    assert len(result.digests) == CHILDREN + 2
+    assert result.digest_report == signing.DigestReport(reused=0, recomputed=CHILDREN + 2)
+
+    # verified again: nothing is normalised twice
+    result = verifier.verify('ocm.integrationtest/root', '1.0.0', SIGNATURE_NAME)
+    assert result.ok, result.report()
+    assert result.digest_report == signing.DigestReport(reused=CHILDREN + 2, recomputed=0)
+
+
+def test_wrong_key(keys):
+    private_key_file, _, wrong_public_key_file = keys
+    cds = _graph()
+    signing.sign_component_descriptors(cds, private_key_file, SIGNATURE_NAME)
+    result = _verifier(cds, wrong_public_key_file, max_workers=1).verify('ocm.integrationtest/root', '1.0.0', SIGNATURE_NAME)
+    assert not result.ok
+    assert result.errors == {ComponentVersion('ocm.integrationtest/root', '1.0.0'): 'signature verification failed'}
+
+
+def test_modified_reference(keys):
+    private_key_file, public_key_file, _ = keys
+    cds = _graph()
+    signing.sign_component_descriptors(cds, private_key_file, SIGNATURE_NAME)
+    # changed after signing: the digest recorded by all children does not match any longer
+    cds[0]['component']['resources'][0]['digest']['value'] = 'cd' * 32
+    result = _verifier(cds, public_key_file).verify('ocm.integrationtest/root', '1.0.0', SIGNATURE_NAME)
+    print(result.report())
+    assert not result.ok
+    assert len(result.errors) == CHILDREN
+    assert all(e == 'digest of reference ocm.integrationtest/leaf:1.0.0 does not match' for e in result.errors.values())
+
+
+def test_references_without_digest(keys):
+    # digests of references not recorded are computed from the referenced descriptors first
+    private_key_file, public_key_file, _ = keys
+    cds = _graph()
+    digests = {}
+    for cd in cds:
+        cv = ComponentVersion(cd['component']['name'], cd['component']['version'])
+        digests[cv] = signing.digest_spec(
+            signing.NORMALISATION_V1,
+            signing.descriptor_digest(cd, signing.NORMALISATION_V1, digests),
+        )
+    root_digest = digests[ComponentVersion('ocm.integrationtest/root', '1.0.0')]['value']
+    with open(private_key_file, 'rb') as f:
+        key = serialization.load_pem_private_key(f.read(), password=None)
+    cds[-1]['signatures'] = [signing.create_signature(key, root_digest, SIGNATURE_NAME)]
+
+    result = _verifier(cds, public_key_file).verify('ocm.integrationtest/root', '1.0.0', SIGNATURE_NAME)
+    assert result.ok, result.report()
+    assert result.digests[ComponentVersion('ocm.integrationtest/root', '1.0.0')][signing.NORMALISATION_V1] == root_digest
+
+
+def test_incremental_signing(keys):
+    # only the root changes between builds, the digests of its references are reused
+    private_key_file, public_key_file, _ = keys
+    cache_file = util.get_gen_dir() / 'signature-verifier' / 'digest-cache.json'
+    cache = signing.DigestCache(cache_file)
+    report = signing.sign_component_descriptors(_graph(), private_key_file, SIGNATURE_NAME, cache=cache)
+    assert report == signing.DigestReport(reused=0, recomputed=CHILDREN + 2)
+    cache.save()
+
+    cache = signing.DigestCache(cache_file)
+    cds = _graph()
+    cds[-1]['component']['labels'][0]['value']['build'] = 2
+    report = signing.sign_component_descriptors(cds, private_key_file, SIGNATURE_NAME, cache=cache)
+    assert report == signing.DigestReport(reused=CHILDREN + 1, recomputed=1)
+    assert cache.report == report
+
+    # same digests as without cache
+    expected = _graph()
+    expected[-1]['component']['labels'][0]['value']['build'] = 2
+    signing.sign_component_descriptors(expected, private_key_file, SIGNATURE_NAME)
+    assert cds[-1]['signatures'][0]['digest'] == expected[-1]['signatures'][0]['digest']
+    result = _verifier(cds, public_key_file).verify('ocm.integrationtest/root', '1.0.0', SIGNATURE_NAME)
+    assert result.ok, result.report()
+
+
+def test_digest_cache():
+    cache_file = util.get_gen_dir() / 'signature-verifier' / 'digest-cache-lru.json'
+    cache_file.unlink(missing_ok=True)
+    cache = signing.DigestCache(cache_file, max_entries=2)
+    cvs = [ComponentVersion(f'ocm.integrationtest/c{i}', '1.0.0') for i in range(3)]
+    for cv in cvs:
+        cache.put(cv, 'sha256:cd', signing.NORMALISATION_V1, f'digest-{cv.name}')
+
+    # reused only if all normalisations are cached
+    both = {signing.NORMALISATION_V1: None, signing.NORMALISATION_V2: None}
+    assert cache.get(cvs[0], 'sha256:cd', both) is None
+    assert cache.get(cvs[0], 'sha256:cd', {signing.NORMALISATION_V1: None}) == {
+        signing.NORMALISATION_V1: 'digest-ocm.integrationtest/c0',
+    }
+    assert cache.report == signing.DigestReport(reused=1, recomputed=3)
+
+    # the least recently used digest (c1) is dropped
+    cache.save()
+    cache = signing.DigestCache(cache_file, max_entries=2)
+    assert cache.get(cvs[1], 'sha256:cd', {signing.NORMALISATION_V1: None}) is None
+    assert cache.get(cvs[0], 'sha256:cd', {signing.NORMALISATION_V1: None})
+    assert cache.get(cvs[2], 'sha256:cd', {signing.NORMALISATION_V1: None})
+    cache_file.unlink()
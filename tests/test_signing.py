@@ -3,8 +3,11 @@ import logging
 
 import pytest
 
+from ctf import CtfReader
+from key_pool import KeyPool
 import ocmcli as ocm
 from ocm_fixture import ctx, ocm_config, OcmTestContext
+import signing
 import util
 from create_comp import TestData
 
@@ -13,18 +16,32 @@ pytestmark = pytest.mark.usefixtures("ocm_config")
 
 signature_name = 'inttest-sig'
 
-def gen_key_pair(priv_key_path, pub_key_path):
-    if not priv_key_path.exists() and not pub_key_path.exists():
-        print('generating new key-pair')
-        ocm.execute_ocm(f'create rsakeypair {priv_key_path} {pub_key_path}')
+@pytest.fixture(scope='session')
+def key_pool() -> KeyPool:
+    return util.get_key_pool()
+
 
 @pytest.fixture
-def setup() -> tuple[str, str]:
-    gen_dir = util.get_gen_dir()
-    priv_key_path = gen_dir / 'priv.key'
-    pub_key_path = gen_dir / 'public.key'
-    gen_key_pair(priv_key_path, pub_key_path)
-    return priv_key_path, pub_key_path
+def setup(key_pool: KeyPool) -> tuple[Path, Path]:
+    key_pair = key_pool.key_pair(0)
+    return key_pair.private_key_path, key_pair.public_key_path
+
+
+def verify_native(
+    ctx: OcmTestContext,
+    cli: ocm.OcmApplication,
+    pub_key_path: str,
+    remote: bool = False,
+) -> signing.VerificationResult:
+    # same check as 'ocm verify', without spawning ocm
+    if remote:
+        lookup = signing.registry_lookup(util.get_oci_client(ctx, cli.ocm_repo))
+    else:
+        lookup = signing.ctf_lookup(CtfReader(cli.gen_ctf_dir))
+    verifier = signing.SignatureVerifier(lookup, pub_key_path, cache=util.get_digest_cache())
+    result = verifier.verify(cli.name, cli.version, signature_name)
+    print(result.report())
+    return result
 
 
 def test_sign_ctf(ctx: OcmTestContext, setup: tuple[str, str]):
@@ -34,6 +51,7 @@ def test_sign_ctf(ctx: OcmTestContext, setup: tuple[str, str]):
     cli = td.create_ctf()
     cli.sign(signature_name, priv_key_path)
     cli.verify(signature_name, pub_key_path)
+    assert verify_native(ctx, cli, pub_key_path).ok
 
 
 def test_sign_remote(ctx: OcmTestContext, setup: tuple[str, str]):
@@ -45,6 +63,7 @@ def test_sign_remote(ctx: OcmTestContext, setup: tuple[str, str]):
     cli.push()
     cli.sign(signature_name, priv_key_path, remote=True)
     cli.verify(signature_name, pub_key_path, remote=True)
+    assert verify_native(ctx, cli, pub_key_path, remote=True).ok
 
 
 def test_sign_with_reference(ctx: OcmTestContext, setup: tuple[str, str]):
@@ -58,17 +77,19 @@ def test_sign_with_reference(ctx: OcmTestContext, setup: tuple[str, str]):
     cli.push()
     cli.sign(signature_name, priv_key_path, recursive=True, remote=True)
     cli.verify(signature_name, pub_key_path, remote=True)
+    result = verify_native(ctx, cli, pub_key_path, remote=True)
+    assert result.ok
+    assert len(result.digests) == 2
 
 
-def test_wrong_key(ctx: OcmTestContext, setup: tuple[str, str]):
+def test_wrong_key(ctx: OcmTestContext, setup: tuple[str, str], key_pool: KeyPool):
     priv_key_path, pub_key_path = setup
-    gen_dir = util.get_gen_dir()
-    wrong_priv_key_path = gen_dir / 'priv_wrong.key'
-    wrong_pub_key_path = gen_dir / 'public_wrong.key'
-    gen_key_pair(wrong_priv_key_path, wrong_pub_key_path)
+    wrong_pub_key_path = key_pool.key_pair(1).public_key_path
     # create ctf archive
     td = TestData()
     cli = td.create_ctf()
     cli.sign(signature_name, priv_key_path)
     with pytest.raises(ocm.OcmCliException, match='signature verification failed') as excinfo:
-        cli.verify(signature_name, wrong_pub_key_path)
\ No newline at end of file
+        cli.verify(signature_name, wrong_pub_key_path)
+    result = verify_native(ctx, cli, wrong_pub_key_path)
+    assert 'signature verification failed' in result.errors.values()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+
+import blob_upload
+from local_registry import LocalRegistry
+from ocm_fixture import local_registry
+import tracing
+import util
+
+
+def test_registry_spans(local_registry: LocalRegistry):
+    tracer = tracing.tracer
+    first_span = len(tracer.spans)
+    client = local_registry.client()
+    image_ref = f'{local_registry.netloc}/test/traced:0.1.0'
+    data = os.urandom(100_000)
+    digest = local_registry.store_blob('test/traced', data)
+    client.blob(image_ref, digest, stream=False)
+    small = data[:1000]
+    small_digest = 'sha256:' + hashlib.sha256(small).hexdigest()
+    blob_upload.MonolithicUpload().upload(client, image_ref, small, small_digest, 1000, 'application/octet-stream')
+
+    spans = tracer.spans[first_span:]
+    assert all(s.category == 'http' for s in spans)
+    assert all(s.test and s.test.endswith('test_registry_spans') for s in spans)
+    get = next(s for s in spans if s.name.startswith('GET'))
+    assert get.exit_code == 200
+    assert get.bytes_received == len(data)
+    put = next(s for s in spans if s.name.startswith('PUT'))
+    assert put.exit_code == 201
+    assert put.bytes_sent == 1000
+
+    summary = tracer.summary_by_test()[spans[0].test]['http']
+    assert summary.count == len(spans)
+    assert summary.bytes_received >= len(data)
+
+
+def test_export():
+    tracer = tracing.Tracer()
+    with tracer.span('ocm', 'version') as span:
+        span.exit_code = 0
+    with tracer.span('http', 'GET http://127.0.0.1/v2/') as span:
+        span.exit_code = 200
+        span.bytes_received = 2
+
+    out_dir = util.get_gen_dir()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tracer.write_json(out_dir / 'test-trace.json')
+    tracer.write_chrome_trace(out_dir / 'test-trace.chrome.json')
+
+    with open(out_dir / 'test-trace.json') as f:
+        trace = json.load(f)
+    assert [s['category'] for s in trace['spans']] == ['ocm', 'http']
+    assert trace['tests']['<session>']['http']['bytes_received'] == 2
+    with open(out_dir / 'test-trace.chrome.json') as f:
+        events = json.load(f)['traceEvents']
+    assert [e['ph'] for e in events] == ['X', 'X']
+    assert events[1]['ts'] >= events[0]['ts'] + events[0]['dur']
+    (out_dir / 'test-trace.json').unlink()
+    (out_dir / 'test-trace.chrome.json').unlink()
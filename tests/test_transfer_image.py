@@ -1,6 +1,5 @@
 from pathlib import Path
 import pytest
-import subprocess
 
 import ocmcli as ocm
 import oci.auth as oa
@@ -8,21 +7,21 @@ import oci.model as om
 import oci.client as oc
 import gci.componentmodel as cm
 
+from image_validator import ImageValidator
 from ocm_fixture import ctx, ocm_config, OcmTestContext
 import upload_image
 from oci_image import OciImageCreator
+import util
 
 
 pytestmark = pytest.mark.usefixtures("ocm_config")
 
 
-def _validate_image(image_ref: str, ctx: OcmTestContext):
-    cmd_auth = ['crane', 'auth', 'login', ctx.repo_prefix, '-u', ctx.user_name, '-p', ctx.passwd]
-    subprocess.run(cmd_auth, check=True)
-    cmd = ['crane', 'validate', '--remote', f'{image_ref}']
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    assert result.returncode == 0
-    assert result.stdout.startswith('PASS: ')
+def _validate_image(client: oc.Client, image_ref: str, target_image_ref: str):
+    # digests and sizes of all manifests and blobs, about a quarter of the blobs is downloaded
+    result = ImageValidator(client, sample_rate=0.25).validate(image_ref, target_image_ref)
+    print(result.report())
+    assert result.ok, result.report()
 
 
 def do_image_transfer(client, image_ref, target_image_ref) -> om.OciImageManifest:
@@ -40,8 +39,8 @@ def do_image_transfer(client, image_ref, target_image_ref) -> om.OciImageManifes
 def test_image_transfer_docker_style(ctx: OcmTestContext):
     # create an image with docker mime types and store it in oci registry
     image_name = 'hello:0.1.0'
-    image_ref = f'{ctx.repo_dir}/images/{image_name}'
-    target_image_ref = f'{ctx.repo_dir}/image-test/{image_name}'
+    image_ref = f'{util.get_repo_url(ctx, "images")}/{image_name}'
+    target_image_ref = f'{util.get_repo_url(ctx, "image-test")}/{image_name}'
     client = upload_image.get_oci_client()
     upload_image.upload_image(client, image_ref, OciImageCreator.Style.DOCKER_STYLE)
     manifest = do_image_transfer(client, image_ref, target_image_ref)
@@ -52,14 +51,14 @@ def test_image_transfer_docker_style(ctx: OcmTestContext):
     for layer in manifest.layers:
         assert layer.mediaType == OciImageCreator.IMAGE_LAYER_MIME_TYPE_DOCKER
         assert layer.size > 0
-    _validate_image(target_image_ref, ctx)
+    _validate_image(client, image_ref, target_image_ref)
 
 
 def test_image_transfer_oci_style(ctx: OcmTestContext):
     # create an image with oci mime types and store it in oci registry
     image_name = 'hello:0.1.0'
-    image_ref = f'{ctx.repo_dir}/images/{image_name}'
-    target_image_ref = f'{ctx.repo_dir}/image-test/{image_name}'
+    image_ref = f'{util.get_repo_url(ctx, "images")}/{image_name}'
+    target_image_ref = f'{util.get_repo_url(ctx, "image-test")}/{image_name}'
     client = upload_image.get_oci_client()
     upload_image.upload_image(client, image_ref, OciImageCreator.Style.OCI_STYLE)
     manifest = do_image_transfer(client, image_ref, target_image_ref)
@@ -70,7 +69,7 @@ def test_image_transfer_oci_style(ctx: OcmTestContext):
     for layer in manifest.layers:
         assert layer.mediaType == OciImageCreator.IMAGE_LAYER_MIME_TYPE_OCI
         assert layer.size > 0
-    _validate_image(target_image_ref, ctx)
+    _validate_image(client, image_ref, target_image_ref)
 
 
 def _check_architectures_in_manifest(manifest):
@@ -83,25 +82,25 @@ def _check_architectures_in_manifest(manifest):
 
 def test_multi_arch_image_transfer_docker_style(ctx: OcmTestContext):
     image_name = 'hello-multi:0.1.0'
-    image_ref = f'{ctx.repo_dir}/images/{image_name}'
-    target_image_ref = f'{ctx.repo_dir}/image-test/{image_name}'
+    image_ref = f'{util.get_repo_url(ctx, "images")}/{image_name}'
+    target_image_ref = f'{util.get_repo_url(ctx, "image-test")}/{image_name}'
     client = upload_image.get_oci_client()
     upload_image.upload_multi_arch_image(client, image_ref, OciImageCreator.Style.DOCKER_STYLE)
     manifest = do_image_transfer(client, image_ref, target_image_ref)
     assert manifest.schemaVersion == 2
     assert manifest.mediaType == OciImageCreator.MULTI_ARCH_MANIFEST_MIME_TYPE_DOCKER
     _check_architectures_in_manifest(manifest)
-    _validate_image(target_image_ref, ctx)
+    _validate_image(client, image_ref, target_image_ref)
 
 
 def test_multi_arch_image_transfer_oci_style(ctx: OcmTestContext):
     image_name = 'hello-multi:0.1.0'
-    image_ref = f'{ctx.repo_dir}/images/{image_name}'
-    target_image_ref = f'{ctx.repo_dir}/image-test/{image_name}'
+    image_ref = f'{util.get_repo_url(ctx, "images")}/{image_name}'
+    target_image_ref = f'{util.get_repo_url(ctx, "image-test")}/{image_name}'
     client = upload_image.get_oci_client()
     upload_image.upload_multi_arch_image(client, image_ref, OciImageCreator.Style.OCI_STYLE)
     manifest = do_image_transfer(client, image_ref, target_image_ref)
     assert manifest.schemaVersion == 2
     assert manifest.mediaType == OciImageCreator.MULTI_ARCH_MANIFEST_MIME_TYPE_OCI
     _check_architectures_in_manifest(manifest)
-    _validate_image(target_image_ref, ctx)
+    _validate_image(client, image_ref, target_image_ref)
@@ -4,9 +4,11 @@ import gci.componentmodel as cm
 import pytest
 import oci.model as om
 
+from cd_tools import image_references
 from create_comp import TestData
 import ocmcli as ocm
 from ocm_fixture import ctx, ocm_config, OcmTestContext
+from transport_diff import TransportVerifier
 import util
 
 logger = logging.getLogger(__name__)
@@ -39,7 +41,7 @@ def create_parent_component(repo_url: str) -> ocm.OcmApplication:
 
 
 def do_transport_and_get_cd(ctx: OcmTestContext, target_repo_url: str, by_value: bool, recursive: bool):
-    repo_url = f'{ctx.repo_prefix}/src'
+    repo_url = util.get_repo_url(ctx, 'src')
     create_child_component(repo_url)
     oci = util.get_oci_client(ctx, repo_url)
     cd = oci.get_component_descriptor_from_registry(ref_comp_name, ref_comp_vers)
@@ -72,6 +74,14 @@ def do_transport_and_get_cd(ctx: OcmTestContext, target_repo_url: str, by_value:
     td.verify_chart_remote(chart, image_reference=chart_reference)
     image = cd.component.resources[1]
     td.verify_image_remote(image, image_reference=image_reference)
+
+    # additionally the whole graph, resources matched by identity: by value all images must be
+    # relocated to the target location with unchanged digests, by reference they must still
+    # point to the source
+    verifier = TransportVerifier(util.get_oci_client(ctx, repo_url), oci)
+    diff = verifier.diff(comp_name, comp_vers, by_value=by_value, recursive=recursive)
+    print(diff.report())
+    assert diff.ok, diff.report()
     return oci
 
 
@@ -124,3 +134,9 @@ def test_transport_with_reference(ctx: OcmTestContext):
     assert type(ref_image.access) == cm.OciAccess
     assert ref_image.access.type == cm.AccessType.OCI_REGISTRY
     assert ref_image.access.imageReference == new_location
+
+    # all images of the transferred graph have been copied to the target repository
+    components = oci.get_component_descriptors_from_registry(comp_name, comp_vers)
+    presence = oci.exists_many(image_references(components.values()))
+    assert presence
+    assert all(p.exists for p in presence.values()), presence
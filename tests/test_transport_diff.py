@@ -0,0 +1,161 @@
+import json
+import time
+
+import gci.componentmodel as cm
+import oci.model as om
+import pytest
+
+from cd_tools import ComponentVersion, OciFetcher, component_descriptor_dict
+from local_registry import LocalRegistry
+from ocm_fixture import local_registry
+import transport_diff
+from transport_diff import ResourceDiff, TransportVerifier
+
+COMPONENTS = 20
+RESOURCES = 100 # per component
+ROOT = ComponentVersion('ocm.integrationtest/root', '1.0.0')
+
+
+def _store_image(local_registry: LocalRegistry, image_reference: str, content: str) -> str:
+    repo, tag = image_reference.removeprefix(f'{local_registry.netloc}/').rsplit(':', 1)
+    manifest = {'schemaVersion': 2, 'mediaType': om.OCI_MANIFEST_SCHEMA_V2_MIME, 'annotations': {'content': content}}
+    return local_registry.store_manifest(repo, json.dumps(manifest).encode(), om.OCI_MANIFEST_SCHEMA_V2_MIME, tag)
+
+
+def _resource(name: str, version: str, image_reference: str, digest: str = None) -> dict:
+    resource = {
+        'name': name,
+        'version': version,
+        'type': 'ociImage',
+        'relation': 'external',
+        'access': {'type': 'ociArtifact', 'imageReference': image_reference},
+    }
+    if digest:
+        resource['digest'] = {
+            'hashAlgorithm': 'SHA-256',
+            'normalisationAlgorithm': transport_diff.OCI_ARTIFACT_DIGEST,
+            'value': digest.removeprefix('sha256:'),
+        }
+    return resource
+
+
+def _transported(
+    local_registry: LocalRegistry,
+    source_repo: str,
+    target_repo: str,
+    components: int = COMPONENTS,
+    resources: int = RESOURCES,
+) -> list[dict]:
+    """
+    a graph of components children with resources images each in the source repository and its
+    copy, relocated below target_repo, in the target repository. Returns the target descriptors,
+    to be modified and stored again.
+    """
+    source_cds, target_cds = [], []
+    for i in range(components):
+        source_resources, target_resources = [], []
+        for j in range(resources):
+            image = f'images/app{j % 10}:{i}.{j}'
+            source_ref, target_ref = f'{local_registry.netloc}/{image}', f'{target_repo}/{image}'
+            digest = _store_image(local_registry, source_ref, image)
+            _store_image(local_registry, target_ref, image)
+            # every other resource without recorded digest, the source artifact is requested
+            digest = digest if j % 2 else None
+            # all resources share the name: the version is part of the identity
+            source_resources.append(_resource('app', f'{i}.{j}', source_ref, digest))
+            target_resources.append(_resource('app', f'{i}.{j}', target_ref, digest))
+        name = f'ocm.integrationtest/child{i}'
+        source_cds.append(component_descriptor_dict(name, resources=source_resources))
+        target_cds.append(component_descriptor_dict(name, resources=target_resources))
+    children = [ComponentVersion(cd['component']['name'], '1.0.0') for cd in source_cds]
+    source_cds.append(component_descriptor_dict(ROOT.name, refs=children))
+    target_cds.append(component_descriptor_dict(ROOT.name, refs=children))
+    for cd in source_cds:
+        local_registry.store_component_descriptor(source_repo.removeprefix(f'{local_registry.netloc}/'), cd)
+    for cd in target_cds:
+        local_registry.store_component_descriptor(target_repo.removeprefix(f'{local_registry.netloc}/'), cd)
+    return target_cds
+
+
+def _verifier(local_registry: LocalRegistry, source_repo: str, target_repo: str) -> TransportVerifier:
+    return TransportVerifier(
+        OciFetcher(source_repo, client=local_registry.client()),
+        OciFetcher(target_repo, client=local_registry.client()),
+    )
+
+
+def test_complete_transport(local_registry: LocalRegistry):
+    source_repo, target_repo = f'{local_registry.netloc}/complete/src', f'{local_registry.netloc}/complete/target'
+    _transported(local_registry, source_repo, target_repo)
+
+    start = time.perf_counter()
+    diff = _verifier(local_registry, source_repo, target_repo).diff(ROOT.name, ROOT.version, by_value=True, recursive=True)
+    print(f'{diff.report()}\n{time.perf_counter() - start:.2f}s')
+    assert diff.ok, diff.report()
+    assert (diff.components, diff.resources, diff.artifacts) == (COMPONENTS + 1, COMPONENTS * RESOURCES, COMPONENTS * RESOURCES)
+
+    # by reference the target must still point to the source artifacts
+    diff = _verifier(local_registry, source_repo, target_repo).diff(ROOT.name, ROOT.version, by_value=False, recursive=True)
+    assert len(diff.diffs) == COMPONENTS * RESOURCES
+    assert {d.problem for d in diff.diffs} == {transport_diff.UNEXPECTEDLY_RELOCATED}
+
+
+def test_differences(local_registry: LocalRegistry):
+    source_repo, target_repo = f'{local_registry.netloc}/broken/src', f'{local_registry.netloc}/broken/target'
+    target_cds = _transported(local_registry, source_repo, target_repo, components=3, resources=10)
+    child0, child1 = target_cds[0]['component'], target_cds[1]['component']
+    # left in the source repository
+    child0['resources'][0]['access']['imageReference'] = f'{local_registry.netloc}/images/app0:0.0'
+    # copied, but modified
+    modified = _store_image(local_registry, child0['resources'][1]['access']['imageReference'], 'modified')
+    recorded = 'sha256:' + child0['resources'][1]['digest']['value']
+    # not copied at all
+    child0['resources'][2]['access']['imageReference'] = f'{target_repo}/images/missing:0.2'
+    del child1['resources'][5]
+    child1['resources'].append(_resource('extra', '1.0.0', f'{target_repo}/images/app0:0.0'))
+    for cd in target_cds[:2]:
+        local_registry.store_component_descriptor(target_repo.removeprefix(f'{local_registry.netloc}/'), cd)
+    # the descriptor of the last child was not transported
+    local_registry.repository(f'broken/target/component-descriptors/{target_cds[-2]["component"]["name"]}').tags.clear()
+
+    diff = _verifier(local_registry, source_repo, target_repo).diff(ROOT.name, ROOT.version, by_value=True, recursive=True)
+    print(diff.report())
+    assert diff.diffs == [
+        ResourceDiff('ocm.integrationtest/child0:1.0.0', 'app-0.0', transport_diff.NOT_RELOCATED,
+                     f'{local_registry.netloc}/images/app0:0.0', f'{local_registry.netloc}/images/app0:0.0'),
+        ResourceDiff('ocm.integrationtest/child1:1.0.0', 'extra', transport_diff.UNEXPECTED_RESOURCE),
+        ResourceDiff('ocm.integrationtest/child1:1.0.0', 'app-1.5', transport_diff.MISSING_RESOURCE),
+        ResourceDiff('ocm.integrationtest/child2:1.0.0', '', transport_diff.MISSING_COMPONENT),
+        ResourceDiff('ocm.integrationtest/child0:1.0.0', 'app-0.1', transport_diff.DIGEST_MISMATCH,
+                     f'{local_registry.netloc}/images/app1:0.1', f'{target_repo}/images/app1:0.1', f'{recorded} != {modified}'),
+        ResourceDiff('ocm.integrationtest/child0:1.0.0', 'app-0.2', transport_diff.TARGET_ARTIFACT_MISSING,
+                     f'{local_registry.netloc}/images/app2:0.2', f'{target_repo}/images/missing:0.2'),
+    ]
+
+
+def test_resource_identities():
+    resources = [_resource('app', version, f'images/app:{version}') for version in ('1.0', '2.0')]
+    resources += [{**_resource('app', version, f'images/app:{version}'), 'extraIdentity': {'arch': 'arm64'}}
+                  for version in ('1.0', '2.0')]
+    resources.append({**_resource('app', '1.0', 'images/app:1.0'), 'extraIdentity': {'arch': 'amd64'}})
+    cd = cm.ComponentDescriptor.from_dict(component_descriptor_dict('ocm.integrationtest/identities', resources=resources))
+    # the version is added where name and extra identity are repeated by a later resource
+    assert [str(i) for i in transport_diff.resource_identities(cd.component.resources)] == [
+        'app-1.0', 'app', 'arm64-app-1.0', 'arm64-app', 'amd64-app',
+    ]
+
+
+def test_unknown_digests(local_registry: LocalRegistry, monkeypatch):
+    source_repo, target_repo = f'{local_registry.netloc}/unknown/src', f'{local_registry.netloc}/unknown/target'
+    _transported(local_registry, source_repo, target_repo, components=2, resources=4)
+    verifier = _verifier(local_registry, source_repo, target_repo)
+    exists_many = verifier.target.exists_many
+
+    def without_digests(image_references: list[str], max_workers: int) -> dict:
+        # like registries not returning Docker-Content-Digest
+        return {ref: presence._replace(digest=None) for ref, presence in exists_many(image_references, max_workers).items()}
+
+    monkeypatch.setattr(verifier.target, 'exists_many', without_digests)
+    diff = verifier.diff(ROOT.name, ROOT.version, by_value=True, recursive=True)
+    assert diff.ok, diff.report()
+    assert diff.unknown_digests == diff.artifacts == 2 * 4
@@ -0,0 +1,153 @@
+# Timing spans for ocm calls and registry requests, exported as JSON and Chrome trace
+
+import contextlib
+from dataclasses import asdict, dataclass
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import requests
+
+
+@dataclass
+class Span:
+    category: str # 'ocm' or 'http'
+    name: str # ocm arguments or method and url
+    start: float # seconds since the tracer was created
+    seconds: float = 0
+    test: str | None = None
+    thread: int = 0
+    exit_code: int | None = None # ocm return code or http status
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+@dataclass
+class SpanSummary:
+    count: int = 0
+    seconds: float = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+class Tracer:
+    """
+    Collects spans of all threads. The test a span belongs to is set by the pytest plugin in
+    conftest.py, spans outside of tests (e.g. in session fixtures) have no test.
+    """
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.current_test: str | None = None
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, category: str, name: str):
+        span = Span(
+            category=category,
+            name=name,
+            start=time.perf_counter() - self._origin,
+            test=self.current_test,
+            thread=threading.get_ident(),
+        )
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - self._origin - span.start
+            with self._lock:
+                self.spans.append(span)
+
+    def extend(self, spans: list[Span]):
+        # e.g. spans of the pytest-xdist workers, merged on the controller
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def slowest(self, count: int = 10) -> list[Span]:
+        with self._lock:
+            return sorted(self.spans, key=lambda s: s.seconds, reverse=True)[:count]
+
+    def summary_by_test(self) -> dict[str, dict[str, SpanSummary]]:
+        """per test and category: number of spans, total duration and bytes"""
+        summaries = {}
+        with self._lock:
+            for span in self.spans:
+                per_test = summaries.setdefault(span.test or '<session>', {})
+                summary = per_test.setdefault(span.category, SpanSummary())
+                summary.count += 1
+                summary.seconds += span.seconds
+                summary.bytes_sent += span.bytes_sent
+                summary.bytes_received += span.bytes_received
+        return summaries
+
+    def write_json(self, path: str | Path):
+        with self._lock:
+            spans = [asdict(s) for s in self.spans]
+        summaries = {
+            test: {category: asdict(s) for category, s in per_test.items()}
+            for test, per_test in self.summary_by_test().items()
+        }
+        with open(path, 'w') as f:
+            json.dump({'spans': spans, 'tests': summaries}, f, indent=1)
+
+    def write_chrome_trace(self, path: str | Path):
+        """trace event format, can be opened with chrome://tracing or https://ui.perfetto.dev"""
+        with self._lock:
+            events = [
+                {
+                    'name': s.name,
+                    'cat': s.category,
+                    'ph': 'X', # complete event
+                    'ts': s.start * 1e6,
+                    'dur': s.seconds * 1e6,
+                    'pid': os.getpid(),
+                    'tid': s.thread,
+                    'args': {
+                        'test': s.test,
+                        'exit_code': s.exit_code,
+                        'bytes_sent': s.bytes_sent,
+                        'bytes_received': s.bytes_received,
+                    },
+                }
+                for s in self.spans
+            ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# shared by all ocm calls and registry clients of this process
+tracer = Tracer()
+
+
+def _content_length(headers) -> int:
+    try:
+        return int(headers.get('Content-Length') or 0)
+    except ValueError:
+        return 0
+
+
+class TracedSession(requests.Session):
+    """
+    requests.Session recording a span per request. For streamed responses the span ends when
+    the headers arrived, the bytes received are taken from Content-Length then.
+    """
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        with tracer.span('http', f'{request.method} {request.url}') as span:
+            if isinstance(request.body, (bytes, str)):
+                span.bytes_sent = len(request.body)
+            else:
+                span.bytes_sent = _content_length(request.headers)
+            response = super().send(request, **kwargs)
+            span.exit_code = response.status_code
+            if kwargs.get('stream'):
+                span.bytes_received = _content_length(response.headers)
+            else:
+                span.bytes_received = len(response.content)
+        return response
@@ -0,0 +1,229 @@
+# Comparison of a transported component graph with its source, without downloading artifacts
+
+import concurrent.futures
+from dataclasses import asdict, dataclass, field
+import json
+from typing import NamedTuple
+
+import gci.componentmodel as cm
+import oci.model as om
+
+from cd_tools import DEFAULT_MAX_WORKERS, ComponentVersion, OciFetcher, extra_identities
+
+MISSING_COMPONENT = 'component version missing in target'
+MISSING_RESOURCE = 'resource missing in target'
+UNEXPECTED_RESOURCE = 'resource not in source'
+ACCESS_CHANGED = 'access type changed'
+NOT_RELOCATED = 'artifact not relocated to target'
+UNEXPECTEDLY_RELOCATED = 'artifact relocated, but transported by reference'
+SOURCE_ARTIFACT_MISSING = 'artifact missing in source'
+TARGET_ARTIFACT_MISSING = 'artifact missing in target'
+DIGEST_MISMATCH = 'artifact digest differs'
+
+# normalisation of resource digests of oci artifacts: the manifest digest
+OCI_ARTIFACT_DIGEST = 'ociArtifactDigest/v1'
+
+
+@dataclass(frozen=True)
+class ResourceDiff:
+    component: str # name:version
+    resource: str # identity, e.g. image or image-1.10 for resources with the same name
+    problem: str
+    source: str | None = None # image reference (or access type)
+    target: str | None = None
+    detail: str | None = None
+
+
+@dataclass
+class TransportDiff:
+    source_repo: str
+    target_repo: str
+    by_value: bool
+    components: int = 0
+    resources: int = 0
+    artifacts: int = 0 # checked by manifest HEADs
+    unknown_digests: int = 0 # present, but the registry did not report a digest to compare
+    diffs: list[ResourceDiff] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.diffs
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+    def report(self) -> str:
+        lines = [
+            f'{self.source_repo} -> {self.target_repo} ({"by value" if self.by_value else "by reference"}): '
+            f'{self.components} component versions, {self.resources} resources, {self.artifacts} artifacts, '
+            f'{self.unknown_digests} digests unknown, {len(self.diffs)} differences'
+        ]
+        for diff in self.diffs:
+            line = f'{diff.component} {diff.resource}: {diff.problem}'
+            if diff.source or diff.target:
+                line += f' ({diff.source} -> {diff.target})'
+            if diff.detail:
+                line += f' {diff.detail}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def resource_identities(resources: list[cm.Resource]) -> dict[cm.ResourceIdentity, cm.Resource]:
+    """
+    resources by identity, the version is part of the identity of resources sharing name and
+    extra identity with a later resource (cd_tools.extra_identities, the rule of signing.normalise)
+    """
+    identities = extra_identities((r.name, r.extraIdentity, r.version) for r in resources)
+    return {
+        cm.ResourceIdentity(name=r.name, **extra_identity): r
+        for r, extra_identity in zip(resources, identities)
+    }
+
+
+class _Artifact(NamedTuple):
+    component: str
+    resource: str
+    source_ref: str
+    target_ref: str
+    digest: str | None # manifest digest recorded in the source descriptor
+
+
+def _recorded_digest(resource: cm.Resource) -> str | None:
+    digest = resource.digest
+    if not digest or digest.normalisationAlgorithm != OCI_ARTIFACT_DIGEST:
+        return None
+    if digest.hashAlgorithm.upper() not in ('SHA-256', 'SHA256'):
+        return None
+    return f'sha256:{digest.value}'
+
+
+def _fetch_graph(
+    fetcher: OciFetcher,
+    name: str,
+    version: str,
+    recursive: bool,
+    max_workers: int,
+) -> dict[ComponentVersion, cm.ComponentDescriptor]:
+    # component versions missing in the target are reported, not raised
+    if recursive:
+        return fetcher.get_component_descriptors_from_registry(name, version, max_workers, absent_ok=True)
+    try:
+        return {ComponentVersion(name, version): fetcher.get_component_descriptor_from_registry(name, version)}
+    except om.OciImageNotFoundException:
+        return {}
+
+
+class TransportVerifier:
+    """
+    Checks the result of 'ocm transfer componentversion': source and target graph are fetched
+    concurrently, resources are matched by identity. Artifacts of resources with oci access
+    copied by value must have been relocated below the target repository and have the same
+    manifest digest as in the source, by reference they must not have been relocated. Artifacts
+    are compared with manifest HEADs (fetcher.exists_many) only, nothing is downloaded. Source
+    artifacts with a digest recorded in their resource are not requested at all.
+    """
+
+    def __init__(self, source: OciFetcher, target: OciFetcher, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.source = source
+        self.target = target
+        self.max_workers = max_workers
+
+    def diff(self, name: str, version: str, by_value: bool, recursive: bool) -> TransportDiff:
+        result = TransportDiff(source_repo=self.source.repo_url, target_repo=self.target.repo_url, by_value=by_value)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            source_graph = executor.submit(_fetch_graph, self.source, name, version, recursive, self.max_workers)
+            target_graph = executor.submit(_fetch_graph, self.target, name, version, recursive, self.max_workers)
+            source_graph, target_graph = source_graph.result(), target_graph.result()
+
+        artifacts = []
+        for cv, source_cd in sorted(source_graph.items(), key=lambda item: (item[0].name, item[0].version)):
+            result.components += 1
+            component = f'{cv.name}:{cv.version}'
+            if not (target_cd := target_graph.get(cv)):
+                result.diffs.append(ResourceDiff(component, '', MISSING_COMPONENT))
+                continue
+            source_resources = resource_identities(source_cd.component.resources)
+            target_resources = resource_identities(target_cd.component.resources)
+            result.resources += len(source_resources)
+            for identity in sorted(target_resources.keys() - source_resources.keys()):
+                result.diffs.append(ResourceDiff(component, str(identity), UNEXPECTED_RESOURCE))
+            for identity, source_resource in sorted(source_resources.items()):
+                if not (target_resource := target_resources.get(identity)):
+                    result.diffs.append(ResourceDiff(component, str(identity), MISSING_RESOURCE))
+                elif diff := self._access_diff(component, str(identity), source_resource, target_resource, by_value):
+                    result.diffs.append(diff)
+                elif isinstance(source_resource.access, cm.OciAccess):
+                    artifacts.append(_Artifact(
+                        component=component,
+                        resource=str(identity),
+                        source_ref=source_resource.access.imageReference,
+                        target_ref=target_resource.access.imageReference,
+                        digest=_recorded_digest(source_resource),
+                    ))
+
+        result.artifacts = len(artifacts)
+        self._check_artifacts(artifacts, by_value, result)
+        return result
+
+    def _access_diff(
+        self,
+        component: str,
+        identity: str,
+        source_resource: cm.Resource,
+        target_resource: cm.Resource,
+        by_value: bool,
+    ) -> ResourceDiff | None:
+        source_type, target_type = source_resource.access.type, target_resource.access.type
+        if not isinstance(source_resource.access, cm.OciAccess):
+            # e.g. local blobs, remain local blobs of the target component version
+            if source_type != target_type:
+                return ResourceDiff(component, identity, ACCESS_CHANGED, str(source_type), str(target_type))
+            return None
+        if not isinstance(target_resource.access, cm.OciAccess):
+            return ResourceDiff(component, identity, ACCESS_CHANGED, str(source_type), str(target_type))
+
+        source_ref = source_resource.access.imageReference
+        target_ref = target_resource.access.imageReference
+        relocated = target_ref.startswith(self.target.repo_url.rstrip('/') + '/')
+        if by_value and not relocated:
+            return ResourceDiff(component, identity, NOT_RELOCATED, source_ref, target_ref)
+        if not by_value and target_ref != source_ref:
+            return ResourceDiff(component, identity, UNEXPECTEDLY_RELOCATED, source_ref, target_ref)
+        return None
+
+    def _check_artifacts(self, artifacts: list[_Artifact], by_value: bool, result: TransportDiff):
+        # HEADs of source and target artifacts in parallel, each grouped by repository. Digests
+        # recorded in the source descriptors spare the HEADs of the source artifacts. Registries
+        # need not return Docker-Content-Digest, such artifacts are only checked for presence.
+        source_refs = [a.source_ref for a in artifacts if not (by_value and a.digest)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            source_presence = executor.submit(self.source.exists_many, source_refs, self.max_workers)
+            target_presence = None
+            if by_value:
+                target_presence = executor.submit(
+                    self.target.exists_many, [a.target_ref for a in artifacts], self.max_workers,
+                )
+            source_presence = source_presence.result()
+            # by reference the target refers to the source artifacts
+            target_presence = target_presence.result() if target_presence else source_presence
+
+        for a in artifacts:
+            # no source presence: the digest was recorded
+            source = source_presence.get(a.source_ref)
+            target = target_presence[a.target_ref]
+            digest = a.digest or source.digest
+            if source and not source.exists:
+                result.diffs.append(ResourceDiff(a.component, a.resource, SOURCE_ARTIFACT_MISSING, a.source_ref, a.target_ref))
+            elif not target.exists:
+                result.diffs.append(ResourceDiff(a.component, a.resource, TARGET_ARTIFACT_MISSING, a.source_ref, a.target_ref))
+            elif not digest or not target.digest:
+                result.unknown_digests += 1
+            elif digest != target.digest:
+                result.diffs.append(ResourceDiff(
+                    a.component, a.resource, DIGEST_MISMATCH, a.source_ref, a.target_ref,
+                    detail=f'{digest} != {target.digest}',
+                ))
@@ -1,3 +1,4 @@
+import concurrent.futures
 import os
 from pathlib import Path
 import shutil
@@ -6,38 +7,48 @@ import oci.auth as oa
 import oci.client as oc
 import oci.model as om
 
+import client_pool
 import oci_image
 import util
 
+# layers of at least oci_image.PARALLEL_GZIP_MIN_BYTES are compressed by all cores
+COMPRESSION_WORKERS = os.cpu_count() or 1
+
 def create_upload_layers_and_config(
     image_handler: oci_image.OciImageCreator,
     architecture: str,
     work_dir: Path,
+    max_workers: int = oci_image.DEFAULT_MAX_WORKERS,
+    executor: concurrent.futures.Executor = None,
 ):
     module_dir = util.get_root_dir()
     bin_file_in = module_dir / 'local' / f'hello.{architecture}'
     bin_file_out = 'hello'
     version_file = 'VERSION'
-    # create first layer with hello folder and binary
+    # both layers contain a hello folder
     dest_dir = 'hello'
     util.prepare_or_clean_dir(work_dir)
     print(f'{work_dir}')
-    Path.mkdir(work_dir / dest_dir)
+
+    # first layer with hello folder and binary
+    bin_layer_dir = work_dir / 'bin' / dest_dir
+    bin_layer_dir.mkdir(parents=True)
     src_file = module_dir / bin_file_in
-    dest_file = work_dir / dest_dir / bin_file_out
+    dest_file = bin_layer_dir / bin_file_out
     shutil.copy(src_file, dest_file)
 
-    # create first layer:
-    image_handler.create_and_upload_layer_from_dir(work_dir / dest_dir)
-
-    # create second layer with version file
-    util.prepare_or_clean_dir(work_dir)
-    Path.mkdir(work_dir / dest_dir)
+    # second layer with version file
+    version_layer_dir = work_dir / 'version' / dest_dir
+    version_layer_dir.mkdir(parents=True)
     src_file = util.get_root_dir() / version_file
-    dest_file = work_dir / dest_dir / version_file
+    dest_file = version_layer_dir / version_file
     shutil.copy(src_file, dest_file)
 
-    image_handler.create_and_upload_layer_from_dir(work_dir / dest_dir)
+    image_handler.create_and_upload_layers_from_dirs(
+        [bin_layer_dir, version_layer_dir],
+        max_workers=max_workers,
+        executor=executor,
+    )
 
     # add config layer with hello folder and version file
     image_handler.create_and_upload_image_config(
@@ -47,14 +58,14 @@ def create_upload_layers_and_config(
     )
 
 def upload_image(client: oc.Client, image_ref: str, style: oci_image.OciImageCreator.Style):
-    root_dir = util.get_root_dir()
-    work_dir = root_dir / 'image'
+    work_dir = util.get_gen_dir() / 'image-work'
     out_dir = util.get_gen_dir() / 'image-out'
     image_handler = oci_image.OciImageCreator(
         client,
         image_ref,
         out_dir,
         style,
+        compression_workers=COMPRESSION_WORKERS,
     )
 
     create_upload_layers_and_config(image_handler, 'arm64', work_dir)
@@ -62,11 +73,24 @@ def upload_image(client: oc.Client, image_ref: str, style: oci_image.OciImageCre
     response, _ = image_handler.create_and_upload_manifest()
     shutil.rmtree(work_dir)
     print(f'response manifest upload: {response.status_code}')
+    print(image_handler.blob_presence.report())
 
 
-def upload_multi_arch_image(client: oc.Client, image_ref: str, style: oci_image.OciImageCreator.Style):
-    root_dir = util.get_root_dir()
-    work_dir = root_dir / 'image'
+def upload_multi_arch_image(
+    client: oc.Client,
+    image_ref: str,
+    style: oci_image.OciImageCreator.Style,
+    architectures: list[str] = ('arm64', 'amd64'),
+    max_workers: int = oci_image.DEFAULT_MAX_WORKERS,
+):
+    """
+    build and upload the image for all architectures concurrently: the layers and config of
+    every platform are uploaded first, then its child manifest (by digest). The multi-arch
+    manifest is uploaded when all child manifests are present. The layers of all platforms share
+    one executor, at most max_workers layers are built and uploaded at a time. Layers shared by
+    the platforms (VERSION) are uploaded once, see blob_upload.BlobPresence.
+    """
+    work_dir = util.get_gen_dir() / 'image-work'
     out_dir = util.get_gen_dir() / 'image-out'
     image_handler = oci_image.OciImageCreator(
         client,
@@ -74,21 +98,40 @@ def upload_multi_arch_image(client: oc.Client, image_ref: str, style: oci_image.
         out_dir,
         style,
     )
-
     os = 'linux'
-    architecture = 'arm64'
-    create_upload_layers_and_config(image_handler, architecture, work_dir)
-    platform = om.OciPlatform(architecture=architecture, os=os)
-    image_handler.upload_architecture(platform)
 
-    architecture = 'amd64'
-    create_upload_layers_and_config(image_handler, architecture, work_dir)
-    platform = om.OciPlatform(architecture=architecture, os=os)
-    image_handler.upload_architecture(platform)
+    def upload_platform(architecture: str, layer_executor: concurrent.futures.Executor) -> om.OciImageManifestListEntry:
+        platform_handler = oci_image.OciImageCreator(
+            client,
+            image_ref,
+            out_dir / architecture,
+            style,
+            compression_workers=COMPRESSION_WORKERS,
+            blob_presence=image_handler.blob_presence,
+        )
+        create_upload_layers_and_config(
+            platform_handler,
+            architecture,
+            work_dir / architecture,
+            executor=layer_executor,
+        )
+        platform = om.OciPlatform(architecture=architecture, os=os)
+        return platform_handler.upload_architecture(platform)
+
+    with (
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as layer_executor,
+        # the platform threads only wait for their layers, and upload config and manifest
+        concurrent.futures.ThreadPoolExecutor(max_workers=len(architectures)) as executor,
+    ):
+        # keep the order of the architectures in the multi-arch manifest
+        image_handler.multi_arch_entries = list(executor.map(
+            upload_platform, architectures, [layer_executor] * len(architectures),
+        ))
 
     response = image_handler.create_and_upload_multiarch_manifest()
     shutil.rmtree(work_dir)
     print(f'response manifest upload: {response.status_code}')
+    print(image_handler.blob_presence.report())
 
 
 def get_oci_client() -> oc.Client:
@@ -120,10 +163,14 @@ def get_oci_client() -> oc.Client:
         with open(gcr_key_file) as f:
             gcr_key = f.read()
 
-    # create and upload image:
-    return oc.Client(
-        credentials_lookup=_credentials_lookup,
-        routes=oc.OciRoutes(oc.base_api_url),
+    # shared client, connections and tokens are reused by all callers:
+    return client_pool.clients.client(
+        ('upload_image', user_name, passwd, gcr_key),
+        lambda session: oc.Client(
+            credentials_lookup=_credentials_lookup,
+            routes=oc.OciRoutes(oc.base_api_url),
+            session=session,
+        ),
     )
 
 def main():
@@ -1,10 +1,14 @@
+import os
 import random
 import shutil
 import string
 from pathlib import Path
 
-from cd_tools import OciFetcher
+from blob_cache import BlobCache
+from cd_tools import DescriptorMemo, ExistsCache, OciFetcher
+from key_pool import KeyPool
 from ocm_fixture import OcmTestContext
+from signing import DigestCache
 
 def prepare_or_clean_dir(dir: Path | str):
     dir = Path(dir)
@@ -14,9 +18,7 @@ def prepare_or_clean_dir(dir: Path | str):
 
 
 def print_ocm_config():
-    from pathlib import Path
-    import os
-    config_path = Path(os.getenv('HOME')) / '.ocmconfig'
+    config_path = get_ocm_home() / '.ocmconfig'
     if config_path.exists():
         with open(config_path) as f:
             cfg = f.read()
@@ -26,11 +28,61 @@ def print_ocm_config():
         print(f'OCM configuration file: {config_path} does not exist.')
 
 
+_blob_cache: BlobCache = None
+
+
+def get_blob_cache() -> BlobCache:
+    # shared by all OciFetchers, located in the gen directory to survive test runs
+    global _blob_cache
+    if not _blob_cache:
+        _blob_cache = BlobCache(get_shared_gen_dir() / 'blob-cache')
+    return _blob_cache
+
+
+_descriptor_memo = DescriptorMemo()
+
+
+def get_descriptor_memo() -> DescriptorMemo:
+    return _descriptor_memo
+
+
+_exists_cache = ExistsCache()
+
+
+def get_exists_cache() -> ExistsCache:
+    return _exists_cache
+
+
+_digest_cache: DigestCache = None
+
+
+def get_digest_cache() -> DigestCache:
+    # normalised descriptor digests, saved in the gen directory at the end of the session
+    global _digest_cache
+    if not _digest_cache:
+        _digest_cache = DigestCache(get_shared_gen_dir() / 'digest-cache.json')
+    return _digest_cache
+
+
+_key_pool: KeyPool = None
+
+
+def get_key_pool() -> KeyPool:
+    # generated once, shared by all test workers and test runs
+    global _key_pool
+    if not _key_pool:
+        _key_pool = KeyPool(get_shared_gen_dir() / 'key-pool')
+    return _key_pool
+
+
 def get_oci_client(ctx: OcmTestContext, repo_url: str):
     return OciFetcher(
         repo_url=repo_url,
         user_name=ctx.user_name,
         password=ctx.passwd,
+        cache=get_blob_cache(),
+        memo=get_descriptor_memo(),
+        exists_cache=get_exists_cache(),
     )
 
 
@@ -39,14 +91,35 @@ def get_root_dir() -> Path:
     return path.parent.parent.absolute()
 
 
-def get_gen_dir() -> Path:
+def get_worker_id() -> str | None:
+    # set by pytest-xdist in its worker processes (gw0, gw1, ...)
+    return os.getenv('PYTEST_XDIST_WORKER')
+
+
+def get_shared_gen_dir() -> Path:
+    # shared by all test workers, only for content that is safe for concurrent use
     return get_root_dir() / 'gen'
 
 
+def get_gen_dir() -> Path:
+    # private directory of the current test worker
+    if worker_id := get_worker_id():
+        return get_shared_gen_dir() / worker_id
+    return get_shared_gen_dir()
+
+
+def get_ocm_home() -> Path:
+    # HOME directory for ocm processes, holds the .ocmconfig of the current test worker
+    return get_gen_dir() / 'home'
+
+
 def randomword(length: int):
    letters = string.ascii_lowercase
    return ''.join(random.choice(letters) for i in range(length))
 
 
-def get_repo_url(ctx: OcmTestContext):
-    return f'{ctx.repo_prefix}/inttest'
+def get_repo_url(ctx: OcmTestContext, name: str = 'inttest'):
+    # every test worker uses its own repositories
+    if worker_id := get_worker_id():
+        return f'{ctx.repo_prefix}/{name}-{worker_id}'
+    return f'{ctx.repo_prefix}/{name}'